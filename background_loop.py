@@ -0,0 +1,120 @@
+"""
+Background Event Loop
+This module runs a single long-lived asyncio event loop in a daemon thread, so async
+resources (Telegram clients, HTTP sessions) can live across Flask requests.
+"""
+
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running forever in a daemon thread.
+
+    Flask request threads hand coroutines to the loop with submit(), which
+    returns a concurrent.futures.Future they can block on. The loop and its
+    thread are started lazily on first use, which also covers servers that
+    fork workers after importing the app.
+    """
+
+    def __init__(self, name='background-loop'):
+        """
+        Initialize the BackgroundLoop.
+
+        Args:
+            name: Name of the loop's thread
+        """
+        self.name = name
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.startup_callbacks = []
+
+    def on_start(self, callback):
+        """
+        Register a callback that is called with the loop when it starts.
+
+        Args:
+            callback: Function taking the event loop
+        """
+        self.startup_callbacks.append(callback)
+        if self.loop is not None:
+            callback(self.loop)
+
+    def start(self):
+        """Start the loop thread if it isn't running yet."""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self.thread.start()
+
+            for callback in self.startup_callbacks:
+                callback(self.loop)
+
+            logger.info(f"Started background event loop in thread {self.name}")
+
+    def run(self):
+        """Thread target: run the loop until it is stopped."""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, timeout=None):
+        """
+        Schedule a coroutine on the background loop.
+
+        Args:
+            coro: The coroutine to run
+            timeout: Optional number of seconds after which the coroutine is
+                cancelled and the future fails with TimeoutError
+
+        Returns:
+            concurrent.futures.Future: Future holding the coroutine's result
+        """
+        self.start()
+        if threading.current_thread() is self.thread:
+            # Waiting on the future from inside the loop would deadlock it
+            coro.close()
+            raise RuntimeError("submit() called from the background loop; await the coroutine instead")
+        if timeout is not None:
+            coro = asyncio.wait_for(coro, timeout=timeout)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def iterate(self, agen, timeout=None):
+        """
+        Consume an async generator on the background loop from a synchronous thread.
+
+        Args:
+            agen: The async generator
+            timeout: Optional number of seconds to wait for each item
+
+        Yields:
+            The async generator's items
+        """
+        try:
+            while True:
+                try:
+                    item = self.submit(agen.__anext__(), timeout=timeout).result()
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            # Runs the generator's cleanup (e.g. returning clients) when the consumer stops early
+            self.submit(agen.aclose()).result(timeout=10)
+
+    def stop(self):
+        """Stop the loop and wait for its thread to exit."""
+        with self.lock:
+            if self.loop is None or self.thread is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+            self.thread = None
+
+# Create a global instance of the background loop
+background_loop = BackgroundLoop()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark Forwarder
+This script runs the forwarder's real NewMessage handler offline, against a fake Telegram
+client and a mock SMS gateway, firing synthetic messages at a target rate and reporting
+handler throughput, latency percentiles and the Telegram requests made per message.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from benchmark_utils import set_offline_environment, percentile
+
+set_offline_environment()
+
+import config
+import sms_providers
+import start_forwarder
+from fake_telegram import FakeTelegramClient
+from mock_sms_gateway import MockSMSGateway
+from message_store import message_store
+from delivery_reports import delivery_reports
+from message_summarizer import MessageSummarizer
+from telegram_scheduler import TelegramScheduler
+
+# Keep the output readable
+logging.getLogger().setLevel(logging.WARNING)
+
+async def run_benchmark(args, temp_dir):
+    """Fire the synthetic messages through the handler and collect the results."""
+    scheduler = TelegramScheduler(os.path.join(temp_dir, 'flood_state.json')) if args.scheduler else None
+    client = FakeTelegramClient(chat_count=args.chats, muted_fraction=args.muted_fraction, rpc_latency=args.rpc_latency,
+                                flood_wait_rate=args.flood_wait_rate, flood_wait_seconds=args.flood_wait_seconds,
+                                scheduler=scheduler, seed=args.seed)
+    await client.connect()
+    me = await client.get_me()
+
+    gateway = MockSMSGateway(latency=args.sms_latency)
+    gateway.start()
+    os.environ.update({'SMSC_LOGIN': 'benchmark', 'SMSC_PASSWORD': 'benchmark', 'SMSC_API_URL': f"{gateway.url}/sys"})
+    sms_provider = sms_providers.SMSCProvider()
+
+    summarizer = None
+    if args.summarize:
+        summarizer = MessageSummarizer(delay_seconds=3600, max_messages=config.MAX_SUMMARY_MESSAGES,
+                                       max_summary_length=config.MAX_SMS_LENGTH)
+
+    client.add_event_handler(start_forwarder.create_message_handler(client, me, sms_provider, summarizer))
+    client.stats['rpcs'].clear()
+
+    started_at = time.perf_counter()
+    try:
+        latencies = await client.fire_messages(args.events, args.rate)
+    finally:
+        wall_time = time.perf_counter() - started_at
+        sms_provider.close()
+        gateway.stop()
+
+    return {
+        'wall_time': wall_time,
+        'latencies': [latency * 1000 for latency in latencies],
+        'rpcs': client.stats['rpcs'],
+        'flood_waits': client.stats['flood_waits'],
+        'sms_sent': gateway.stats['sent'],
+        'scheduler': scheduler.get_stats() if scheduler else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the forwarder message handler offline')
+    parser.add_argument('--events', type=int, default=500, help='Number of synthetic messages')
+    parser.add_argument('--rate', type=float, default=0, help='Messages per second (0 for as fast as possible)')
+    parser.add_argument('--chats', type=int, default=50, help='Number of synthetic chats')
+    parser.add_argument('--muted-fraction', type=float, default=0.2, help='Fraction of muted chats')
+    parser.add_argument('--rpc-latency', default='constant:0.005', help='Telegram RPC latency distribution')
+    parser.add_argument('--sms-latency', default='0', help='SMS gateway latency distribution')
+    parser.add_argument('--flood-wait-rate', type=float, default=0.0, help='Fraction of RPCs failing with a flood wait')
+    parser.add_argument('--flood-wait-seconds', type=int, default=1, help='Seconds of the injected flood waits')
+    parser.add_argument('--scheduler', action='store_true', help='Pace requests with the Telegram request scheduler')
+    parser.add_argument('--forward-all', action='store_true', help='Forward all chats, not only non-muted ones')
+    parser.add_argument('--summarize', action='store_true', help='Add messages to the summarizer instead of sending them')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    args = parser.parse_args()
+
+    config.FORWARD_ALL_CHATS = True
+    config.ONLY_NON_MUTED_CHATS = not args.forward_all
+    config.ENABLE_MESSAGE_SUMMARIZATION = args.summarize
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Keep the benchmark's writes out of forwarder.db
+        message_store.db_path = delivery_reports.db_path = os.path.join(temp_dir, 'benchmark.db')
+        message_store.init_db()
+
+        result = asyncio.run(run_benchmark(args, temp_dir))
+        message_store.flush()
+
+    latencies = result['latencies']
+    print(f"{args.events} messages in {args.chats} chats, rate {args.rate or 'unlimited'}/s, "
+          f"RPC latency {args.rpc_latency}, flood wait rate {args.flood_wait_rate}")
+    print(f"Wall time:      {result['wall_time']:.2f}s ({args.events / result['wall_time']:.0f} messages/s)")
+    print(f"Handler time:   p50 {percentile(latencies, 0.5):.1f} ms, p95 {percentile(latencies, 0.95):.1f} ms, "
+          f"p99 {percentile(latencies, 0.99):.1f} ms")
+    print(f"SMS sent:       {result['sms_sent']}")
+    rpcs = ', '.join(f"{name} {count} ({count / args.events:.2f}/message)" for name, count in sorted(result['rpcs'].items()))
+    print(f"Telegram RPCs:  {rpcs or 'none'}")
+    print(f"Flood waits:    {result['flood_waits']}")
+    if result['scheduler']:
+        print(f"Scheduler:      {result['scheduler']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Benchmark Hot Paths
+This script times the per-message hot paths of the forwarder - rate limiting, the
+summarizer, display names, the chat filter, SMS formatting, CSV export rows and summary
+refreshes - and compares them with the tracked baselines in benchmark_baselines.json,
+failing when one got slower than the regression threshold allows.
+
+Results are written as JSON (--json) in the same format as the baselines, so the runs of
+two commits can be compared with --baseline. Timings depend on the machine: refresh the
+baselines with --update-baselines when the benchmarks or the reference machine change.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+from benchmark_utils import set_offline_environment, load_history_csv
+
+set_offline_environment()
+
+import config
+import export_jobs
+import rate_limiter
+import summary_service
+import start_forwarder
+from fake_telegram import FakeTelegramClient
+from message_summarizer import MessageSummarizer
+
+# Keep the output readable, and the timings free of log formatting
+logging.getLogger().setLevel(logging.WARNING)
+
+# Benchmark settings
+BENCHMARK_BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baselines.json')
+BENCHMARK_REGRESSION_THRESHOLD = float(os.getenv('BENCHMARK_REGRESSION_THRESHOLD', '0.25'))  # Allowed slowdown
+BENCHMARK_MIN_TIME = 0.1  # Seconds each repeat runs for at least
+BENCHMARK_REPEATS = 7  # Repeats per benchmark; the median is reported
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """
+    Register a benchmark.
+
+    The decorated function gets the context and an iteration count, and
+    returns the seconds the iterations took, so setup stays out of the timing.
+    """
+    def decorator(function):
+        BENCHMARKS[name] = function
+        return function
+    return decorator
+
+def load_messages(csv_path, limit=500):
+    """Load message dictionaries, newest first, from the CSV export."""
+    messages = load_history_csv(csv_path, limit=limit)
+    for index, message in enumerate(messages):
+        message['id'] = index + 1
+        message['archived'] = index % 2 == 0
+    return messages
+
+def make_rate_limiter():
+    """Make a RateLimiter with the state of a busy hour that still lets messages through."""
+    # Don't load the state the previous run saved
+    if os.path.exists(rate_limiter.RATE_LIMITER_STATE_FILE):
+        os.remove(rate_limiter.RATE_LIMITER_STATE_FILE)
+    limiter = rate_limiter.RateLimiter(max_messages=1000, time_window=3600, max_per_chat=1000,
+                                       chat_window=3600, daily_limit=10 ** 9)
+    now = time.time()
+    for chat_id in range(50):
+        for offset in range(3):
+            limiter.message_times.append(now - offset)
+            limiter.chat_message_times[chat_id].append(now - offset)
+    return limiter
+
+@benchmark('rate_limiter.can_send_message')
+def bench_can_send_message(context, iterations):
+    limiter = make_rate_limiter()
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        limiter.can_send_message(i % 50)
+    return time.perf_counter() - started_at
+
+@benchmark('rate_limiter.record_message')
+def bench_record_message(context, iterations):
+    limiter = make_rate_limiter()
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        chat_id = i % 50
+        limiter.record_message(chat_id)
+        # Keep the state the same size
+        limiter.message_times.pop()
+        limiter.chat_message_times[chat_id].pop()
+    return time.perf_counter() - started_at
+
+@benchmark('rate_limiter.save_state')
+def bench_save_state(context, iterations):
+    limiter = make_rate_limiter()
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        limiter.save_state()
+    return time.perf_counter() - started_at
+
+@benchmark('message_summarizer.add_message')
+def bench_add_message(context, iterations):
+    summarizer = MessageSummarizer(delay_seconds=3600)
+    messages = context['messages']
+    try:
+        started_at = time.perf_counter()
+        for i in range(iterations):
+            message = messages[i % len(messages)]
+            summarizer.add_message(i % 50, message['message_text'], message['sender_name'])
+        return time.perf_counter() - started_at
+    finally:
+        for timer in summarizer.chat_timers.values():
+            timer.cancel()
+
+@benchmark('message_summarizer.summarize_messages')
+def bench_summarize_messages(context, iterations):
+    summarizer = MessageSummarizer(max_messages=config.MAX_SUMMARY_MESSAGES, max_summary_length=config.MAX_SMS_LENGTH)
+    windows = context['summarizer_windows']
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        summarizer.summarize_messages(windows[i % len(windows)])
+    return time.perf_counter() - started_at
+
+@benchmark('message_summarizer.filter_sensitive_content')
+def bench_filter_sensitive_content(context, iterations):
+    summarizer = MessageSummarizer()
+    texts = [message['message_text'] for message in context['messages']]
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        summarizer.filter_sensitive_content(texts[i % len(texts)])
+    return time.perf_counter() - started_at
+
+@benchmark('start_forwarder.get_display_name')
+def bench_get_display_name(context, iterations):
+    entities = [dialog.entity for dialog in context['client'].dialogs]
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        start_forwarder.get_display_name(entities[i % len(entities)])
+    return time.perf_counter() - started_at
+
+@benchmark('start_forwarder.is_monitored_chat')
+def bench_is_monitored_chat(context, iterations):
+    client = context['client']
+    chat_ids = [dialog.id for dialog in client.dialogs]
+
+    async def run():
+        started_at = time.perf_counter()
+        for i in range(iterations):
+            await start_forwarder.is_monitored_chat(client, chat_ids[i % len(chat_ids)])
+        return time.perf_counter() - started_at
+
+    return asyncio.run(run())
+
+@benchmark('start_forwarder.format_sms')
+def bench_format_sms(context, iterations):
+    messages = context['messages']
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        message = messages[i % len(messages)]
+        start_forwarder.format_sms(message['chat_name'], message['sender_name'], message['message_text'])
+    return time.perf_counter() - started_at
+
+@benchmark('export_jobs.csv_row')
+def bench_csv_row(context, iterations):
+    messages = context['messages']
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        export_jobs.csv_row(messages[i % len(messages)], include_archived=True)
+    return time.perf_counter() - started_at
+
+@benchmark('export_jobs.compress_rows')
+def bench_compress_rows(context, iterations):
+    rows = [export_jobs.csv_header(include_archived=True)]
+    rows.extend(export_jobs.csv_row(message, include_archived=True) for message in context['messages'][:200])
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        export_jobs.compress_rows(rows)
+    return time.perf_counter() - started_at
+
+@benchmark('summary_service.refresh_chat_summaries')
+def bench_refresh_chat_summaries(context, iterations):
+    # 10 chats of 10 messages, with new message IDs every round so nothing is served from a cache
+    chats = {}
+    for message in context['messages']:
+        chat = chats.setdefault(message['chat_name'], [])
+        if len(chat) < 10:
+            chat.append(message)
+    chats = [messages for messages in chats.values() if len(messages) > 1][:10]
+
+    async def run():
+        elapsed = 0.0
+        for _ in range(iterations):
+            context['refresh_rounds'] += 1
+            offset = context['refresh_rounds'] * 100000
+            chat_messages = {chat_id: [dict(message, id=message['id'] + offset) for message in messages]
+                             for chat_id, messages in enumerate(chats)}
+            started_at = time.perf_counter()
+            await summary_service.refresh_chat_summaries(1, chat_messages)
+            elapsed += time.perf_counter() - started_at
+        return elapsed
+
+    return asyncio.run(run())
+
+def run_benchmark(function, context, min_time, repeats):
+    """
+    Time a benchmark.
+
+    The iteration count is doubled until one run takes min_time, then the
+    benchmark is repeated and the median time per iteration is reported.
+
+    Returns:
+        dict: per_op_us (median), min_us, stdev_us, iterations and repeats
+    """
+    iterations = 1
+    while True:
+        elapsed = function(context, iterations)
+        if elapsed >= min_time or iterations >= 10 ** 7:
+            break
+        iterations = iterations * 2 if elapsed <= 0 else max(iterations * 2, int(iterations * min_time / elapsed * 1.2))
+
+    times = [function(context, iterations) / iterations * 1e6 for _ in range(repeats)]
+    return {
+        'per_op_us': statistics.median(times),
+        'min_us': min(times),
+        'stdev_us': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'iterations': iterations,
+        'repeats': repeats
+    }
+
+def get_commit():
+    """Get the current git commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_results(path):
+    """Load a results or baselines file; returns None if it doesn't exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline.
+
+    Returns:
+        dict: Benchmark name to (baseline per_op_us, relative change, status), where
+            status is 'regression', 'improvement', 'ok' or 'new'
+    """
+    comparison = {}
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            comparison[name] = (None, None, 'new')
+            continue
+        change = result['per_op_us'] / reference['per_op_us'] - 1
+        if change > threshold:
+            status = 'regression'
+        elif change < -threshold:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        comparison[name] = (reference['per_op_us'], change, status)
+    return comparison
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the forwarder hot paths against tracked baselines')
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--csv', default='telegram_messages.csv', help='Message history CSV file')
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINES_FILE, help='Baselines or results file to compare with')
+    parser.add_argument('--threshold', type=float, default=BENCHMARK_REGRESSION_THRESHOLD,
+                        help='Relative slowdown counted as a regression (0.25 is 25%%)')
+    parser.add_argument('--min-time', type=float, default=BENCHMARK_MIN_TIME, help='Seconds per repeat')
+    parser.add_argument('--repeats', type=int, default=BENCHMARK_REPEATS, help='Repeats per benchmark')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    parser.add_argument('--update-baselines', action='store_true', help='Write the results to the baselines file')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.filter or args.filter in name]
+    if not names:
+        parser.error(f"No benchmark matches {args.filter}")
+
+    messages = load_messages(args.csv)
+    client = FakeTelegramClient(chat_count=50, seed=1)
+    context = {
+        'messages': messages,
+        'summarizer_windows': [[{'text': m['message_text'], 'sender': m['sender_name'], 'timestamp': m['timestamp']}
+                                for m in messages[offset:offset + config.MAX_SUMMARY_MESSAGES]]
+                               for offset in range(0, len(messages), config.MAX_SUMMARY_MESSAGES)],
+        'client': client,
+        'refresh_rounds': 0
+    }
+
+    # The forwarder's default chat filter: non-muted chats, all of them
+    config.ONLY_NON_MUTED_CHATS = True
+    config.FORWARD_ALL_CHATS = True
+
+    baseline = load_results(args.baseline) if not args.update_baselines else None
+    baseline_results = (baseline or {}).get('results', {})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Keep the benchmarks' writes out of the working directory
+        rate_limiter.RATE_LIMITER_STATE_FILE = os.path.join(temp_dir, 'rate_limiter_state.json')
+        summary_service.DATABASE_PATH = os.path.join(temp_dir, 'benchmark.db')
+        summary_service.SUMMARY_ENGINE = 'extractive'
+        summary_service.init_summary_cache()
+
+        print(f"{'Benchmark':<46} {'Per op':>11} {'Baseline':>11} {'Change':>8}")
+        for name in names:
+            results[name] = run_benchmark(BENCHMARKS[name], context, args.min_time, args.repeats)
+            (baseline_us, change, status), = compare({name: results[name]}, baseline_results, args.threshold).values()
+            baseline_text = f"{baseline_us:>9.2f}us" if baseline_us is not None else f"{'-':>11}"
+            change_text = f"{change:>+7.0%}" if change is not None else f"{'-':>7}"
+            flag = {'regression': '  REGRESSION', 'improvement': '  faster'}.get(status, '')
+            print(f"{name:<46} {results[name]['per_op_us']:>9.2f}us {baseline_text} {change_text}{flag}")
+
+    report = {
+        'commit': get_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'threshold': args.threshold,
+        'results': results
+    }
+    comparison = compare(results, baseline_results, args.threshold)
+    regressions = [name for name, (_, _, status) in comparison.items() if status == 'regression']
+    if baseline:
+        report['baseline_commit'] = baseline.get('commit')
+        report['comparison'] = {name: {'baseline_us': baseline_us, 'change': change, 'status': status}
+                                for name, (baseline_us, change, status) in comparison.items()}
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baselines:
+        # Keep the baselines of the benchmarks that weren't run
+        existing = load_results(args.baseline) or {}
+        report['results'] = dict(existing.get('results', {}), **results)
+        report.pop('threshold')
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"\nBaselines written to {args.baseline}")
+    elif baseline is None:
+        print(f"\nNo baselines found at {args.baseline}; run with --update-baselines to create them")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%} against {baseline.get('commit') or args.baseline}: "
+              f"{', '.join(regressions)}")
+        return 1
+    else:
+        print(f"\nNo regressions over {args.threshold:.0%} against {baseline.get('commit') or args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark SMS Send
+This script load-tests the SMS send path against mock_sms_gateway.py, reporting throughput
+and latency percentiles for a single provider, routing failover, hedged sends and batched
+delivery status polling, without sending real SMS.
+"""
+
+import os
+import time
+import logging
+import argparse
+import tempfile
+import concurrent.futures
+
+import sms_providers
+from benchmark_utils import percentile
+from delivery_reports import DeliveryReports
+from mock_sms_gateway import MockSMSGateway
+
+# Keep the output readable
+logging.getLogger().setLevel(logging.WARNING)
+
+SCENARIOS = ('single', 'failover', 'hedge', 'status')
+
+def configure_providers(smsc_gateway, smsprosto_gateway):
+    """Point the providers' settings at the mock gateways."""
+    os.environ.update({
+        'SMSC_LOGIN': 'benchmark',
+        'SMSC_PASSWORD': 'benchmark',
+        'SMSC_API_URL': f"{smsc_gateway.url}/sys",
+        'SMSPROSTO_API_KEY': 'benchmark',
+        'SMSPROSTO_API_URL': smsprosto_gateway.url
+    })
+
+def run_sends(provider, count, concurrency):
+    """
+    Send count messages with concurrency threads.
+
+    Returns:
+        dict: sent, failed, wall_time, throughput and latency percentiles in milliseconds
+    """
+    def send(i):
+        started_at = time.perf_counter()
+        result = provider.send_sms(f"Benchmark message {i}", '+79000000000')
+        return result, time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(count)))
+    wall_time = time.perf_counter() - started_at
+
+    latencies = [latency * 1000 for _, latency in results]
+    sent = sum(1 for result, _ in results if result)
+    return {
+        'sent': sent,
+        'failed': count - sent,
+        'wall_time': wall_time,
+        'throughput': count / wall_time if wall_time else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99)
+    }
+
+def run_status(provider, count):
+    """
+    Send count messages, then collect their delivery reports.
+
+    Returns:
+        dict: final (messages with a final state), polls and wall_time of the polls
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        reports = DeliveryReports(os.path.join(temp_dir, 'benchmark.db'), min_interval=0)
+        for i in range(count):
+            result = provider.send_sms(f"Benchmark message {i}", '+79000000000')
+            reports.record(provider, result, '+79000000000', chat_id=i % 10, chat_name=f"Chat {i % 10}")
+
+        started_at = time.perf_counter()
+        final = polls = 0
+        while True:
+            polled = reports.poll(lambda name: provider)
+            if not polled:
+                break
+            final += polled
+            polls += 1
+        return {'final': final, 'polls': polls, 'wall_time': time.perf_counter() - started_at}
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the SMS send path against a mock gateway')
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all', help='Scenario to run')
+    parser.add_argument('--count', type=int, default=2000, help='Messages per scenario')
+    parser.add_argument('--concurrency', type=int, default=10, help='Concurrent senders')
+    parser.add_argument('--latency', default='lognormal:0.005:0.5', help='Gateway latency distribution')
+    parser.add_argument('--error-rate', type=float, default=0.3, help='API error rate of the failing provider (failover)')
+    parser.add_argument('--slow-latency', default='constant:0.2', help='Latency of the slow provider (hedge)')
+    parser.add_argument('--hedge-delay', type=float, default=0.05, help='Hedge delay of the routing provider (hedge)')
+    args = parser.parse_args()
+
+    sms_providers.SMS_HTTP_BACKOFF = 0  # Don't let retry backoff dominate the timings
+
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+    print(f"{args.count} messages per scenario, {args.concurrency} concurrent senders, latency {args.latency}\n")
+    print(f"{'Scenario':<10} {'Sent':>6} {'Failed':>7} {'Msg/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+    for scenario in scenarios:
+        smsc_gateway = MockSMSGateway(
+            latency=args.slow_latency if scenario == 'hedge' else args.latency,
+            error_rate=args.error_rate if scenario == 'failover' else 0.0
+        )
+        smsprosto_gateway = MockSMSGateway(latency=args.latency)
+        smsc_gateway.start()
+        smsprosto_gateway.start()
+        configure_providers(smsc_gateway, smsprosto_gateway)
+
+        try:
+            smsc = sms_providers.SMSCProvider()
+            if scenario in ('single', 'status'):
+                provider = smsc
+            else:
+                provider = sms_providers.RoutingProvider(
+                    {'smsc': smsc, 'smsprosto': sms_providers.SMSProstoProvider()},
+                    hedge_delay=args.hedge_delay if scenario == 'hedge' else sms_providers.SMS_HEDGE_DELAY
+                )
+
+            if scenario == 'status':
+                result = run_status(provider, args.count)
+                print(f"{scenario:<10} {result['final']:>6} {args.count - result['final']:>7} "
+                      f"{args.count / result['wall_time']:>8.0f} "
+                      f"({result['polls']} polls, {smsc_gateway.stats['status_requests']} status requests)")
+            else:
+                result = run_sends(provider, args.count, args.concurrency)
+                print(f"{scenario:<10} {result['sent']:>6} {result['failed']:>7} {result['throughput']:>8.0f} "
+                      f"{result['p50']:>8.1f} {result['p95']:>8.1f} {result['p99']:>8.1f}")
+                if scenario != 'single':
+                    print(f"{'':<10} smsc sent {smsc_gateway.stats['sent']}, errors {smsc_gateway.stats['errors']}; "
+                          f"smsprosto sent {smsprosto_gateway.stats['sent']}")
+            provider.close()
+        finally:
+            smsc_gateway.stop()
+            smsprosto_gateway.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark Summarizers
+This script compares the truncating SMS summarizer with the local extractive engine on
+50-message windows from telegram_messages.csv, reporting latency and two quality proxies:
+coverage of each window's top TF-IDF keywords and ROUGE-1 recall against the full window.
+"""
+
+import time
+import argparse
+import logging
+from collections import Counter
+
+import numpy as np
+
+from benchmark_utils import load_history_csv, group_by_chat
+from extractive_summarizer import ExtractiveSummarizer
+from message_summarizer import MessageSummarizer
+
+# Keep the output readable
+logging.getLogger().setLevel(logging.WARNING)
+
+def load_windows(csv_path, window_size, max_windows):
+    """Load consecutive message windows, oldest message first, from the CSV export."""
+    windows = []
+    for messages in group_by_chat(load_history_csv(csv_path, skip_empty=True)).values():
+        # The summarizers take the messages in the shape the forwarder buffers them
+        messages = sorted(({'sender': m['sender_name'], 'text': m['message_text'], 'timestamp': m['timestamp']}
+                           for m in messages), key=lambda m: m['timestamp'])
+        for offset in range(0, len(messages) - window_size + 1, window_size):
+            windows.append(messages[offset:offset + window_size])
+    return windows[:max_windows]
+
+def top_keywords(windows, k):
+    """Get the k highest TF-IDF words of each window, treating windows as documents."""
+    counts = [Counter(word for m in window for word in ExtractiveSummarizer.tokenize(m['text'])) for window in windows]
+    df = Counter(word for counter in counts for word in counter)
+    keywords = []
+    for counter in counts:
+        scores = {word: tf * np.log((1 + len(windows)) / (1 + df[word])) for word, tf in counter.items()}
+        keywords.append(set(sorted(scores, key=scores.get, reverse=True)[:k]))
+    return keywords
+
+def rouge1_recall(summary, window):
+    """Share of the window's content-word occurrences that also appear in the summary."""
+    reference = Counter(word for m in window for word in ExtractiveSummarizer.tokenize(m['text']))
+    candidate = Counter(ExtractiveSummarizer.tokenize(summary))
+    total = sum(reference.values())
+    if not total:
+        return 0.0
+    return sum(min(count, candidate[word]) for word, count in reference.items()) / total
+
+def run_engine(summarizer, windows, keywords, runs):
+    """Summarize every window and collect latency and quality numbers."""
+    latencies, coverage, recall, lengths = [], [], [], []
+    for window, window_keywords in zip(windows, keywords):
+        summary = summarizer.summarize_messages(window)
+        for _ in range(runs):
+            started_at = time.perf_counter()
+            summarizer.summarize_messages(window)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+
+        summary_words = set(ExtractiveSummarizer.tokenize(summary))
+        coverage.append(len(window_keywords & summary_words) / len(window_keywords) if window_keywords else 0.0)
+        recall.append(rouge1_recall(summary, window))
+        lengths.append(len(summary))
+
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'max_ms': float(np.max(latencies)),
+        'keyword_coverage': float(np.mean(coverage)),
+        'rouge1_recall': float(np.mean(recall)),
+        'avg_length': float(np.mean(lengths))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the truncating and extractive summarizers')
+    parser.add_argument('--csv', default='telegram_messages.csv', help='Message history CSV file')
+    parser.add_argument('--window', type=int, default=50, help='Messages per summarized window')
+    parser.add_argument('--windows', type=int, default=50, help='Maximum number of windows')
+    parser.add_argument('--runs', type=int, default=10, help='Timed runs per window')
+    parser.add_argument('--keywords', type=int, default=10, help='Top TF-IDF keywords per window')
+    parser.add_argument('--length', type=int, default=160, help='Summary length budget in characters')
+    args = parser.parse_args()
+
+    windows = load_windows(args.csv, args.window, args.windows)
+    if not windows:
+        print(f"No chats with at least {args.window} messages in {args.csv}")
+        return
+    keywords = top_keywords(windows, args.keywords)
+
+    # Both engines get the whole window, so they are judged on the same input
+    results = {}
+    for engine in ('truncate', 'extractive'):
+        summarizer = MessageSummarizer(max_messages=args.window, max_summary_length=args.length)
+        summarizer.engine = engine
+        results[engine] = run_engine(summarizer, windows, keywords, args.runs)
+
+    print(f"Summarized {len(windows)} windows of {args.window} messages, {args.length} characters per summary")
+    print(f"\n{'Engine':<11} {'p50':>8} {'p95':>8} {'max':>8} {'Keywords':>9} {'ROUGE-1':>8} {'Length':>7}")
+    for engine, r in results.items():
+        print(f"{engine:<11} {r['p50_ms']:>6.2f}ms {r['p95_ms']:>6.2f}ms {r['max_ms']:>6.2f}ms "
+              f"{r['keyword_coverage']:>8.1%} {r['rouge1_recall']:>8.1%} {r['avg_length']:>7.0f}")
+
+if __name__ == "__main__":
+    main()
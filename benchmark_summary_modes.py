@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark Summary Modes
+This script compares per-chat and batched AI summarization on real message history
+from telegram_messages.csv, reporting the number of API requests and the wall time.
+"""
+
+import os
+import asyncio
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+import summary_service
+from benchmark_utils import load_history_csv, group_by_chat
+
+# Keep the output readable
+logging.getLogger().setLevel(logging.WARNING)
+
+def load_chat_jobs(csv_path, chat_count, messages_per_chat=5):
+    """Load the most recent messages of the most recently active chats from the CSV export."""
+    chats = group_by_chat(load_history_csv(csv_path, skip_empty=True))
+
+    # Only chats with several messages are summarized by the summary page
+    active_chats = [(name, messages) for name, messages in chats.items() if len(messages) > 1]
+    active_chats.sort(key=lambda item: max(m['timestamp'] for m in item[1]), reverse=True)
+
+    jobs = {}
+    for chat_name, messages in active_chats[:chat_count]:
+        messages.sort(key=lambda m: m['timestamp'], reverse=True)
+        jobs[chat_name] = messages[:messages_per_chat]
+    return jobs
+
+async def run_benchmark(jobs, runs, deadline):
+    """Run both summary modes over the same jobs and collect their stats."""
+    results = {}
+    for mode in ('per_chat', 'batch'):
+        results[mode] = []
+        for _ in range(runs):
+            summaries, stats = await summary_service.summarize_chats(jobs, mode=mode, deadline=deadline)
+            stats['summarized'] = sum(1 for summary in summaries.values() if summary)
+            results[mode].append(stats)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-chat and batched AI summarization')
+    parser.add_argument('--csv', default='telegram_messages.csv', help='Message history CSV file')
+    parser.add_argument('--chats', type=int, default=10, help='Number of chats to summarize')
+    parser.add_argument('--runs', type=int, default=3, help='Runs per mode')
+    parser.add_argument('--deadline', type=float, default=60, help='Deadline per run in seconds')
+    parser.add_argument('--api-url', help='Override the Anthropic API URL (e.g. a local mock)')
+    args = parser.parse_args()
+
+    if not os.getenv('ANTHROPIC_API_KEY'):
+        print("ANTHROPIC_API_KEY is not set")
+        return
+
+    if args.api_url:
+        summary_service.ANTHROPIC_API_URL = args.api_url
+
+    jobs = load_chat_jobs(args.csv, args.chats)
+    print(f"Summarizing {len(jobs)} chats, {args.runs} runs per mode (batch size {summary_service.SUMMARY_BATCH_SIZE})")
+
+    results = asyncio.run(run_benchmark(jobs, args.runs, args.deadline))
+
+    print(f"\n{'Mode':<10} {'Requests':>9} {'Wall time':>10} {'Summarized':>11}")
+    for mode, runs in results.items():
+        avg_requests = sum(r['requests'] for r in runs) / len(runs)
+        avg_time = sum(r['wall_time'] for r in runs) / len(runs)
+        avg_summarized = sum(r['summarized'] for r in runs) / len(runs)
+        print(f"{mode:<10} {avg_requests:>9.1f} {avg_time:>9.2f}s {avg_summarized:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark Utilities
+Helpers shared by the offline benchmark and replay scripts: the placeholder Telegram
+settings start_forwarder requires, the message history CSV loader and percentiles.
+"""
+
+import os
+import csv
+from datetime import datetime
+
+def set_offline_environment(name='benchmark'):
+    """
+    Set placeholders for the Telegram settings start_forwarder requires.
+
+    The fake client and the mock gateway don't use them; settings that are
+    already set are kept. Call this before importing start_forwarder.
+
+    Args:
+        name: Placeholder API hash, naming the script in its logs
+    """
+    os.environ.setdefault('TELEGRAM_API_ID', '1')
+    os.environ.setdefault('TELEGRAM_API_HASH', name)
+    os.environ.setdefault('YOUR_PHONE_NUMBER', '+79000000000')
+
+def parse_timestamp(value):
+    """Parse a history timestamp: Unix time or an ISO date string."""
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+def load_history_csv(csv_path, limit=None, skip_empty=False):
+    """
+    Load messages from a CSV export with Timestamp, Chat, Sender and Message columns.
+
+    Args:
+        csv_path: Path to the CSV export
+        limit: Maximum number of rows to load, or None for all of them
+        skip_empty: Whether to skip rows without message text
+
+    Returns:
+        list: Message dictionaries shaped like telegram_messages rows (timestamp as
+              Unix time, chat_name, sender_name, message_text), in file order
+    """
+    messages = []
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            if limit is not None and index >= limit:
+                break
+            if skip_empty and not row.get('Message'):
+                continue
+            messages.append({
+                'timestamp': parse_timestamp(row['Timestamp']),
+                'chat_name': row['Chat'] or 'Unknown Chat',
+                'sender_name': row['Sender'] or 'Unknown',
+                'message_text': row['Message'] or ''
+            })
+    return messages
+
+def group_by_chat(messages):
+    """Group messages by chat name, keeping their order within each chat."""
+    chats = {}
+    for message in messages:
+        chats.setdefault(message['chat_name'], []).append(message)
+    return chats
+
+def percentile(values, fraction):
+    """Get a percentile of a list of values (nearest rank)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
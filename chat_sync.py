@@ -0,0 +1,162 @@
+"""
+Chat Sync
+This module keeps the local message store in step with Telegram using a sync cursor per
+chat, so repeated reads of a chat's recent messages only download what is new since the
+last read.
+"""
+
+import logging
+from telethon.tl.types import User, Chat, Channel
+from message_store import message_store
+
+logger = logging.getLogger(__name__)
+
+def get_display_name(entity):
+    """Get a display name for a user, chat, or channel."""
+    if isinstance(entity, User):
+        if entity.first_name and entity.last_name:
+            return f"{entity.first_name} {entity.last_name}"
+        elif entity.first_name:
+            return entity.first_name
+        elif entity.username:
+            return entity.username
+        else:
+            return f"User {entity.id}"
+    elif isinstance(entity, (Chat, Channel)):
+        if entity.title:
+            return entity.title
+        elif getattr(entity, 'username', None):
+            return entity.username
+        else:
+            return f"Chat {entity.id}"
+    else:
+        return "Unknown"
+
+def get_media_type(message):
+    """Get the type of media in a message."""
+    if message.photo:
+        return "Photo"
+    elif message.video:
+        return "Video"
+    elif message.audio:
+        return "Audio"
+    elif message.voice:
+        return "Voice"
+    elif message.document:
+        return "Document"
+    elif message.sticker:
+        return "Sticker"
+    elif message.gif:
+        return "GIF"
+    else:
+        return "Media"
+
+async def telegram_messages_to_rows(chat, messages):
+    """Convert a chat's Telethon messages with text or media to message store rows."""
+    rows = []
+    for message in messages:
+        if not (message.message or message.media):  # Include messages with text or media
+            continue
+
+        try:
+            sender = await message.get_sender()
+            rows.append({
+                'message_id': message.id,
+                'chat_id': chat.id,
+                'sender_id': sender.id if sender else None,
+                'sender_name': get_display_name(sender) if sender else "Unknown",
+                'message_text': message.message or "",
+                'media_type': get_media_type(message) if message.media else None,
+                'timestamp': int(message.date.timestamp()),
+                'is_outgoing': 1 if message.out else 0
+            })
+        except Exception as e:
+            logger.error(f"Error processing message: {e}", exc_info=True)
+            continue
+    return rows
+
+async def save_telegram_messages(user_id, chat, messages):
+    """Write a chat's Telethon messages to the message store."""
+    rows = await telegram_messages_to_rows(chat, messages)
+    chat_name = get_display_name(chat)
+    message_store.save_messages([
+        (user_id, row['chat_id'], row['message_id'], chat_name, row['sender_id'], row['sender_name'],
+         row['message_text'], row['media_type'], row['timestamp'], row['is_outgoing'])
+        for row in rows
+    ])
+
+async def sync_chat(fetcher, user_id, chat, limit):
+    """
+    Bring a chat's most recent messages into the message store and read them from there.
+
+    The chat's sync cursor says which message ID range the store already holds
+    completely. Only messages newer than that range are requested (min_id), and
+    older ones only if the range holds fewer than `limit` messages; both are
+    merged into the store and the cursor is moved to cover them.
+
+    Args:
+        fetcher: HistoryFetcher of the client to use
+        user_id: The user's Telegram ID
+        chat: The chat entity
+        limit: Number of most recent messages needed
+
+    Returns:
+        list: Message store rows (dictionaries) of the chat, newest first
+    """
+    cursor = message_store.get_sync_cursor(user_id, chat.id)
+
+    if cursor:
+        # Only what is new since the last sync
+        delta = await fetcher.fetch_chat(chat, limit, min_id=cursor['max_message_id'])
+        if len(delta) < limit:
+            min_id = cursor['min_message_id']
+            max_id = delta[0].id if delta else cursor['max_message_id']
+            synced_count = cursor['synced_count'] + len(delta)
+        else:
+            # More new messages than needed; the older range no longer joins up
+            min_id, max_id, synced_count = delta[-1].id, delta[0].id, len(delta)
+    else:
+        delta = await fetcher.fetch_chat(chat, limit)
+        min_id = delta[-1].id if len(delta) == limit else 0
+        max_id = delta[0].id if delta else 0
+        synced_count = len(delta)
+
+    await save_telegram_messages(user_id, chat, delta)
+
+    if synced_count < limit and min_id > 0:
+        # The synced range is shorter than needed (e.g. a larger limit than before)
+        older = await fetcher.fetch_chat(chat, limit - synced_count, offset_id=min_id)
+        await save_telegram_messages(user_id, chat, older)
+        min_id = older[-1].id if len(older) == limit - synced_count else 0
+        synced_count += len(older)
+
+    # A flood wait cut a fetch short, so the range may have holes
+    if chat.id not in fetcher.incomplete:
+        message_store.save_sync_cursor(user_id, chat.id, min_id, max_id, synced_count)
+
+    logger.debug(f"Synced chat {chat.id}: {len(delta)} new messages, cursor {min_id}-{max_id}")
+    return message_store.get_chat_messages_in_range(user_id, chat.id, min_id, max_id, limit)
+
+async def iter_synced_chats(fetcher, user_id, chats, limit):
+    """
+    Sync several chats concurrently, yielding each as soon as it is done.
+
+    Args:
+        fetcher: HistoryFetcher of the client to use
+        user_id: The user's Telegram ID
+        chats: Chat entities
+        limit: Number of most recent messages needed per chat
+
+    Yields:
+        Tuples of (chat index, list of message store rows, newest first)
+    """
+    async def sync(chat):
+        return await sync_chat(fetcher, user_id, chat, limit)
+
+    results = fetcher.iter_each(chats, sync)
+    try:
+        async for index, rows in results:
+            yield index, rows or []
+    finally:
+        # Cancel the remaining syncs when the consumer stops early
+        await results.aclose()
@@ -0,0 +1,392 @@
+"""
+Delivery Reports
+This module records every SMS the forwarder sends with the provider's message ID and
+collects delivery reports for them in the background, polling the provider's status
+API in batches, so delivery latency, failure rates and cost can be reported per chat
+and per provider.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from sms_providers import PROVIDER_CLASSES
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DATABASE_PATH = 'forwarder.db'
+
+# Seconds between status checks of a message just after it was sent; the interval
+# grows with the message's age up to DELIVERY_POLL_MAX_INTERVAL
+DELIVERY_POLL_MIN_INTERVAL = int(os.getenv('DELIVERY_POLL_MIN_INTERVAL', '15'))
+DELIVERY_POLL_MAX_INTERVAL = int(os.getenv('DELIVERY_POLL_MAX_INTERVAL', '600'))
+
+# Seconds after sending at which a message without a final status is given up on
+DELIVERY_REPORT_MAX_AGE = int(os.getenv('DELIVERY_REPORT_MAX_AGE', '86400'))
+
+# Maximum number of messages checked per poll
+DELIVERY_POLL_LIMIT = 500
+
+class DeliveryReports:
+    """
+    Delivery state of sent SMS messages, stored in the sms_deliveries table.
+
+    record() stores a send as pending. A daemon thread picks the pending
+    messages that are due, asks each provider for all of them at once (the
+    provider splits them into batch requests) and writes the results back
+    with one executemany. A message is checked again after half its age,
+    bounded by the minimum and maximum poll interval, so fresh messages are
+    checked often and old ones rarely, and messages sent close together are
+    checked in the same batch. The thread sleeps until the next message is
+    due. Messages are claimed in a write transaction before polling, so the
+    web app and the forwarder process can both run the thread without
+    checking a message twice.
+    """
+
+    def __init__(self, db_path=DATABASE_PATH, min_interval=DELIVERY_POLL_MIN_INTERVAL,
+                 max_interval=DELIVERY_POLL_MAX_INTERVAL, max_age=DELIVERY_REPORT_MAX_AGE):
+        """
+        Initialize the DeliveryReports.
+
+        Args:
+            db_path: Path of the SQLite database
+            min_interval: Seconds between the first status checks of a message
+            max_interval: Maximum seconds between status checks of a message
+            max_age: Seconds after which a pending message is given up on
+        """
+        self.db_path = db_path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_age = max_age
+        self.initialized = False
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+
+    def get_db_connection(self):
+        """Get a database connection."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        """Create the sms_deliveries table and indexes if they don't exist."""
+        if self.initialized:
+            return
+
+        conn = self.get_db_connection()
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS sms_deliveries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                chat_id INTEGER,
+                chat_name TEXT,
+                message_row_id INTEGER,
+                provider TEXT,
+                provider_message_id TEXT,
+                phone TEXT,
+                state TEXT,
+                status_code INTEGER,
+                cost REAL,
+                error TEXT,
+                sent_at INTEGER,
+                delivered_at INTEGER,
+                checked_at INTEGER,
+                next_check_at INTEGER
+            )
+            ''')
+            # The web app's log of forwarded messages, whose delivered flags are updated;
+            # the forwarder may run before the web app ever created it
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                chat_name TEXT,
+                sender_name TEXT,
+                message_text TEXT,
+                timestamp INTEGER,
+                delivered BOOLEAN,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sms_deliveries_pending ON sms_deliveries (state, next_check_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sms_deliveries_sent ON sms_deliveries (sent_at)')
+            conn.commit()
+            self.initialized = True
+        except Exception as e:
+            logger.error(f"Error initializing delivery reports: {str(e)}")
+        finally:
+            conn.close()
+
+    def save_message(self, user_id, chat_name, sender_name, message_text):
+        """
+        Save a forwarded message to the messages table.
+
+        Returns:
+            int: The message's row ID, to pass to record(); None if it couldn't be saved
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.execute(
+                'INSERT INTO messages (user_id, chat_name, sender_name, message_text, delivered, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+                (user_id, chat_name, sender_name, message_text, True, int(time.time()))
+            )
+            conn.commit()
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error saving forwarded message: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def record(self, provider, result, phone, user_id=None, chat_id=None, chat_name=None, message_row_id=None):
+        """
+        Record a successful send.
+
+        Args:
+            provider: The SMSProvider the message was sent with
+            result: What its send_sms returned
+            phone: Phone number the message was sent to
+            user_id: The user's Telegram ID, if known
+            chat_id: ID of the chat the message was forwarded from, if any
+            chat_name: Name of that chat
+            message_row_id: ID of the message's row in the messages table, whose
+                delivered flag is updated with the final state
+        """
+        if not result:
+            return
+
+        provider_message_id = None
+        provider_name = provider.name
+        if isinstance(result, str):
+            provider_name, provider_message_id = provider.split_message_id(result)
+
+        # Without a message ID, or with a provider that has no status API, the
+        # send is counted but its delivery is unknown
+        provider_class = PROVIDER_CLASSES.get(provider_name)
+        tracked = provider_message_id is not None and provider_class is not None and provider_class.delivery_reports
+
+        now = int(time.time())
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            conn.execute(
+                '''INSERT INTO sms_deliveries (user_id, chat_id, chat_name, message_row_id, provider, provider_message_id,
+                phone, state, sent_at, next_check_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (user_id, chat_id, chat_name, message_row_id, provider_name, provider_message_id, phone,
+                 'pending' if tracked else 'unknown', now, now + self.min_interval if tracked else None)
+            )
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error recording SMS delivery: {e}")
+        finally:
+            conn.close()
+
+        if tracked:
+            self.wakeup.set()
+
+    def claim_due(self, now):
+        """
+        Claim the pending messages that are due for a status check.
+
+        Their next check is moved ahead before the transaction commits, so the
+        other process skips them.
+
+        Returns:
+            list: The claimed sms_deliveries rows
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                '''SELECT * FROM sms_deliveries WHERE state = 'pending' AND next_check_at <= ?
+                ORDER BY next_check_at LIMIT ?''',
+                (now, DELIVERY_POLL_LIMIT)
+            ).fetchall()
+            conn.executemany(
+                'UPDATE sms_deliveries SET next_check_at = ? WHERE id = ?',
+                [(now + self.get_check_interval(now - row['sent_at']), row['id']) for row in rows]
+            )
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+    def get_check_interval(self, age):
+        """Get the seconds until the next status check of a message sent age seconds ago."""
+        return int(min(self.max_interval, max(self.min_interval, age / 2)))
+
+    def poll(self, get_provider):
+        """
+        Check the status of every pending message that is due.
+
+        Args:
+            get_provider: Function taking a provider name and returning the SMSProvider
+
+        Returns:
+            int: Number of messages whose state became final
+        """
+        now = int(time.time())
+        rows = self.claim_due(now)
+        if not rows:
+            return 0
+
+        by_provider = {}
+        for row in rows:
+            by_provider.setdefault(row['provider'], []).append(row)
+
+        updates = []
+        delivered_flags = []
+        for provider_name, provider_rows in by_provider.items():
+            try:
+                statuses = get_provider(provider_name).get_delivery_statuses(
+                    [(row['provider_message_id'], row['phone']) for row in provider_rows]
+                )
+            except Exception as e:
+                logger.error(f"Error getting delivery statuses from {provider_name}: {e}")
+                # Still give up on old messages, so a provider that keeps failing doesn't keep them pending
+                statuses = {}
+
+            for row in provider_rows:
+                status = statuses.get(row['provider_message_id'])
+                if status is None or status['state'] == 'pending':
+                    if now - row['sent_at'] > self.max_age:
+                        status = {'state': 'expired', 'status_code': status and status['status_code'],
+                                  'cost': status and status['cost'], 'delivered_at': None,
+                                  'error': 'No final delivery status'}
+                    elif status is None:
+                        continue
+                updates.append((status['state'], status['status_code'], status['cost'], status['error'],
+                                status['delivered_at'] or (now if status['state'] == 'delivered' else None),
+                                now, row['id']))
+                if row['message_row_id'] is not None and status['state'] != 'pending':
+                    delivered_flags.append((1 if status['state'] == 'delivered' else 0, row['message_row_id']))
+
+        if not updates:
+            return 0
+
+        conn = self.get_db_connection()
+        try:
+            conn.executemany(
+                '''UPDATE sms_deliveries SET state = ?, status_code = ?, cost = COALESCE(?, cost), error = ?,
+                delivered_at = ?, checked_at = ? WHERE id = ?''',
+                updates
+            )
+            if delivered_flags:
+                # Replace the delivered flag set at send time with the actual outcome
+                conn.executemany('UPDATE messages SET delivered = ? WHERE id = ?', delivered_flags)
+            conn.commit()
+        finally:
+            conn.close()
+
+        final = sum(1 for update in updates if update[0] != 'pending')
+        logger.info(f"Checked delivery of {len(rows)} SMS messages, {final} reached a final state")
+        return final
+
+    def get_next_check_at(self):
+        """Get the time of the next due status check, or None if no message is pending."""
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            return conn.execute("SELECT MIN(next_check_at) FROM sms_deliveries WHERE state = 'pending'").fetchone()[0]
+        finally:
+            conn.close()
+
+    def start(self, get_provider):
+        """
+        Start collecting delivery reports in a daemon thread, if that isn't running yet.
+
+        Args:
+            get_provider: Function taking a provider name and returning the SMSProvider
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, args=(get_provider,), name='delivery-reports', daemon=True)
+            self.thread.start()
+
+    def run(self, get_provider):
+        """Thread target: poll whenever a message is due, sleeping in between."""
+        while True:
+            try:
+                self.poll(get_provider)
+                next_check_at = self.get_next_check_at()
+            except Exception as e:
+                logger.error(f"Error collecting delivery reports: {e}")
+                next_check_at = None
+
+            if next_check_at is None:
+                timeout = self.max_interval
+            else:
+                timeout = min(self.max_interval, max(1, next_check_at - time.time()))
+            # record() wakes the thread to reschedule around a new message
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+    def get_report(self, group_by='chat', user_id=None, since=None):
+        """
+        Get delivery statistics.
+
+        Args:
+            group_by: 'chat' or 'provider'
+            user_id: Only messages sent for this user (all messages by default)
+            since: Only messages sent at or after this Unix time
+
+        Returns:
+            list: One dictionary per chat or provider with sent, delivered,
+                failed, pending and unknown counts, delivery_rate and
+                failure_rate (of the messages with a final state),
+                average_latency and max_latency (seconds from sending to
+                delivery) and cost
+        """
+        if group_by not in ('chat', 'provider'):
+            raise ValueError(f"Unknown delivery report grouping: {group_by}")
+        columns = 'chat_id, chat_name' if group_by == 'chat' else 'provider'
+
+        where = '1 = 1'
+        params = []
+        if user_id is not None:
+            where += ' AND user_id = ?'
+            params.append(user_id)
+        if since is not None:
+            where += ' AND sent_at >= ?'
+            params.append(since)
+
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            rows = conn.execute(
+                f'''SELECT {columns},
+                    COUNT(*) AS sent,
+                    SUM(state = 'delivered') AS delivered,
+                    SUM(state IN ('failed', 'expired')) AS failed,
+                    SUM(state = 'pending') AS pending,
+                    SUM(state = 'unknown') AS unknown,
+                    AVG(CASE WHEN state = 'delivered' THEN delivered_at - sent_at END) AS average_latency,
+                    MAX(CASE WHEN state = 'delivered' THEN delivered_at - sent_at END) AS max_latency,
+                    SUM(cost) AS cost
+                FROM sms_deliveries WHERE {where}
+                GROUP BY {columns} ORDER BY sent DESC''',
+                params
+            ).fetchall()
+        finally:
+            conn.close()
+
+        report = []
+        for row in rows:
+            entry = dict(row)
+            final = entry['delivered'] + entry['failed']
+            entry['delivery_rate'] = round(entry['delivered'] / final, 3) if final else None
+            entry['failure_rate'] = round(entry['failed'] / final, 3) if final else None
+            if entry['average_latency'] is not None:
+                entry['average_latency'] = round(entry['average_latency'], 1)
+            report.append(entry)
+        return report
+
+# Create a global instance of the delivery reports
+delivery_reports = DeliveryReports()
@@ -0,0 +1,268 @@
+"""
+Dialog Snapshot
+This module keeps a per-user snapshot of the Telegram dialog list in SQLite, refreshed
+in the background, so the chat selection page can search and page through any number
+of chats without asking Telegram on every request.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from chat_sync import get_display_name
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DATABASE_PATH = 'forwarder.db'
+
+# Seconds after which a snapshot is refreshed in the background
+DIALOG_SNAPSHOT_TTL = int(os.getenv('DIALOG_SNAPSHOT_TTL', '300'))
+
+# Seconds between full refreshes, which also pick up removed chats and changed mute settings
+DIALOG_SNAPSHOT_FULL_REFRESH_INTERVAL = int(os.getenv('DIALOG_SNAPSHOT_FULL_REFRESH_INTERVAL', '3600'))
+
+# Telegram's service notifications chat
+TELEGRAM_SERVICE_CHAT_ID = 777000
+
+class DialogSnapshots:
+    """
+    SQLite snapshot of each user's non-archived dialogs.
+
+    Dialogs come from Telegram ordered by their latest message (after the
+    pinned ones), so an incremental refresh only walks the list until it
+    reaches a dialog that is no newer than the snapshot. A full refresh walks the whole
+    list and drops chats that are gone. Readers always get the stored snapshot
+    immediately; a stale one is refreshed in the background.
+    """
+
+    def __init__(self, db_path=DATABASE_PATH, ttl=DIALOG_SNAPSHOT_TTL,
+                 full_refresh_interval=DIALOG_SNAPSHOT_FULL_REFRESH_INTERVAL):
+        """
+        Initialize the DialogSnapshots.
+
+        Args:
+            db_path: Path of the SQLite database
+            ttl: Seconds after which a snapshot is stale
+            full_refresh_interval: Seconds between full refreshes
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.full_refresh_interval = full_refresh_interval
+        self.refreshing = {}
+        self.lock = threading.Lock()
+        self.initialized = False
+
+    def get_db_connection(self):
+        """Get a database connection."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        """Create the snapshot tables and indexes if they don't exist."""
+        if self.initialized:
+            return
+
+        conn = self.get_db_connection()
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS dialog_snapshots (
+                user_id INTEGER,
+                chat_id INTEGER,
+                name TEXT,
+                name_key TEXT,
+                is_muted BOOLEAN DEFAULT 0,
+                is_channel BOOLEAN DEFAULT 0,
+                is_pinned BOOLEAN DEFAULT 0,
+                last_activity INTEGER,
+                preview_text TEXT,
+                updated_at INTEGER,
+                PRIMARY KEY (user_id, chat_id)
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_dialog_snapshots_user_activity ON dialog_snapshots (user_id, last_activity)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_dialog_snapshots_user_name ON dialog_snapshots (user_id, name_key)')
+
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS dialog_snapshot_status (
+                user_id INTEGER PRIMARY KEY,
+                refreshed_at INTEGER,
+                full_refreshed_at INTEGER,
+                dialog_count INTEGER
+            )
+            ''')
+            conn.commit()
+            self.initialized = True
+        except Exception as e:
+            logger.error(f"Error initializing dialog snapshots: {str(e)}")
+        finally:
+            conn.close()
+
+    def get_status(self, user_id):
+        """
+        Get the refresh status of a user's snapshot.
+
+        Returns:
+            dict: The status row, or None if the user has no snapshot yet
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            row = conn.execute('SELECT * FROM dialog_snapshot_status WHERE user_id = ?', (user_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def is_stale(self, status):
+        """Check whether a snapshot status (from get_status) is due for a refresh."""
+        return status is None or time.time() - status['refreshed_at'] > self.ttl
+
+    @staticmethod
+    def dialog_to_row(user_id, dialog, now):
+        """Convert a Telethon dialog to a dialog_snapshots row."""
+        name = get_display_name(dialog.entity)
+        preview_text = ""
+        if dialog.message is not None and dialog.message.message:
+            # Use the already loaded message to avoid additional API calls
+            text = dialog.message.message
+            preview_text = text[:30] + "..." if len(text) > 30 else text
+
+        return (
+            user_id,
+            dialog.entity.id,
+            name,
+            name.casefold(),
+            1 if dialog.dialog.notify_settings.mute_until else 0,
+            1 if dialog.is_channel and not dialog.is_group else 0,
+            1 if dialog.pinned else 0,
+            int(dialog.date.timestamp()) if dialog.date else 0,
+            preview_text,
+            now
+        )
+
+    async def refresh(self, client, user_id, full=False):
+        """
+        Refresh a user's snapshot from Telegram.
+
+        Args:
+            client: Connected Telethon client of the user
+            user_id: The user's Telegram ID
+            full: Walk the whole dialog list even if an incremental refresh would do
+
+        Returns:
+            int: Number of dialogs fetched
+        """
+        status = self.get_status(user_id)
+        now = int(time.time())
+        full = full or status is None or now - (status['full_refreshed_at'] or 0) > self.full_refresh_interval
+
+        watermark = None
+        if not full:
+            conn = self.get_db_connection()
+            try:
+                watermark = conn.execute(
+                    'SELECT MAX(last_activity) FROM dialog_snapshots WHERE user_id = ? AND is_pinned = 0', (user_id,)
+                ).fetchone()[0]
+            finally:
+                conn.close()
+            full = watermark is None
+
+        rows = []
+        async for dialog in client.iter_dialogs(archived=False):
+            row = self.dialog_to_row(user_id, dialog, now)
+            # Skip Telegram service chat
+            if not (row[1] == TELEGRAM_SERVICE_CHAT_ID and row[2] == "Telegram"):
+                rows.append(row)
+            if not full and not dialog.pinned and row[7] <= watermark:
+                break  # Every dialog from here on is unchanged since the last refresh
+
+        conn = self.get_db_connection()
+        try:
+            conn.executemany(
+                '''INSERT OR REPLACE INTO dialog_snapshots (user_id, chat_id, name, name_key, is_muted, is_channel,
+                is_pinned, last_activity, preview_text, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                rows
+            )
+            if full:
+                # Dialogs that weren't listed were left, deleted or archived
+                conn.execute('DELETE FROM dialog_snapshots WHERE user_id = ? AND updated_at < ?', (user_id, now))
+            dialog_count = conn.execute('SELECT COUNT(*) FROM dialog_snapshots WHERE user_id = ?', (user_id,)).fetchone()[0]
+            conn.execute(
+                '''INSERT INTO dialog_snapshot_status (user_id, refreshed_at, full_refreshed_at, dialog_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET refreshed_at = excluded.refreshed_at,
+                    full_refreshed_at = COALESCE(excluded.full_refreshed_at, full_refreshed_at),
+                    dialog_count = excluded.dialog_count''',
+                (user_id, now, now if full else None, dialog_count)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        logger.info(f"{'Full' if full else 'Incremental'} dialog snapshot refresh for user {user_id}: "
+                    f"fetched {len(rows)} dialogs, {dialog_count} in snapshot")
+        return len(rows)
+
+    def schedule_refresh(self, user_id, refresh, submit):
+        """
+        Start a background refresh of a user's snapshot unless one is already running.
+
+        Args:
+            user_id: The user's Telegram ID
+            refresh: Function taking the user ID and returning the refresh coroutine
+            submit: Function that schedules a coroutine on the background event loop
+
+        Returns:
+            concurrent.futures.Future: The running refresh
+        """
+        with self.lock:
+            future = self.refreshing.get(user_id)
+            if future is None or future.done():
+                future = self.refreshing[user_id] = submit(refresh(user_id))
+            return future
+
+    def query(self, user_id, prefix='', muted=None, channel=None, page=1, per_page=50):
+        """
+        Get one page of a user's snapshot, most recently active first.
+
+        Args:
+            user_id: The user's Telegram ID
+            prefix: Only chats whose name starts with this (case-insensitive)
+            muted: Only muted (True) or unmuted (False) chats; None for both
+            channel: Only channels (True) or other chats (False); None for both
+            page: Page number, starting at 1
+            per_page: Chats per page
+
+        Returns:
+            tuple: (list of chat rows as dictionaries, total number of matching chats)
+        """
+        self.init_db()
+        where = 'user_id = ?'
+        params = [user_id]
+        if prefix:
+            escaped = prefix.casefold().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where += " AND name_key LIKE ? ESCAPE '\\'"
+            params.append(f"{escaped}%")
+        if muted is not None:
+            where += ' AND is_muted = ?'
+            params.append(1 if muted else 0)
+        if channel is not None:
+            where += ' AND is_channel = ?'
+            params.append(1 if channel else 0)
+
+        conn = self.get_db_connection()
+        try:
+            total = conn.execute(f'SELECT COUNT(*) FROM dialog_snapshots WHERE {where}', params).fetchone()[0]
+            rows = conn.execute(
+                f'''SELECT * FROM dialog_snapshots WHERE {where}
+                ORDER BY last_activity DESC LIMIT ? OFFSET ?''',
+                params + [per_page, (max(page, 1) - 1) * per_page]
+            ).fetchall()
+            return [dict(row) for row in rows], total
+        finally:
+            conn.close()
+
+# Create a global instance of the dialog snapshots
+dialog_snapshots = DialogSnapshots()
@@ -0,0 +1,270 @@
+"""
+Event Bus
+This module pushes live updates (new messages, summaries, forwarder status, rate limit
+counters) to open browser tabs as Server-Sent Events, instead of each tab polling
+endpoints that do the full work on every request.
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DATABASE_PATH = 'forwarder.db'
+
+# Seconds between checks of the database and watched files for changes
+EVENT_POLL_INTERVAL = float(os.getenv('EVENT_POLL_INTERVAL', '1'))
+
+# Seconds between keepalive comments on an idle stream
+EVENT_KEEPALIVE_INTERVAL = 15
+
+# Seconds after which a stream is closed; the browser reconnects on its own.
+# Each open stream holds a server thread, so keep this well below the worker timeout.
+EVENT_STREAM_MAX_SECONDS = int(os.getenv('EVENT_STREAM_MAX_SECONDS', '50'))
+
+# Streams a process holds open at once; keep this below the server's thread count
+# so ordinary requests always find a free thread
+EVENT_MAX_STREAMS = int(os.getenv('EVENT_MAX_STREAMS', '16'))
+
+# Milliseconds the browser waits before reconnecting
+EVENT_RETRY_MS = 3000
+
+# Milliseconds the browser waits before asking again when no stream could be held open
+EVENT_POLL_RETRY_MS = 30000
+
+class EventBus:
+    """
+    In-process publish/subscribe of per-user events.
+
+    Each event type has a source: a function returning the event's current
+    data for a user. The forwarder runs in a separate process and only talks
+    to the web app through forwarder.db and state files, so while anybody is
+    subscribed a watcher thread checks PRAGMA data_version (which changes
+    whenever another connection commits) and the mtimes of the watched files.
+    Only when one of them changed are the sources evaluated again, and only
+    data that differs from what was last sent is published. An idle tab
+    therefore costs one PRAGMA per poll interval and a keepalive comment.
+    """
+
+    def __init__(self, db_path=DATABASE_PATH, poll_interval=EVENT_POLL_INTERVAL, max_streams=EVENT_MAX_STREAMS):
+        """
+        Initialize the EventBus.
+
+        Args:
+            db_path: Path to the SQLite database to watch
+            poll_interval: Seconds between change checks
+            max_streams: Streams held open at once; further tabs fall back to polling
+        """
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self.open_streams = 0
+        self.sources = {}
+        self.watched_files = {}
+        self.subscribers = {}
+        self.listeners = []
+        self.last_payloads = {}
+        self.lock = threading.Lock()
+        self.watcher = None
+
+    def register(self, event, source):
+        """
+        Register the source of an event type.
+
+        Args:
+            event: Event name, e.g. "messages"
+            source: Function taking a user ID and returning JSON-serializable data
+        """
+        self.sources[event] = source
+
+    def add_listener(self, callback):
+        """
+        Call a function whenever an event's data changes, e.g. to invalidate cached responses.
+
+        Args:
+            callback: Function taking the user ID and the event name
+        """
+        self.listeners.append(callback)
+
+    def watch_file(self, path):
+        """Re-evaluate the sources whenever the file at path changes, e.g. a state file written by the forwarder."""
+        self.watched_files[path] = self.get_mtime(path)
+
+    @staticmethod
+    def get_mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def evaluate(self, user_id, event):
+        """Get an event's current data for a user as JSON, or None if its source failed."""
+        try:
+            return json.dumps(self.sources[event](user_id), default=str)
+        except Exception as e:
+            logger.error(f"Error evaluating {event} event for user {user_id}: {e}", exc_info=True)
+            return None
+
+    def subscribe(self, user_id):
+        """
+        Subscribe to a user's events.
+
+        The queue starts with the current data of every event type, so a new
+        tab is up to date without a separate request.
+
+        Returns:
+            queue.Queue: Queue of (event, JSON data) tuples
+        """
+        subscriber = queue.Queue()
+        for event in self.sources:
+            payload = self.evaluate(user_id, event)
+            if payload is not None:
+                subscriber.put((event, payload))
+
+        with self.lock:
+            for event, payload in list(subscriber.queue):
+                self.last_payloads.setdefault((user_id, event), payload)
+            self.subscribers.setdefault(user_id, set()).add(subscriber)
+            if self.watcher is None or not self.watcher.is_alive():
+                self.watcher = threading.Thread(target=self.watch, name='event-bus-watcher', daemon=True)
+                self.watcher.start()
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        """Remove a subscriber queue returned by subscribe()."""
+        with self.lock:
+            subscribers = self.subscribers.get(user_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[user_id]
+                for key in [key for key in self.last_payloads if key[0] == user_id]:
+                    del self.last_payloads[key]
+
+    def publish(self, user_id, event, data):
+        """
+        Send an event to a user's subscribers unless its data is unchanged.
+
+        Args:
+            user_id: The user's Telegram ID
+            event: Event name
+            data: JSON-serializable data, or an already serialized JSON string
+        """
+        payload = data if isinstance(data, str) else json.dumps(data, default=str)
+        with self.lock:
+            if self.last_payloads.get((user_id, event)) == payload:
+                return
+            self.last_payloads[(user_id, event)] = payload
+            subscribers = list(self.subscribers.get(user_id, ()))
+
+        for subscriber in subscribers:
+            subscriber.put((event, payload))
+        for listener in self.listeners:
+            try:
+                listener(user_id, event)
+            except Exception as e:
+                logger.error(f"Error in {event} event listener: {e}", exc_info=True)
+
+    def refresh(self):
+        """Evaluate every source for every subscribed user and publish what changed."""
+        with self.lock:
+            user_ids = list(self.subscribers)
+
+        for user_id in user_ids:
+            for event in self.sources:
+                payload = self.evaluate(user_id, event)
+                if payload is not None:
+                    self.publish(user_id, event, payload)
+
+    def watch(self):
+        """Watcher thread target: refresh on database or file changes until nobody is subscribed."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            # Catch changes made between the subscriber's first snapshot and now
+            self.refresh()
+            while True:
+                time.sleep(self.poll_interval)
+                with self.lock:
+                    if not self.subscribers:
+                        self.watcher = None
+                        return
+
+                changed = False
+                version = conn.execute('PRAGMA data_version').fetchone()[0]
+                if version != data_version:
+                    data_version = version
+                    changed = True
+                for path, mtime in self.watched_files.items():
+                    current = self.get_mtime(path)
+                    if current != mtime:
+                        self.watched_files[path] = current
+                        changed = True
+
+                if changed:
+                    self.refresh()
+        except Exception as e:
+            logger.error(f"Event bus watcher stopped: {e}", exc_info=True)
+            with self.lock:
+                self.watcher = None
+        finally:
+            conn.close()
+
+    def stream(self, user_id, max_seconds=EVENT_STREAM_MAX_SECONDS):
+        """
+        Generate a user's events in Server-Sent Events format.
+
+        When max_streams streams are already open, the current data is sent
+        and the stream ends at once, with a longer retry so the browser polls
+        instead of holding a thread.
+
+        Args:
+            user_id: The user's Telegram ID
+            max_seconds: Seconds after which the stream ends (the browser reconnects)
+
+        Yields:
+            str: SSE messages and keepalive comments
+        """
+        with self.lock:
+            held = self.open_streams < self.max_streams
+            if held:
+                self.open_streams += 1
+
+        if not held:
+            yield f"retry: {EVENT_POLL_RETRY_MS}\n\n"
+            for event in self.sources:
+                payload = self.evaluate(user_id, event)
+                if payload is not None:
+                    yield f"event: {event}\ndata: {payload}\n\n"
+            return
+
+        try:
+            subscriber = self.subscribe(user_id)
+            deadline = time.monotonic() + max_seconds
+            try:
+                yield f"retry: {EVENT_RETRY_MS}\n\n"
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event, payload = subscriber.get(timeout=min(EVENT_KEEPALIVE_INTERVAL, remaining))
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield f"event: {event}\ndata: {payload}\n\n"
+            finally:
+                self.unsubscribe(user_id, subscriber)
+        finally:
+            with self.lock:
+                self.open_streams -= 1
+
+# Create a global instance of the event bus
+event_bus = EventBus()
@@ -0,0 +1,418 @@
+"""
+Export Jobs
+This module runs message history exports as background jobs. Progress is tracked in
+forwarder.db with a checkpoint per chat, so an interrupted export resumes where it
+stopped, and the finished gzip-compressed CSV stays on disk for repeat downloads.
+"""
+
+import io
+import os
+import csv
+import gzip
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DATABASE_PATH = 'forwarder.db'
+
+# Export settings
+EXPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports')
+EXPORT_CACHE_TTL = int(os.getenv('EXPORT_CACHE_TTL', '600'))  # Seconds a finished export is reused
+EXPORT_RETENTION = 86400  # Seconds before a finished export's file is deleted
+
+def csv_header(include_archived=False):
+    """Get the header row of a message CSV export."""
+    header = ['Timestamp', 'Date', 'Time', 'Chat', 'Sender', 'Message']
+    if include_archived:
+        header.append('Archived')
+    return header
+
+def csv_row(message, include_archived=False):
+    """Get the CSV row of a message dictionary."""
+    # Convert timestamp to datetime
+    message_date = datetime.fromtimestamp(message['timestamp'])
+    row = [message['timestamp'], message_date.strftime('%Y-%m-%d'), message_date.strftime('%H:%M:%S'),
+           message['chat_name'], message['sender_name'], message['message_text']]
+    if include_archived:
+        row.append("Yes" if message.get('archived', False) else "No")
+    return row
+
+def compress_rows(rows):
+    """Write rows as CSV and compress them into one gzip member."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return gzip.compress(buffer.getvalue().encode('utf-8'))
+
+class ExportJobs:
+    """
+    Background export jobs for one process.
+
+    A job writes one gzip member per chat to its artifact file and then, in
+    one transaction, records a checkpoint for the chat and the artifact's
+    committed size. Concatenated gzip members form a valid gzip file, so a job
+    that was interrupted truncates the file to the committed size, skips the
+    checkpointed chats and carries on.
+
+    Jobs run on the web app's background event loop. The chats of an export
+    come from a source function, called as source(skip_chat_ids, on_chats),
+    that returns an async generator of (chat ID, messages) tuples.
+    """
+
+    def __init__(self, db_path=DATABASE_PATH, exports_dir=EXPORTS_DIR, cache_ttl=EXPORT_CACHE_TTL):
+        """
+        Initialize ExportJobs.
+
+        Args:
+            db_path: Path of the SQLite database
+            exports_dir: Directory of the export files
+            cache_ttl: Seconds a finished export is served again instead of starting a new one
+        """
+        self.db_path = db_path
+        self.exports_dir = exports_dir
+        self.cache_ttl = cache_ttl
+        self.active = set()
+        self.lock = threading.Lock()
+        self.initialized = False
+
+    def get_db_connection(self):
+        """Get a database connection."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        """Create the export tables if they don't exist."""
+        if self.initialized:
+            return
+
+        os.makedirs(self.exports_dir, exist_ok=True)
+        conn = self.get_db_connection()
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS export_jobs (
+                job_id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                scope TEXT,
+                include_archived BOOLEAN,
+                status TEXT,
+                total_chats INTEGER,
+                done_chats INTEGER DEFAULT 0,
+                message_count INTEGER DEFAULT 0,
+                artifact_size INTEGER DEFAULT 0,
+                runner_pid INTEGER,
+                error TEXT,
+                created_at INTEGER,
+                updated_at INTEGER,
+                completed_at INTEGER
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_user_scope ON export_jobs (user_id, scope, created_at)')
+
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS export_checkpoints (
+                job_id TEXT,
+                chat_id INTEGER,
+                message_count INTEGER,
+                created_at INTEGER,
+                PRIMARY KEY (job_id, chat_id)
+            )
+            ''')
+            conn.commit()
+            self.initialized = True
+        except Exception as e:
+            logger.error(f"Error initializing export jobs: {str(e)}")
+        finally:
+            conn.close()
+
+    def get_artifact_path(self, job_id):
+        """Get the path of a job's compressed CSV file."""
+        return os.path.join(self.exports_dir, f"{job_id}.csv.gz")
+
+    def get_job(self, job_id):
+        """
+        Get an export job.
+
+        Returns:
+            dict: The job row, or None if there is no such job
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            row = conn.execute('SELECT * FROM export_jobs WHERE job_id = ?', (job_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def update_job(self, job_id, **fields):
+        """Update columns of an export job."""
+        fields['updated_at'] = int(time.time())
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        conn = self.get_db_connection()
+        try:
+            conn.execute(f'UPDATE export_jobs SET {assignments} WHERE job_id = ?', (*fields.values(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def find_reusable_job(self, user_id, scope):
+        """
+        Find a job a new export request can use instead of starting another one.
+
+        Returns:
+            dict: An unfinished job, or one finished within the cache TTL whose
+                file still exists; None otherwise
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            job = conn.execute(
+                '''SELECT * FROM export_jobs WHERE user_id = ? AND scope = ? AND status IN ('pending', 'running', 'completed')
+                ORDER BY created_at DESC LIMIT 1''',
+                (user_id, scope)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if job is None:
+            return None
+        job = dict(job)
+        if job['status'] != 'completed':
+            return job
+        if time.time() - job['completed_at'] <= self.cache_ttl and os.path.exists(self.get_artifact_path(job['job_id'])):
+            return job
+        return None
+
+    def create_job(self, user_id, scope, include_archived):
+        """Create a pending export job."""
+        self.init_db()
+        self.delete_expired()
+
+        job_id = uuid.uuid4().hex
+        now = int(time.time())
+        conn = self.get_db_connection()
+        try:
+            conn.execute(
+                '''INSERT INTO export_jobs (job_id, user_id, scope, include_archived, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'pending', ?, ?)''',
+                (job_id, user_id, scope, 1 if include_archived else 0, now, now)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        logger.info(f"Created export job {job_id} ({scope}) for user {user_id}")
+        return self.get_job(job_id)
+
+    def is_running_elsewhere(self, job):
+        """Check whether another live process is running a job."""
+        pid = job.get('runner_pid')
+        if not pid or pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError:
+            return False
+
+    def ensure_running(self, job, source, submit):
+        """
+        Run an unfinished job unless it is already running, resuming it after an interruption.
+
+        Args:
+            job: The job row
+            source: Function returning the job's async generator of (chat ID, messages)
+            submit: Function that schedules a coroutine on the background event loop
+        """
+        if job['status'] not in ('pending', 'running'):
+            return
+
+        with self.lock:
+            if job['job_id'] in self.active or self.is_running_elsewhere(job):
+                return
+            self.active.add(job['job_id'])
+
+        if job['status'] == 'running':
+            logger.info(f"Resuming interrupted export job {job['job_id']}")
+        submit(self.run_job(job['job_id'], source))
+
+    def start(self, user_id, scope, include_archived, source, submit):
+        """
+        Get an export for a user, starting a new job only if no recent one can be reused.
+
+        Args:
+            user_id: The user's Telegram ID
+            scope: Name of the export type, e.g. "all"
+            include_archived: Whether the export has an Archived column
+            source: Function returning the job's async generator of (chat ID, messages)
+            submit: Function that schedules a coroutine on the background event loop
+
+        Returns:
+            dict: The job row
+        """
+        job = self.find_reusable_job(user_id, scope) or self.create_job(user_id, scope, include_archived)
+        self.ensure_running(job, source, submit)
+        return job
+
+    def get_checkpointed_chats(self, job_id):
+        """Get the IDs of the chats a job has already written."""
+        conn = self.get_db_connection()
+        try:
+            rows = conn.execute('SELECT chat_id FROM export_checkpoints WHERE job_id = ?', (job_id,)).fetchall()
+            return {row['chat_id'] for row in rows}
+        finally:
+            conn.close()
+
+    def save_checkpoint(self, job_id, chat_id, message_count, artifact_size):
+        """Record a written chat together with the artifact size that includes it."""
+        now = int(time.time())
+        conn = self.get_db_connection()
+        try:
+            conn.execute('INSERT OR REPLACE INTO export_checkpoints (job_id, chat_id, message_count, created_at) VALUES (?, ?, ?, ?)',
+                         (job_id, chat_id, message_count, now))
+            conn.execute(
+                '''UPDATE export_jobs SET done_chats = done_chats + 1, message_count = message_count + ?,
+                artifact_size = ?, updated_at = ? WHERE job_id = ?''',
+                (message_count, artifact_size, now, job_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def open_artifact(self, job):
+        """
+        Open a job's artifact for appending, dropping whatever was written after the last checkpoint.
+
+        Returns:
+            file: The artifact, positioned at its end
+        """
+        path = self.get_artifact_path(job['job_id'])
+        f = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        try:
+            f.seek(job['artifact_size'])
+            f.truncate()
+
+            if not job['artifact_size']:
+                f.write(compress_rows([csv_header(job['include_archived'])]))
+                f.flush()
+                self.update_job(job['job_id'], artifact_size=f.tell())
+        except Exception:
+            f.close()
+            raise
+        return f
+
+    def write_chat(self, job, f, chat_id, messages):
+        """Append a chat's messages to a job's artifact and checkpoint them."""
+        f.write(compress_rows([csv_row(message, job['include_archived']) for message in messages]))
+        f.flush()
+        self.save_checkpoint(job['job_id'], chat_id, len(messages), f.tell())
+
+    async def run_job(self, job_id, source):
+        """
+        Write an export job's chats to its compressed CSV file.
+
+        Compression, file writes and checkpoints run in the default executor,
+        so a large export doesn't stall the shared background event loop.
+
+        Args:
+            job_id: The job ID
+            source: Function returning the job's async generator of (chat ID, messages)
+        """
+        loop = asyncio.get_running_loop()
+        started_at = time.monotonic()
+
+        try:
+            job = await loop.run_in_executor(None, self.get_job, job_id)
+            skip_chat_ids = await loop.run_in_executor(None, self.get_checkpointed_chats, job_id)
+            await loop.run_in_executor(None, lambda: self.update_job(job_id, status='running', runner_pid=os.getpid()))
+
+            f = await loop.run_in_executor(None, self.open_artifact, job)
+            try:
+                # Called from inside the source's generator, so the update is only scheduled here
+                pending_updates = []
+
+                def on_chats(total):
+                    pending_updates.append(loop.run_in_executor(None, lambda: self.update_job(job_id, total_chats=total)))
+
+                async for chat_id, messages in source(skip_chat_ids, on_chats):
+                    await loop.run_in_executor(None, self.write_chat, job, f, chat_id, messages)
+                await asyncio.gather(*pending_updates)
+            finally:
+                f.close()
+
+            await loop.run_in_executor(None, lambda: self.update_job(job_id, status='completed',
+                                                                     completed_at=int(time.time()), error=None))
+            job = await loop.run_in_executor(None, self.get_job, job_id)
+            logger.info(f"Export job {job_id} finished with {job['message_count']} messages from {job['done_chats']} chats "
+                        f"in {time.monotonic() - started_at:.1f} seconds")
+        except asyncio.CancelledError:
+            # Left as running; the next status request resumes it
+            logger.warning(f"Export job {job_id} was interrupted")
+            raise
+        except Exception as e:
+            logger.error(f"Export job {job_id} failed: {e}", exc_info=True)
+            error = str(e)
+            await loop.run_in_executor(None, lambda: self.update_job(job_id, status='failed', error=error))
+        finally:
+            with self.lock:
+                self.active.discard(job_id)
+
+    def get_status(self, job):
+        """
+        Get a job's status for the status endpoint.
+
+        Returns:
+            dict: Job ID, status, progress counters, percent complete and error
+        """
+        total = job['total_chats']
+        if job['status'] == 'completed':
+            percent = 100
+        elif total:
+            percent = min(99, int(job['done_chats'] * 100 / total))
+        else:
+            percent = 0
+
+        return {
+            'job_id': job['job_id'],
+            'scope': job['scope'],
+            'status': job['status'],
+            'total_chats': total,
+            'done_chats': job['done_chats'],
+            'message_count': job['message_count'],
+            'percent': percent,
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'completed_at': job['completed_at']
+        }
+
+    def delete_expired(self):
+        """Delete the files and records of exports older than EXPORT_RETENTION."""
+        cutoff = int(time.time()) - EXPORT_RETENTION
+        conn = self.get_db_connection()
+        try:
+            expired = conn.execute(
+                "SELECT job_id FROM export_jobs WHERE created_at < ? AND status IN ('completed', 'failed')", (cutoff,)
+            ).fetchall()
+            for row in expired:
+                try:
+                    os.remove(self.get_artifact_path(row['job_id']))
+                except FileNotFoundError:
+                    pass
+                conn.execute('DELETE FROM export_checkpoints WHERE job_id = ?', (row['job_id'],))
+                conn.execute('DELETE FROM export_jobs WHERE job_id = ?', (row['job_id'],))
+            conn.commit()
+            if expired:
+                logger.info(f"Deleted {len(expired)} expired exports")
+        except Exception as e:
+            logger.error(f"Error deleting expired exports: {str(e)}")
+        finally:
+            conn.close()
+
+# Create a global instance of the export jobs
+export_jobs = ExportJobs()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Extractive Summarizer Module
+This module provides a local, offline summarization engine that picks the most
+representative sentences of a conversation using TF-IDF sentence vectors and TextRank.
+"""
+
+import os
+import re
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Summary engine for both the SMS summaries and the summary page: 'anthropic' or
+# 'extractive' (local, no network). The SMS summarizer has no AI engine and
+# truncates unless this is 'extractive'.
+SUMMARY_ENGINE = os.getenv('SUMMARY_ENGINE', 'anthropic').lower()
+
+# Words are runs of Latin or Cyrillic letters and digits
+WORD_PATTERN = re.compile(r'[0-9a-zа-яё]+', re.IGNORECASE)
+
+# Sentences end with terminal punctuation followed by whitespace, or a line break,
+# so decimals like "2.5" and dotted names stay inside their sentence
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+# Links carry no summarizable words and break sentence splitting
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+', re.IGNORECASE)
+
+STOP_WORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне
+было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до
+вас нибудь опять уж вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя
+их чем была сам чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому этого
+какой совсем ним здесь этом один почти мой тем чтобы нее сейчас были куда зачем всех никогда
+можно при наконец два об другой хоть после над больше тот через эти нас про всего них какая
+много разве три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им
+более всегда конечно всю между это эта эти весь вся свой наш ваш который которая которые
+очень просто тоже также вообще типа кстати спасибо привет пожалуйста ок ага угу
+the a an and or but if then of to in on at by for with about as is are was were be been being
+it its this that these those i you he she we they me him her us them my your our their do does
+did have has had not no so just can will would should could from up out what which who how all
+any some there here when where why also than too very hi hello thanks ok
+""".split())
+
+class ExtractiveSummarizer:
+    """
+    Local extractive summarizer.
+
+    Each message is split into sentences, sentences are turned into
+    L2-normalized TF-IDF vectors, and TextRank (PageRank over the cosine
+    similarity graph) scores how central each sentence is to the conversation.
+    The best sentences are returned in their original order until the length
+    budget is used up. No network access or model files are needed.
+    """
+
+    def __init__(self, max_sentences=3, max_length=160, max_candidates=120, redundancy=0.7,
+                 damping=0.85, iterations=30, tolerance=1e-4):
+        """
+        Initialize the ExtractiveSummarizer.
+
+        Args:
+            max_sentences (int): The maximum number of sentences in a summary.
+            max_length (int): The maximum length of the summary in characters.
+            max_candidates (int): Only the most recent sentences up to this count are ranked.
+            redundancy (float): Sentences more similar than this to an already
+                selected sentence are skipped.
+            damping (float): TextRank damping factor.
+            iterations (int): Maximum number of TextRank power iterations.
+            tolerance (float): Convergence threshold for TextRank.
+        """
+        self.max_sentences = max_sentences
+        self.max_length = max_length
+        self.max_candidates = max_candidates
+        self.redundancy = redundancy
+        self.damping = damping
+        self.iterations = iterations
+        self.tolerance = tolerance
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Split text into lowercase content words.
+
+        Args:
+            text (str): The text to tokenize.
+
+        Returns:
+            list: Words with stop-words and single characters removed.
+        """
+        words = WORD_PATTERN.findall(text.lower().replace('ё', 'е'))
+        return [word for word in words if len(word) > 1 and word not in STOP_WORDS]
+
+    @staticmethod
+    def split_sentences(text):
+        """
+        Split text into sentences.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            list: Non-empty, stripped sentences with links removed.
+        """
+        text = URL_PATTERN.sub(' ', text)
+        return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+    def build_sentences(self, messages):
+        """
+        Extract candidate sentences from messages.
+
+        Args:
+            messages (list): Message dictionaries with 'text'/'sender' or
+                'message_text'/'sender_name' keys, oldest first.
+
+        Returns:
+            list: (sender, sentence, tokens) tuples in message order, limited
+                to the last max_candidates sentences.
+        """
+        # Walk backwards so older messages are never tokenized once the cap is reached
+        sentences = []
+        for message in reversed(messages):
+            text = message.get('text', message.get('message_text')) or ''
+            sender = message.get('sender', message.get('sender_name')) or 'Unknown'
+            for sentence in reversed(self.split_sentences(text)):
+                tokens = self.tokenize(sentence)
+                if tokens:
+                    sentences.append((sender, sentence, tokens))
+                    if len(sentences) >= self.max_candidates:
+                        return sentences[::-1]
+        return sentences[::-1]
+
+    def score_sentences(self, token_lists):
+        """
+        Score sentences by TextRank over their TF-IDF cosine similarity.
+
+        Args:
+            token_lists (list): Token lists, one per sentence.
+
+        Returns:
+            tuple: (scores, vectors) - one TextRank score per sentence and the
+                L2-normalized TF-IDF vectors of the sentences.
+        """
+        count = len(token_lists)
+        if count == 1:
+            return np.ones(1, dtype=np.float32), np.ones((1, 1), dtype=np.float32)
+
+        # Build the vocabulary and the term-frequency matrix
+        vocabulary = {}
+        rows, cols = [], []
+        for row, tokens in enumerate(token_lists):
+            for token in tokens:
+                rows.append(row)
+                cols.append(vocabulary.setdefault(token, len(vocabulary)))
+
+        size = len(vocabulary)
+        flat_index = np.asarray(rows) * size + np.asarray(cols)
+        tf = np.bincount(flat_index, minlength=count * size).reshape(count, size).astype(np.float32)
+
+        # Smoothed inverse document frequency
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log((1.0 + count) / (1.0 + df)).astype(np.float32) + 1.0
+        tfidf = tf * idf
+
+        norms = np.sqrt(np.einsum('ij,ij->i', tfidf, tfidf))[:, None]
+        norms[norms == 0] = 1.0
+        tfidf /= norms
+
+        # Cosine similarity graph without self-loops
+        similarity = tfidf @ tfidf.T
+        np.fill_diagonal(similarity, 0.0)
+
+        # Row-normalize into a transition matrix; isolated sentences link everywhere.
+        # The transpose is stored contiguously for the power iteration below.
+        out_weight = similarity.sum(axis=1, keepdims=True)
+        transition = np.where(out_weight > 0, similarity / np.where(out_weight > 0, out_weight, 1.0), 1.0 / count)
+        transition_t = np.ascontiguousarray(transition.T, dtype=np.float32)
+
+        scores = np.full(count, 1.0 / count, dtype=np.float32)
+        teleport = (1.0 - self.damping) / count
+        for _ in range(self.iterations):
+            updated = teleport + self.damping * (transition_t @ scores)
+            if np.abs(updated - scores).sum() < self.tolerance:
+                scores = updated
+                break
+            scores = updated
+
+        return scores, tfidf
+
+    def summarize(self, messages, max_length=None, include_sender=True):
+        """
+        Summarize a conversation.
+
+        Args:
+            messages (list): Message dictionaries (see build_sentences).
+            max_length (int, optional): Character budget, defaults to self.max_length.
+            include_sender (bool): Prefix each sentence with its sender's name.
+
+        Returns:
+            str: The summary, or an empty string if there is nothing to summarize.
+        """
+        max_length = max_length or self.max_length
+        sentences = self.build_sentences(messages)
+        if not sentences:
+            return ""
+
+        scores, vectors = self.score_sentences([tokens for _, _, tokens in sentences])
+
+        # Prefer central sentences; break ties towards the most recent ones
+        ranked = sorted(range(len(sentences)), key=lambda i: (scores[i], i), reverse=True)
+
+        selected = []
+        used_length = 0
+        for index in ranked:
+            sender, sentence, _ = sentences[index]
+            part = f"{sender}: {sentence}" if include_sender else sentence
+            separator = 3 if selected else 0  # " | "
+            if used_length + separator + len(part) > max_length:
+                continue
+            # Skip near-duplicates of sentences already in the summary
+            if selected and float((vectors[selected] @ vectors[index]).max()) > self.redundancy:
+                continue
+            selected.append(index)
+            used_length += separator + len(part)
+            if len(selected) >= self.max_sentences:
+                break
+
+        if not selected:
+            # Even the best sentence is too long: truncate it
+            sender, sentence, _ = sentences[ranked[0]]
+            part = f"{sender}: {sentence}" if include_sender else sentence
+            return part[:max_length - 3] + "..." if len(part) > max_length else part
+
+        parts = []
+        for index in sorted(selected):
+            sender, sentence, _ = sentences[index]
+            parts.append(f"{sender}: {sentence}" if include_sender else sentence)
+        return " | ".join(parts)
+
+# Create a global instance of the extractive summarizer
+extractive_summarizer = ExtractiveSummarizer(max_sentences=3, max_length=160)
+
+# Example usage
+if __name__ == "__main__":
+    conversation = [
+        {'sender': 'Alice', 'text': 'Привет! Кто едет завтра на конференцию в Москве?'},
+        {'sender': 'Bob', 'text': 'Я еду. Конференция начинается в 10 утра, регистрация с 9.'},
+        {'sender': 'Alice', 'text': 'Отлично. Возьми, пожалуйста, ноутбук для презентации.'},
+        {'sender': 'Charlie', 'text': 'Презентацию я отправил вчера. Регистрация на конференцию уже закрыта?'},
+        {'sender': 'Bob', 'text': 'Нет, регистрация открыта до вечера.'},
+    ]
+    print(extractive_summarizer.summarize(conversation))
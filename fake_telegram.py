@@ -0,0 +1,329 @@
+"""
+Fake Telegram
+This module provides an in-process stand-in for the part of the Telethon client the
+forwarder uses, with configurable RPC latency and flood wait injection, so the message
+handling pipeline can be benchmarked and regression-tested without a Telegram account.
+"""
+
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from telethon import errors, utils
+from telethon.tl import types
+from telethon.tl.custom import Dialog
+
+from mock_sms_gateway import parse_latency
+from telegram_scheduler import PRIORITY_LIVE
+
+logger = logging.getLogger(__name__)
+
+# Telegram RPC method each fake client call stands for, as used by the request scheduler
+RPC_METHODS = {
+    'get_me': 'GetUsersRequest',
+    'get_dialogs': 'GetDialogsRequest',
+    'get_messages': 'GetHistoryRequest',
+    'get_entity': 'GetUsersRequest',
+    'resolve_username': 'ResolveUsernameRequest'
+}
+
+class FakeMessage:
+    """The attributes of a Telethon Message the forwarder reads."""
+
+    def __init__(self, message_id, text, date, out=False, sender_id=None):
+        self.id = message_id
+        self.text = self.message = self.raw_text = text
+        self.date = date
+        self.out = out
+        self.sender_id = sender_id
+        self.media = None
+        self.photo = self.video = self.audio = self.voice = None
+        self.document = self.sticker = self.gif = None
+
+class FakeNewMessageEvent:
+    """The attributes of a Telethon NewMessage event the forwarder's handler reads."""
+
+    def __init__(self, client, chat, sender, message):
+        self.client = client
+        self.chat = chat
+        self.sender = sender
+        self.message = message
+        self.chat_id = utils.get_peer_id(chat)
+        self.sender_id = sender.id if sender else None
+        self.out = message.out
+        self.media = message.media
+        self.photo = self.video = self.audio = self.voice = None
+        self.document = self.sticker = self.gif = None
+
+    async def get_chat(self):
+        """Get the chat; entities come with the update, so this makes no request."""
+        return self.chat
+
+    async def get_sender(self):
+        """Get the sender; entities come with the update, so this makes no request."""
+        return self.sender
+
+class FakeTelegramClient:
+    """
+    Offline Telegram client with synthetic chats.
+
+    Every RPC (get_me, get_dialogs, get_messages, get_entity) waits for a
+    latency drawn from the configured distribution and fails with a
+    FloodWaitError at flood_wait_rate. With a scheduler, requests are paced
+    and flood waits handled like ScheduledTelegramClient does. Dialogs are
+    real Telethon Dialog objects built from generated users, groups and
+    channels, and fire_messages() dispatches NewMessage events to the
+    registered handlers at a target rate.
+    """
+
+    def __init__(self, chat_count=50, muted_fraction=0.2, history_size=50, rpc_latency='0',
+                 flood_wait_rate=0.0, flood_wait_seconds=1, scheduler=None, priority=PRIORITY_LIVE,
+                 flood_sleep_threshold=60, seed=None):
+        """
+        Initialize the FakeTelegramClient.
+
+        Args:
+            chat_count: Number of synthetic chats (a third each users, groups and channels)
+            muted_fraction: Fraction of the chats that are muted
+            history_size: Messages of history per chat returned by get_messages
+            rpc_latency: RPC latency distribution (see mock_sms_gateway.parse_latency)
+            flood_wait_rate: Fraction of RPCs failing with a FloodWaitError
+            flood_wait_seconds: Seconds of the injected flood waits
+            scheduler: TelegramScheduler to pace requests with, or None
+            priority: Priority of the client's requests in the scheduler
+            flood_sleep_threshold: Flood waits up to this many seconds are waited out
+                when a scheduler is used, longer ones are raised
+            seed: Seed of the random generator, for reproducible runs
+        """
+        self.random = random.Random(seed)
+        self.latency = parse_latency(rpc_latency)
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.scheduler = scheduler
+        self.priority = priority
+        self.flood_sleep_threshold = flood_sleep_threshold
+        self.history_size = history_size
+        self.connected = False
+        self.handlers = []
+        self.disconnected = None
+        self.stats = {'rpcs': {}, 'flood_waits': 0, 'events': 0}
+
+        self.me = types.User(id=1000, first_name='Benchmark', last_name='User', username='benchmark',
+                             access_hash=self.random.getrandbits(63), is_self=True)
+        self.users = []
+        self.users_by_name = {}
+        self.dialogs = []
+        self.entities = {}
+        self.next_entity_id = 2000
+        self.next_message_id = history_size + 1
+        for i in range(chat_count):
+            kind = ('user', 'group', 'channel')[i % 3]
+            title = f"{kind.capitalize()} {i}"
+            self.add_chat(title, kind, muted=self.random.random() < muted_fraction)
+
+    def add_user(self, name):
+        """Get the synthetic user with a display name, creating it on first use."""
+        user = self.users_by_name.get(name)
+        if user is None:
+            first_name, _, last_name = name.partition(' ')
+            user = types.User(id=self.next_entity_id, first_name=first_name, last_name=last_name or None,
+                              access_hash=self.random.getrandbits(63))
+            self.next_entity_id += 1
+            self.users.append(user)
+            self.users_by_name[name] = user
+        return user
+
+    def add_chat(self, title, kind='group', muted=False):
+        """
+        Add a synthetic chat.
+
+        Args:
+            title: Chat title (the user's name for private chats)
+            kind: 'user', 'group' or 'channel'
+            muted: Whether the chat is muted
+
+        Returns:
+            Dialog: The chat's dialog
+        """
+        now = datetime.now(timezone.utc)
+        if kind == 'user':
+            entity = self.add_user(title)
+            peer = types.PeerUser(entity.id)
+        elif kind == 'group':
+            entity = types.Chat(id=self.next_entity_id, title=title, photo=types.ChatPhotoEmpty(),
+                                participants_count=10, date=now, version=1)
+            peer = types.PeerChat(entity.id)
+        else:
+            entity = types.Channel(id=self.next_entity_id, title=title, photo=types.ChatPhotoEmpty(), date=now,
+                                   broadcast=True, access_hash=self.random.getrandbits(63))
+            peer = types.PeerChannel(entity.id)
+        self.next_entity_id += 1
+
+        dialog = types.Dialog(
+            peer=peer, top_message=self.history_size, read_inbox_max_id=self.history_size, read_outbox_max_id=0,
+            unread_count=0, unread_mentions_count=0, unread_reactions_count=0,
+            notify_settings=types.PeerNotifySettings(mute_until=datetime(2038, 1, 1, tzinfo=timezone.utc) if muted else None)
+        )
+        message = FakeMessage(self.history_size, f"Last message in {title}", now)
+        dialog = Dialog(self, dialog, {utils.get_peer_id(entity): entity}, message)
+        self.dialogs.append(dialog)
+        self.entities[dialog.id] = entity
+        return dialog
+
+    @property
+    def loop(self):
+        return asyncio.get_running_loop()
+
+    async def rpc(self, name):
+        """Simulate one request: scheduling, latency and injected flood waits."""
+        method = RPC_METHODS[name]
+        while True:
+            if self.scheduler is not None:
+                await self.scheduler.acquire(method, self.priority)
+            self.stats['rpcs'][name] = self.stats['rpcs'].get(name, 0) + 1
+
+            delay = self.latency()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.random.random() >= self.flood_wait_rate:
+                if self.scheduler is not None:
+                    self.scheduler.on_success(method)
+                return
+
+            self.stats['flood_waits'] += 1
+            error = errors.FloodWaitError(request=None, capture=self.flood_wait_seconds)
+            if self.scheduler is None or self.flood_wait_seconds > self.flood_sleep_threshold:
+                raise error
+            self.scheduler.on_flood_wait(method, error.seconds)
+
+    async def connect(self):
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+        if self.disconnected is not None and not self.disconnected.done():
+            self.disconnected.set_result(None)
+
+    def is_connected(self):
+        return self.connected
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_me(self, input_peer=False):
+        await self.rpc('get_me')
+        return self.me
+
+    async def get_dialogs(self, limit=None, archived=None, **kwargs):
+        await self.rpc('get_dialogs')
+        dialogs = [dialog for dialog in self.dialogs if archived is None or dialog.archived == archived]
+        return dialogs[:limit] if limit is not None else dialogs
+
+    async def iter_dialogs(self, limit=None, archived=None, **kwargs):
+        for dialog in await self.get_dialogs(limit=limit, archived=archived):
+            yield dialog
+
+    async def get_entity(self, entity):
+        """Get a chat by marked ID, a username or an @username."""
+        if isinstance(entity, str):
+            await self.rpc('resolve_username')
+            name = entity.lstrip('@').casefold()
+            for candidate in self.entities.values():
+                if (getattr(candidate, 'username', None) or '').casefold() == name:
+                    return candidate
+            raise ValueError(f'No user has "{entity}" as username')
+
+        await self.rpc('get_entity')
+        entity_id = entity if isinstance(entity, int) else utils.get_peer_id(entity)
+        if entity_id not in self.entities:
+            raise ValueError(f"Could not find the input entity for {entity}")
+        return self.entities[entity_id]
+
+    async def get_messages(self, entity, limit=None, min_id=0, max_id=0, **kwargs):
+        """Get a chat's synthetic history, newest first."""
+        await self.rpc('get_messages')
+        now = datetime.now(timezone.utc)
+        newest = max_id - 1 if max_id else self.history_size
+        ids = [message_id for message_id in range(newest, 0, -1) if message_id > min_id]
+        if limit is not None:
+            ids = ids[:limit]
+        return [FakeMessage(message_id, f"Message {message_id}", now) for message_id in ids]
+
+    async def iter_messages(self, entity, limit=None, **kwargs):
+        for message in await self.get_messages(entity, limit=limit, **kwargs):
+            yield message
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append(callback)
+
+    def remove_event_handler(self, callback, event=None):
+        self.handlers.remove(callback)
+
+    def on(self, event):
+        """Decorator registering an event handler, like TelegramClient.on."""
+        def decorator(callback):
+            self.add_event_handler(callback, event)
+            return callback
+        return decorator
+
+    async def run_until_disconnected(self):
+        self.disconnected = asyncio.get_running_loop().create_future()
+        await self.disconnected
+
+    def make_event(self, dialog=None, text=None, out=False, sender=None):
+        """
+        Make a NewMessage event.
+
+        Args:
+            dialog: Dialog the message is in (a random one by default)
+            text: Message text (generated if None)
+            out: Whether the message was sent by the logged in user
+            sender: The sending user (the chat's user, or a random one, by default)
+        """
+        dialog = dialog or self.random.choice(self.dialogs)
+        if out:
+            sender = self.me
+        elif sender is None:
+            sender = dialog.entity if isinstance(dialog.entity, types.User) else self.random.choice(self.users or [self.me])
+        message_id = self.next_message_id
+        self.next_message_id += 1
+        if text is None:
+            text = f"Synthetic message {message_id} in {dialog.name}"
+        message = FakeMessage(message_id, text, datetime.now(timezone.utc), out=out, sender_id=sender.id)
+        return FakeNewMessageEvent(self, dialog.entity, sender, message)
+
+    async def dispatch(self, event):
+        """Run every registered handler on an event; returns the seconds it took."""
+        started_at = time.perf_counter()
+        self.stats['events'] += 1
+        for handler in list(self.handlers):
+            try:
+                await handler(event)
+            except Exception as e:
+                logger.error(f"Error in fake event handler: {e}", exc_info=True)
+        return time.perf_counter() - started_at
+
+    async def fire_messages(self, count, rate, make_event=None):
+        """
+        Fire NewMessage events at a target rate; like Telethon, handlers of different updates run concurrently.
+
+        Args:
+            count: Number of events
+            rate: Events per second (0 for as fast as possible)
+            make_event: Function taking the event's index and returning the event
+                (make_event() with defaults by default)
+
+        Returns:
+            list: Seconds each event's handlers took, in firing order
+        """
+        make_event = make_event or (lambda index: self.make_event())
+        started_at = time.perf_counter()
+        tasks = []
+        for index in range(count):
+            if rate:
+                delay = started_at + index / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.dispatch(make_event(index))))
+        return await asyncio.gather(*tasks)
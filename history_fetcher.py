@@ -0,0 +1,197 @@
+"""
+History Fetcher
+This module fetches the message history of many chats concurrently, pausing every
+request when Telegram answers with a flood wait and resuming each chat where it stopped.
+"""
+
+import os
+import asyncio
+import logging
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger(__name__)
+
+# History fetcher settings
+HISTORY_FETCH_CONCURRENCY = int(os.getenv('HISTORY_FETCH_CONCURRENCY', '4'))  # Chats fetched at the same time
+HISTORY_FETCH_PAGE_SIZE = 100  # Messages per request (Telegram's maximum)
+HISTORY_FETCH_MAX_FLOOD_WAITS = 5  # Flood waits a single chat may hit before it is given up
+
+class HistoryFetcher:
+    """
+    Concurrent, flood-aware fetcher of chat histories for one client.
+
+    Each chat is fetched page by page with get_messages, with at most
+    `concurrency` requests in flight. A FloodWaitError applies to the whole
+    account, so it pauses all requests until the wait the server asked for has
+    passed; the chat that hit it then continues from the last message it
+    received instead of starting over.
+    """
+
+    def __init__(self, client, concurrency=HISTORY_FETCH_CONCURRENCY, page_size=HISTORY_FETCH_PAGE_SIZE,
+                 max_flood_waits=HISTORY_FETCH_MAX_FLOOD_WAITS):
+        """
+        Initialize the HistoryFetcher.
+
+        Args:
+            client: A connected, authorized TelegramClient
+            concurrency: Maximum number of requests in flight
+            page_size: Messages requested per get_messages call
+            max_flood_waits: Flood waits a chat may hit before it is given up
+        """
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.page_size = page_size
+        self.max_flood_waits = max_flood_waits
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.resume_at = 0.0
+        self.incomplete = set()
+        self.stats = {'requests': 0, 'messages': 0, 'flood_waits': 0, 'flood_wait_seconds': 0}
+
+    async def wait_for_flood(self):
+        """Sleep until a pending flood wait has passed."""
+        loop = asyncio.get_running_loop()
+        while self.resume_at > loop.time():
+            await asyncio.sleep(self.resume_at - loop.time())
+
+    def on_flood_wait(self, seconds):
+        """Pause all requests for the number of seconds the server asked for."""
+        loop = asyncio.get_running_loop()
+        self.resume_at = max(self.resume_at, loop.time() + seconds)
+        self.stats['flood_waits'] += 1
+        self.stats['flood_wait_seconds'] += seconds
+        logger.warning(f"Flood wait of {seconds} seconds, pausing history requests")
+
+    async def fetch_chat(self, chat, limit, offset_id=0, min_id=0):
+        """
+        Fetch a chat's most recent messages.
+
+        Args:
+            chat: The chat entity
+            limit: Maximum number of messages
+            offset_id: Only fetch messages older than this message ID (0 for the newest)
+            min_id: Only fetch messages newer than this message ID
+
+        Returns:
+            list: Telethon messages, newest first; if the chat is given up after
+                too many flood waits its ID is added to self.incomplete
+        """
+        messages = []
+        flood_waits = 0
+
+        while len(messages) < limit:
+            request_limit = min(self.page_size, limit - len(messages))
+
+            await self.wait_for_flood()
+            async with self.semaphore:
+                # Another chat may have hit a flood wait while this one was queued
+                await self.wait_for_flood()
+                try:
+                    self.stats['requests'] += 1
+                    page = await self.client.get_messages(chat, limit=request_limit, offset_id=offset_id, min_id=min_id)
+                except FloodWaitError as e:
+                    flood_waits += 1
+                    self.on_flood_wait(e.seconds)
+                    if flood_waits > self.max_flood_waits:
+                        logger.error(f"Giving up on chat {getattr(chat, 'id', chat)} after {flood_waits} flood waits")
+                        self.incomplete.add(getattr(chat, 'id', chat))
+                        break
+                    continue
+
+            messages.extend(page)
+            if len(page) < request_limit:
+                break  # No older messages
+            offset_id = page[-1].id
+
+        self.stats['messages'] += len(messages)
+        return messages
+
+    async def iter_each(self, items, fetch):
+        """
+        Run fetch(item) for several items concurrently, yielding each result as soon as it is ready.
+
+        Only a window of items a little larger than the concurrency is in
+        progress at a time, so a slow consumer doesn't make finished results pile
+        up. Requests made by fetch are still limited by the semaphore.
+
+        Args:
+            items: List of items, e.g. chats
+            fetch: Coroutine function taking one item
+
+        Yields:
+            Tuples of (item index, result) in completion order; an item whose
+            fetch raised gets None
+        """
+        async def run(index):
+            try:
+                return index, await fetch(items[index])
+            except Exception as e:
+                logger.error(f"Error fetching history: {e}", exc_info=True)
+                return index, None
+
+        # Flood waits are handled here for all chats at once, so Telethon must
+        # raise them instead of sleeping inside a single request
+        flood_sleep_threshold = self.client.flood_sleep_threshold
+        self.client.flood_sleep_threshold = 0
+
+        window = self.concurrency * 2
+        next_index = 0
+        pending = set()
+        try:
+            while next_index < len(items) or pending:
+                while next_index < len(items) and len(pending) < window:
+                    pending.add(asyncio.ensure_future(run(next_index)))
+                    next_index += 1
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            self.client.flood_sleep_threshold = flood_sleep_threshold
+
+        logger.info(f"Fetched {self.stats['messages']} messages for {len(items)} chats with {self.stats['requests']} "
+                    f"requests ({self.stats['flood_waits']} flood waits, {self.stats['flood_wait_seconds']} seconds)")
+
+    async def iter_chats(self, requests):
+        """
+        Fetch the histories of several chats concurrently, yielding each chat as soon as it is complete.
+
+        Args:
+            requests: Tuples of (chat entity, limit) or (chat entity, limit, offset_id)
+
+        Yields:
+            Tuples of (request index, list of messages) in completion order; a chat
+            whose fetch failed gets an empty list and its ID is added to self.incomplete
+        """
+        async def fetch(request):
+            try:
+                return await self.fetch_chat(*request)
+            except Exception as e:
+                logger.error(f"Error getting messages from chat {getattr(request[0], 'id', request[0])}: {e}")
+                self.incomplete.add(getattr(request[0], 'id', request[0]))
+                return []
+
+        results = self.iter_each(requests, fetch)
+        try:
+            async for index, messages in results:
+                yield index, messages
+        finally:
+            # Cancel the remaining fetches when the consumer stops early
+            await results.aclose()
+
+    async def fetch_chats(self, requests):
+        """
+        Fetch the histories of several chats concurrently.
+
+        Args:
+            requests: Tuples of (chat entity, limit) or (chat entity, limit, offset_id)
+
+        Returns:
+            list: One list of messages per request, in request order; a chat whose
+                fetch failed gets an empty list and its ID is added to self.incomplete
+        """
+        histories = [[] for _ in requests]
+        async for index, messages in self.iter_chats(requests):
+            histories[index] = messages
+        return histories
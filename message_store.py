@@ -0,0 +1,491 @@
+"""
+Message Store
+This module keeps a local copy of every message the forwarder receives, so the web app
+can read recent history from SQLite instead of asking Telegram on every request.
+"""
+
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DATABASE_PATH = 'forwarder.db'
+
+# Message store settings
+STORE_BATCH_SIZE = 100  # Buffered messages that trigger an immediate write
+STORE_FLUSH_INTERVAL = 1.0  # Seconds between writes of buffered messages
+STORE_HEARTBEAT_INTERVAL = 30  # Seconds between forwarder heartbeats
+STORE_HEARTBEAT_GRACE = 90  # A heartbeat older than this means the store is no longer being fed
+
+class MessageStore:
+    """
+    SQLite store of received Telegram messages.
+
+    The forwarder adds every incoming message to an in-memory buffer that is
+    written with one batched insert per flush, and records a heartbeat while it
+    is running. Since the forwarder sees every new message, the store holds the
+    complete history of each chat from the moment ingestion started (the
+    coverage start) as long as the heartbeat is fresh; readers use that to
+    decide which messages they still have to fetch from Telegram.
+    """
+
+    def __init__(self, db_path=DATABASE_PATH, batch_size=STORE_BATCH_SIZE):
+        """
+        Initialize the MessageStore.
+
+        Args:
+            db_path: Path of the SQLite database
+            batch_size: Number of buffered messages that triggers a write
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.initialized = False
+
+    def get_db_connection(self):
+        """Get a database connection."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        """Create the message store tables and indexes if they don't exist."""
+        if self.initialized:
+            return
+
+        conn = self.get_db_connection()
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS stored_messages (
+                user_id INTEGER,
+                chat_id INTEGER,
+                message_id INTEGER,
+                chat_name TEXT,
+                sender_id INTEGER,
+                sender_name TEXT,
+                message_text TEXT,
+                media_type TEXT,
+                timestamp INTEGER,
+                is_outgoing BOOLEAN,
+                PRIMARY KEY (user_id, chat_id, message_id)
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_stored_messages_user_timestamp ON stored_messages (user_id, timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_stored_messages_chat_timestamp ON stored_messages (user_id, chat_id, timestamp)')
+
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS stored_chats (
+                user_id INTEGER,
+                chat_id INTEGER,
+                chat_name TEXT,
+                is_muted BOOLEAN DEFAULT 0,
+                is_archived BOOLEAN DEFAULT 0,
+                last_message_at INTEGER,
+                updated_at INTEGER,
+                history_from INTEGER,
+                history_filled_at INTEGER,
+                PRIMARY KEY (user_id, chat_id)
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_stored_chats_user_activity ON stored_chats (user_id, last_message_at)')
+
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS sync_cursors (
+                user_id INTEGER,
+                chat_id INTEGER,
+                min_message_id INTEGER,
+                max_message_id INTEGER,
+                synced_count INTEGER,
+                synced_at INTEGER,
+                PRIMARY KEY (user_id, chat_id)
+            )
+            ''')
+
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS message_store_status (
+                user_id INTEGER PRIMARY KEY,
+                started_at INTEGER,
+                heartbeat_at INTEGER
+            )
+            ''')
+            conn.commit()
+            self.initialized = True
+        except Exception as e:
+            logger.error(f"Error initializing message store: {str(e)}")
+        finally:
+            conn.close()
+
+    def add_message(self, user_id, chat_id, message_id, chat_name, sender_id, sender_name, message_text,
+                    media_type, timestamp, is_outgoing=False):
+        """
+        Buffer a received message for the next batched write.
+
+        A full buffer is written right away, in the default executor when
+        called from an event loop.
+
+        Args:
+            user_id: The user's Telegram ID
+            chat_id: The chat's entity ID
+            message_id: The message ID within the chat
+            chat_name: Display name of the chat
+            sender_id: The sender's ID, or None
+            sender_name: Display name of the sender
+            message_text: The message text without the media prefix
+            media_type: Media type such as "Photo", or None for text messages
+            timestamp: Unix timestamp of the message
+            is_outgoing: True for messages sent by the user
+        """
+        with self.lock:
+            self.buffer.append((user_id, chat_id, message_id, chat_name, sender_id, sender_name,
+                                message_text or "", media_type, int(timestamp), 1 if is_outgoing else 0))
+            should_flush = len(self.buffer) >= self.batch_size
+
+        if should_flush:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+            else:
+                # Called from the forwarder's handler: write the batch without blocking its event loop
+                loop.run_in_executor(None, self.flush)
+
+    def flush(self):
+        """
+        Write all buffered messages with a single transaction.
+
+        Returns:
+            int: Number of messages written
+        """
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+
+        if rows:
+            self.save_messages(rows)
+        return len(rows)
+
+    def save_messages(self, rows):
+        """
+        Insert message rows and update the activity of their chats.
+
+        Args:
+            rows: Tuples in stored_messages column order (see add_message)
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            conn.executemany(
+                '''INSERT OR IGNORE INTO stored_messages
+                (user_id, chat_id, message_id, chat_name, sender_id, sender_name, message_text, media_type, timestamp, is_outgoing)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                rows
+            )
+
+            # Keep the chat list's names and last activity in step with the messages
+            now = int(time.time())
+            conn.executemany(
+                '''INSERT INTO stored_chats (user_id, chat_id, chat_name, last_message_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, chat_id) DO UPDATE SET
+                chat_name = excluded.chat_name,
+                last_message_at = MAX(COALESCE(last_message_at, 0), excluded.last_message_at)''',
+                [(row[0], row[1], row[3], row[8], now) for row in rows]
+            )
+            conn.commit()
+            logger.debug(f"Stored {len(rows)} messages")
+        except Exception as e:
+            logger.error(f"Error storing messages: {str(e)}")
+            conn.rollback()
+        finally:
+            conn.close()
+
+    def save_chats(self, user_id, chats):
+        """
+        Store chat metadata from a dialog listing.
+
+        Args:
+            user_id: The user's Telegram ID
+            chats: Dictionaries with chat_id, chat_name, is_muted, is_archived and last_message_at
+        """
+        self.init_db()
+        now = int(time.time())
+        conn = self.get_db_connection()
+        try:
+            conn.executemany(
+                '''INSERT INTO stored_chats (user_id, chat_id, chat_name, is_muted, is_archived, last_message_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, chat_id) DO UPDATE SET
+                chat_name = excluded.chat_name, is_muted = excluded.is_muted, is_archived = excluded.is_archived,
+                last_message_at = MAX(COALESCE(last_message_at, 0), excluded.last_message_at),
+                updated_at = excluded.updated_at''',
+                [(user_id, chat['chat_id'], chat['chat_name'], 1 if chat['is_muted'] else 0,
+                  1 if chat['is_archived'] else 0, int(chat['last_message_at'] or 0), now) for chat in chats]
+            )
+            conn.commit()
+            logger.info(f"Stored metadata for {len(chats)} chats")
+        except Exception as e:
+            logger.error(f"Error storing chats: {str(e)}")
+            conn.rollback()
+        finally:
+            conn.close()
+
+    def mark_history(self, user_id, chat_id, history_from):
+        """
+        Record that a chat's messages back to history_from were copied from Telegram.
+
+        Args:
+            user_id: The user's Telegram ID
+            chat_id: The chat's entity ID
+            history_from: Unix timestamp of the oldest copied message, or 0 if
+                the chat's whole history was copied
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            conn.execute(
+                'UPDATE stored_chats SET history_from = ?, history_filled_at = ? WHERE user_id = ? AND chat_id = ?',
+                (int(history_from), int(time.time()), user_id, chat_id)
+            )
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error recording stored history: {str(e)}")
+        finally:
+            conn.close()
+
+    def heartbeat(self, user_id, starting=False):
+        """
+        Record that the forwarder is feeding the store.
+
+        Args:
+            user_id: The user's Telegram ID
+            starting: True when ingestion (re)starts; the coverage start is reset
+                unless the previous heartbeat is recent enough that no message
+                can have been missed
+        """
+        self.init_db()
+        now = int(time.time())
+        conn = self.get_db_connection()
+        try:
+            status = conn.execute('SELECT heartbeat_at FROM message_store_status WHERE user_id = ?', (user_id,)).fetchone()
+            if status is None:
+                conn.execute('INSERT INTO message_store_status (user_id, started_at, heartbeat_at) VALUES (?, ?, ?)',
+                             (user_id, now, now))
+            elif starting and now - (status['heartbeat_at'] or 0) > STORE_HEARTBEAT_GRACE:
+                logger.info(f"Message store coverage restarts for user {user_id}")
+                conn.execute('UPDATE message_store_status SET started_at = ?, heartbeat_at = ? WHERE user_id = ?',
+                             (now, now, user_id))
+            else:
+                conn.execute('UPDATE message_store_status SET heartbeat_at = ? WHERE user_id = ?', (now, user_id))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error updating message store heartbeat: {str(e)}")
+        finally:
+            conn.close()
+
+    def get_coverage_start(self, user_id):
+        """
+        Get the time from which the store holds every message of the user's chats.
+
+        Returns:
+            int: Unix timestamp of the coverage start, or None if the forwarder
+                is not feeding the store (no recent heartbeat)
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            status = conn.execute('SELECT started_at, heartbeat_at FROM message_store_status WHERE user_id = ?',
+                                  (user_id,)).fetchone()
+        except Exception as e:
+            logger.error(f"Error reading message store status: {str(e)}")
+            return None
+        finally:
+            conn.close()
+
+        if not status or time.time() - (status['heartbeat_at'] or 0) > STORE_HEARTBEAT_GRACE:
+            return None
+        return status['started_at']
+
+    @staticmethod
+    def get_complete_since(chat, coverage_start):
+        """
+        Get the time from which the store holds every message of one chat.
+
+        Ingestion covers everything since coverage_start. History copied from
+        Telegram during the same coverage period joins up with it, so the chat
+        is complete back to the oldest copied message.
+
+        Args:
+            chat: Chat row from get_chats
+            coverage_start: Result of get_coverage_start
+
+        Returns:
+            int: Unix timestamp
+        """
+        if chat.get('history_filled_at') and chat['history_filled_at'] >= coverage_start:
+            return min(chat['history_from'], coverage_start)
+        return coverage_start
+
+    def get_chats(self, user_id, include_muted=True, include_archived=True, limit=None):
+        """
+        Get stored chats, most recently active first.
+
+        Returns:
+            list: Chat rows as dictionaries
+        """
+        self.init_db()
+        query = 'SELECT * FROM stored_chats WHERE user_id = ?'
+        if not include_muted:
+            query += ' AND is_muted = 0'
+        if not include_archived:
+            query += ' AND is_archived = 0'
+        query += ' ORDER BY last_message_at DESC'
+        params = [user_id]
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        conn = self.get_db_connection()
+        try:
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+        except Exception as e:
+            logger.error(f"Error reading stored chats: {str(e)}")
+            return []
+        finally:
+            conn.close()
+
+    def get_chat(self, user_id, chat_id):
+        """
+        Get one stored chat.
+
+        Returns:
+            dict: The chat row, or None if the chat is not stored
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            row = conn.execute('SELECT * FROM stored_chats WHERE user_id = ? AND chat_id = ?', (user_id, chat_id)).fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error reading stored chat: {str(e)}")
+            return None
+        finally:
+            conn.close()
+
+    def get_chat_messages(self, user_id, chat_id, limit, since=None):
+        """
+        Get a chat's most recent stored messages.
+
+        Args:
+            user_id: The user's Telegram ID
+            chat_id: The chat's entity ID
+            limit: Maximum number of messages
+            since: Only return messages at or after this Unix timestamp
+
+        Returns:
+            list: Message rows as dictionaries, newest first
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            rows = conn.execute(
+                '''SELECT * FROM stored_messages WHERE user_id = ? AND chat_id = ? AND timestamp >= ?
+                ORDER BY timestamp DESC, message_id DESC LIMIT ?''',
+                (user_id, chat_id, since or 0, limit)
+            ).fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error reading stored messages: {str(e)}")
+            return []
+        finally:
+            conn.close()
+
+    def get_sync_cursor(self, user_id, chat_id):
+        """
+        Get a chat's sync cursor.
+
+        The store holds every message of the chat with an ID from min_message_id
+        (0 for the start of the chat) to max_message_id; synced_count is the
+        number of Telegram messages in that range, including ones without text
+        or media that are not stored.
+
+        Returns:
+            dict: The cursor row, or None if the chat was never synced
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            row = conn.execute('SELECT * FROM sync_cursors WHERE user_id = ? AND chat_id = ?', (user_id, chat_id)).fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error reading sync cursor: {str(e)}")
+            return None
+        finally:
+            conn.close()
+
+    def save_sync_cursor(self, user_id, chat_id, min_message_id, max_message_id, synced_count):
+        """Store a chat's sync cursor (see get_sync_cursor)."""
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            conn.execute(
+                '''INSERT OR REPLACE INTO sync_cursors (user_id, chat_id, min_message_id, max_message_id, synced_count, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?)''',
+                (user_id, chat_id, min_message_id, max_message_id, synced_count, int(time.time()))
+            )
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error saving sync cursor: {str(e)}")
+        finally:
+            conn.close()
+
+    def get_chat_messages_in_range(self, user_id, chat_id, min_message_id, max_message_id, limit):
+        """
+        Get a chat's most recent stored messages within a message ID range.
+
+        Returns:
+            list: Message rows as dictionaries, newest first
+        """
+        self.init_db()
+        conn = self.get_db_connection()
+        try:
+            rows = conn.execute(
+                '''SELECT * FROM stored_messages WHERE user_id = ? AND chat_id = ? AND message_id BETWEEN ? AND ?
+                ORDER BY message_id DESC LIMIT ?''',
+                (user_id, chat_id, min_message_id, max_message_id, limit)
+            ).fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error reading stored messages: {str(e)}")
+            return []
+        finally:
+            conn.close()
+
+    async def run(self, user_id, flush_interval=STORE_FLUSH_INTERVAL):
+        """
+        Flush buffered messages and send heartbeats until cancelled.
+
+        Args:
+            user_id: The user's Telegram ID
+            flush_interval: Seconds between flushes
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: self.heartbeat(user_id, starting=True))
+        last_heartbeat = time.monotonic()
+
+        try:
+            while True:
+                await asyncio.sleep(flush_interval)
+                await loop.run_in_executor(None, self.flush)
+                if time.monotonic() - last_heartbeat >= STORE_HEARTBEAT_INTERVAL:
+                    await loop.run_in_executor(None, self.heartbeat, user_id)
+                    last_heartbeat = time.monotonic()
+        finally:
+            # Don't lose the last batch on shutdown
+            self.flush()
+
+# Create a global instance of the message store
+message_store = MessageStore()
@@ -10,6 +10,7 @@ from collections import defaultdict
 import time
 import threading
 import config  # Import the config module
+from extractive_summarizer import ExtractiveSummarizer, SUMMARY_ENGINE
 
 # Configure logging
 logging.basicConfig(
@@ -68,6 +69,11 @@ class MessageSummarizer:
         
         # Compile patterns for efficiency
         self.compiled_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in self.sensitive_patterns]
+        
+        # Summarization engine: 'extractive', or 'truncate' for any other SUMMARY_ENGINE
+        self.engine = 'extractive' if SUMMARY_ENGINE == 'extractive' else 'truncate'
+        self.extractive_summarizer = ExtractiveSummarizer(max_length=max_summary_length)
+        logger.info(f"Using '{self.engine}' summarization engine")
     
     def add_message(self, chat_id, message_text, sender_name):
         """
@@ -155,6 +161,9 @@ class MessageSummarizer:
         if not messages:
             return ""
         
+        if self.engine == 'extractive':
+            return self.summarize_messages_extractive(messages)
+        
         # Group messages by sender
         sender_messages = defaultdict(list)
         for msg in messages:
@@ -188,6 +197,27 @@ class MessageSummarizer:
         
         return summary
     
+    def summarize_messages_extractive(self, messages):
+        """
+        Summarize a list of messages by picking their most representative sentences.
+        
+        Args:
+            messages (list): A list of message dictionaries.
+        
+        Returns:
+            str: The summarized message.
+        """
+        # Rank the raw messages and filter only the selected sentences, which is much
+        # cheaper than running the sensitive patterns over the whole conversation
+        summary = self.extractive_summarizer.summarize(messages, max_length=self.max_summary_length)
+        summary = self.filter_sensitive_content(summary)
+        
+        # Ensure the summary is not too long after filtering
+        if len(summary) > self.max_summary_length:
+            summary = summary[:self.max_summary_length-3] + "..."
+        
+        return summary
+    
     def filter_sensitive_content(self, text):
         """
         Filter out sensitive content from text.
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Mock SMS Gateway
+This module runs a local stand-in for the SMSC and SMS-PROSTO HTTP APIs, with configurable
+latency, error rates and rate limits, so the send path can be load-tested without sending
+real (paid) SMS. Point the providers at it with SMSC_API_URL=http://host:port/sys and
+SMSPROSTO_API_URL=http://host:port.
+"""
+
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Default port of the mock gateway
+MOCK_GATEWAY_PORT = 8099
+
+# SMSC error codes returned by the mock
+SMSC_ERROR_SERVICE = 3  # Used for injected errors
+SMSC_ERROR_TOO_MANY_REQUESTS = 9
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution.
+
+    Args:
+        spec: "constant:S", "uniform:MIN:MAX", "normal:MEAN:STDDEV",
+            "lognormal:MEDIAN:SIGMA" or "exponential:MEAN", in seconds;
+            a plain number is a constant latency
+
+    Returns:
+        function: Function without arguments returning a latency in seconds
+    """
+    name, _, args = str(spec).partition(':')
+    try:
+        if not args:
+            value = float(name)
+            return lambda: value
+        values = [float(value) for value in args.split(':')]
+        if name == 'constant':
+            return lambda: values[0]
+        if name == 'uniform':
+            return lambda: random.uniform(values[0], values[1])
+        if name == 'normal':
+            return lambda: max(0.0, random.gauss(values[0], values[1]))
+        if name == 'lognormal':
+            return lambda: values[0] * random.lognormvariate(0, values[1])
+        if name == 'exponential':
+            return lambda: random.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    except (ValueError, IndexError):
+        pass
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+class TokenBucket:
+    """Requests-per-second limit with a burst of one second's worth of requests (at least one)."""
+
+    def __init__(self, rate):
+        """
+        Initialize the TokenBucket.
+
+        Args:
+            rate: Requests per second
+        """
+        self.rate = rate
+        # Below one request per second the bucket must still hold a whole token
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token; returns False if the limit is exceeded."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+class MockSMSGateway:
+    """
+    Local HTTP server implementing the provider API calls used by sms_providers.py.
+
+    SMSC: /sys/send.php, /sys/balance.php and /sys/status.php (fmt=3).
+    SMS-PROSTO: /messages/send and /balance. Each request waits for a latency
+    drawn from the configured distribution; then it may be rejected by the
+    rate limit, fail with an HTTP 500, or get an API error. Accepted messages
+    are kept in memory and reported delivered (or undeliverable, at the
+    delivery failure rate) once their delivery delay has passed.
+    """
+
+    def __init__(self, latency='0', error_rate=0.0, http_error_rate=0.0, rate_limit=None,
+                 delivery_failure_rate=0.0, delivery_delay=0.0, cost=1.5, balance=1000.0):
+        """
+        Initialize the MockSMSGateway.
+
+        Args:
+            latency: Latency distribution (see parse_latency)
+            error_rate: Fraction of requests answered with an API error
+            http_error_rate: Fraction of requests answered with HTTP 500
+            rate_limit: Maximum requests per second, or None for no limit
+            delivery_failure_rate: Fraction of accepted messages that are never delivered
+            delivery_delay: Seconds from sending until a message is reported delivered
+            cost: Cost of one message
+            balance: Starting account balance
+        """
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.delivery_failure_rate = delivery_failure_rate
+        self.delivery_delay = delivery_delay
+        self.cost = cost
+        self.balance = balance
+        self.messages = {}
+        self.next_id = 1
+        self.stats = {'requests': 0, 'sent': 0, 'status_requests': 0, 'errors': 0, 'http_errors': 0, 'rate_limited': 0}
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        """Base URL of the running server."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def send(self, phones):
+        """Accept a message; returns its ID."""
+        now = time.time()
+        with self.lock:
+            message_id = self.next_id
+            self.next_id += 1
+            self.messages[message_id] = {
+                'phone': phones,
+                'sent_at': now,
+                'final_at': now + self.delivery_delay,
+                'delivered': random.random() >= self.delivery_failure_rate
+            }
+            self.balance -= self.cost
+            self.stats['sent'] += 1
+        return message_id
+
+    def get_status(self, message_id):
+        """Get an SMSC status.php entry of a message."""
+        message = self.messages.get(message_id)
+        if message is None:
+            return {'id': message_id, 'status': -3, 'err': 0}
+
+        now = time.time()
+        if now < message['final_at']:
+            status, last_timestamp = 0, int(message['sent_at'])
+        else:
+            status, last_timestamp = (1 if message['delivered'] else 20), int(message['final_at'])
+        return {
+            'id': message_id,
+            'phone': message['phone'],
+            'status': status,
+            'last_timestamp': last_timestamp,
+            'send_timestamp': int(message['sent_at']),
+            'cost': f"{self.cost:.2f}",
+            'err': 0 if status != 20 else 1
+        }
+
+    def handle(self, path, params):
+        """
+        Handle one API request.
+
+        Returns:
+            tuple: (HTTP status, response data)
+        """
+        self.count('requests')
+        delay = self.latency()
+        if delay > 0:
+            time.sleep(delay)
+
+        smsc = path.startswith('/sys/')
+        if self.rate_limiter is not None and not self.rate_limiter.try_acquire():
+            self.count('rate_limited')
+            if smsc:
+                return 200, {'error': 'too many concurrent requests', 'error_code': SMSC_ERROR_TOO_MANY_REQUESTS}
+            return 429, {'status': 'error', 'message': 'Too many requests'}
+        if random.random() < self.http_error_rate:
+            self.count('http_errors')
+            return 500, {'error': 'internal error'}
+        if random.random() < self.error_rate:
+            self.count('errors')
+            if smsc:
+                return 200, {'error': 'service is temporarily unavailable', 'error_code': SMSC_ERROR_SERVICE}
+            return 200, {'status': 'error', 'message': 'Service is temporarily unavailable'}
+
+        if path == '/sys/send.php':
+            return 200, {'id': self.send(params.get('phones', '')), 'cnt': 1, 'cost': f"{self.cost:.2f}"}
+        if path == '/sys/balance.php':
+            return 200, {'balance': f"{self.balance:.2f}", 'currency': 'RUB'}
+        if path == '/sys/status.php':
+            self.count('status_requests')
+            ids = [int(message_id) for message_id in params.get('id', '').split(',') if message_id.strip().isdigit()]
+            statuses = [self.get_status(message_id) for message_id in ids]
+            return 200, statuses if len(statuses) != 1 else statuses[0]
+        if path == '/messages/send':
+            return 200, {'status': 'ok', 'id': self.send(params.get('phone', ''))}
+        if path == '/balance':
+            return 200, {'status': 'ok', 'balance': round(self.balance, 2)}
+        if path == '/stats':
+            with self.lock:
+                return 200, dict(self.stats, messages=len(self.messages))
+        return 404, {'error': 'not found'}
+
+    def start(self, host='127.0.0.1', port=0):
+        """
+        Start serving in a daemon thread.
+
+        Args:
+            host: Interface to listen on
+            port: Port to listen on (0 for any free port)
+
+        Returns:
+            str: The base URL
+        """
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real APIs
+            # Send headers and body in one segment, without waiting for delayed ACKs
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def respond(self, params):
+                status, data = gateway.handle(urlsplit(self.path).path, params)
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                params = parse_qs(urlsplit(self.path).query)
+                self.respond({key: values[-1] for key, values in params.items()})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                params = parse_qs(self.rfile.read(length).decode('utf-8'))
+                params.update(parse_qs(urlsplit(self.path).query))
+                self.respond({key: values[-1] for key, values in params.items()})
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mock-sms-gateway', daemon=True)
+        self.thread.start()
+        logger.info(f"Mock SMS gateway listening on {self.url}")
+        return self.url
+
+    def stop(self):
+        """Stop the server."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a mock SMSC / SMS-PROSTO gateway for load testing')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=MOCK_GATEWAY_PORT, help='Port to listen on')
+    parser.add_argument('--latency', default='0', help='Latency distribution, e.g. lognormal:0.05:0.5 (see parse_latency)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an API error')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--rate-limit', type=float, help='Maximum requests per second')
+    parser.add_argument('--delivery-failure-rate', type=float, default=0.0, help='Fraction of messages never delivered')
+    parser.add_argument('--delivery-delay', type=float, default=0.0, help='Seconds until a message is delivered')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    gateway = MockSMSGateway(latency=args.latency, error_rate=args.error_rate, http_error_rate=args.http_error_rate,
+                             rate_limit=args.rate_limit, delivery_failure_rate=args.delivery_failure_rate,
+                             delivery_delay=args.delivery_delay)
+    url = gateway.start(args.host, args.port)
+    print(f"SMSC_API_URL={url}/sys")
+    print(f"SMSPROSTO_API_URL={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        gateway.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Provider Health
+This module checks the SMS provider's balance and latency in the background and caches
+the result, so status pages and forwarder restarts read the last check instead of making
+a remote balance request each time.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Path of the health state shared by the web app and the forwarder process
+PROVIDER_HEALTH_FILE = 'provider_health.json'
+
+# Seconds between provider checks
+PROVIDER_HEALTH_INTERVAL = int(os.getenv('PROVIDER_HEALTH_INTERVAL', '300'))
+
+# Fraction of the interval the time between checks is randomly varied by
+PROVIDER_HEALTH_JITTER = 0.1
+
+# Balance below which a low balance warning is shown
+PROVIDER_LOW_BALANCE = float(os.getenv('PROVIDER_LOW_BALANCE', '50'))
+
+class ProviderHealth:
+    """
+    Cached health of the SMS provider.
+
+    A daemon thread checks the provider (a balance request, timed) every
+    interval, varied by a random jitter so the web app and the forwarder
+    process don't line up. The result is kept in memory and written to
+    PROVIDER_HEALTH_FILE; a process skips its check when the other one
+    checked recently, so together they make about one provider round trip
+    per interval.
+    """
+
+    def __init__(self, state_file=PROVIDER_HEALTH_FILE, interval=PROVIDER_HEALTH_INTERVAL,
+                 low_balance=PROVIDER_LOW_BALANCE):
+        """
+        Initialize the ProviderHealth.
+
+        Args:
+            state_file: Path of the shared health state file
+            interval: Seconds between checks
+            low_balance: Balance below which low_balance is set
+        """
+        self.state_file = state_file
+        self.interval = interval
+        self.low_balance = low_balance
+        self.state = None
+        self.state_mtime = None
+        self.thread = None
+        self.lock = threading.Lock()
+        # Held during a check, so concurrent callers wait for it instead of checking too
+        self.check_lock = threading.Lock()
+
+    def load_state(self):
+        """Pick up a check written by the other process."""
+        try:
+            mtime = os.path.getmtime(self.state_file)
+        except OSError:
+            return
+        if mtime == self.state_mtime:
+            return
+
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            self.state_mtime = mtime
+        except Exception as e:
+            logger.debug(f"Error reading provider health: {e}")
+            return
+
+        if self.state is None or state.get('checked_at', 0) > self.state['checked_at']:
+            self.state = state
+
+    def save_state(self):
+        """Write the last check for the other process."""
+        try:
+            temp_file = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(temp_file, self.state_file)
+            self.state_mtime = os.path.getmtime(self.state_file)
+        except Exception as e:
+            logger.error(f"Error saving provider health: {e}")
+
+    @staticmethod
+    def get_provider_name(provider):
+        """Get the name a provider's health state is stored under."""
+        return provider.__class__.__name__.replace('Provider', '')
+
+    def check(self, provider):
+        """
+        Check a provider now and cache the result.
+
+        Args:
+            provider: The SMSProvider to check
+
+        Returns:
+            dict: The health state (see get)
+        """
+        with self.check_lock:
+            return self.check_locked(provider)
+
+    def check_locked(self, provider):
+        """Check a provider now; the caller holds check_lock."""
+        started_at = time.monotonic()
+        try:
+            balance = provider.get_balance()
+            ok, error = True, None
+        except Exception as e:
+            balance, ok, error = None, False, str(e)
+        latency_ms = int((time.monotonic() - started_at) * 1000)
+
+        state = {
+            'provider': self.get_provider_name(provider),
+            'ok': ok,
+            'balance': balance,
+            'low_balance': balance is not None and balance < self.low_balance,
+            'latency_ms': latency_ms,
+            'error': error,
+            'checked_at': time.time()
+        }
+        with self.lock:
+            self.state = state
+            self.save_state()
+
+        if not ok:
+            logger.error(f"SMS provider check failed after {latency_ms} ms: {error}")
+        elif state['low_balance']:
+            logger.warning(f"SMS provider balance is low: {balance} (warning below {self.low_balance})")
+        else:
+            logger.info(f"SMS provider healthy: balance {balance}, {latency_ms} ms")
+        return dict(state, age=0.0)
+
+    def get(self):
+        """
+        Get the last check without contacting the provider.
+
+        Returns:
+            dict: provider, ok, balance, low_balance, latency_ms, error,
+                checked_at and age (seconds since the check), or None if the
+                provider was never checked
+        """
+        with self.lock:
+            self.load_state()
+            if self.state is None:
+                return None
+            return dict(self.state, age=round(time.time() - self.state['checked_at'], 1))
+
+    def is_usable(self, state, provider, max_age):
+        """Check whether a health state is recent enough and belongs to the provider."""
+        return (state is not None and state['age'] <= max_age
+                and state['provider'] == self.get_provider_name(provider))
+
+    def get_or_check(self, get_provider, max_age=None):
+        """
+        Get the last check of the provider, checking it first if there is none recent enough.
+
+        Only one check runs at a time; callers arriving during a check wait
+        for it and use its result.
+
+        Args:
+            get_provider: Function returning the SMSProvider to check
+            max_age: Maximum age in seconds of a usable check. By default this
+                is the longest time between two background checks, so callers
+                only wait for the provider when the background thread isn't running.
+
+        Returns:
+            dict: The health state (see get)
+        """
+        if max_age is None:
+            # Allow for the jitter on both sides of the interval and the check's own latency
+            max_age = self.interval * (1 + 2 * PROVIDER_HEALTH_JITTER)
+
+        provider = get_provider()
+        state = self.get()
+        if self.is_usable(state, provider, max_age):
+            return state
+
+        with self.check_lock:
+            # Another caller may have checked while this one waited
+            state = self.get()
+            if self.is_usable(state, provider, max_age):
+                return state
+            return self.check_locked(provider)
+
+    def start(self, get_provider):
+        """
+        Start checking the provider in a daemon thread, if that isn't running yet.
+
+        Args:
+            get_provider: Function returning the SMSProvider to check
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, args=(get_provider,), name='provider-health', daemon=True)
+            self.thread.start()
+
+    def run(self, get_provider):
+        """Thread target: check the provider every interval, with jitter."""
+        while True:
+            try:
+                # Skip the check if the other process made one recently
+                self.get_or_check(get_provider, max_age=self.interval / 2)
+            except Exception as e:
+                logger.error(f"Error checking SMS provider health: {e}")
+
+            jitter = random.uniform(-PROVIDER_HEALTH_JITTER, PROVIDER_HEALTH_JITTER)
+            time.sleep(self.interval * (1 + jitter))
+
+# Create a global instance of the provider health
+provider_health = ProviderHealth()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Replay Messages
+This script replays real message history from telegram_messages.csv (or the telegram_messages
+table) as timed NewMessage events through the forwarder's pipeline - chat filter, rate limiter,
+summarizer, SMS formatter and provider - against a fake Telegram client and a mock SMS gateway,
+and reports throughput, end-to-end latency, SMS and segment counts and why messages were dropped.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import contextvars
+
+from benchmark_utils import set_offline_environment, parse_timestamp, load_history_csv, percentile
+
+set_offline_environment('replay')
+
+import config
+import rate_limiter
+import sms_providers
+import start_forwarder
+from fake_telegram import FakeTelegramClient
+from mock_sms_gateway import MockSMSGateway
+from message_store import message_store
+from delivery_reports import delivery_reports
+from message_summarizer import MessageSummarizer
+
+# Keep the output readable; rate limited messages are expected and reported below
+logging.getLogger().setLevel(logging.WARNING)
+logging.getLogger('start_forwarder').setLevel(logging.ERROR)
+
+# Characters of the GSM 03.38 default alphabet; the extension table's take two septets
+GSM7_BASIC_CHARS = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED_CHARS = set("^{}\\[~]|€\f")
+
+# Scheduled time of the event being handled, for end-to-end latency of direct sends
+event_scheduled_at = contextvars.ContextVar('event_scheduled_at', default=None)
+
+def count_sms_segments(text):
+    """
+    Count the SMS segments a text is sent as.
+
+    GSM-7 texts fit 160 characters in one SMS and 153 per segment of a
+    concatenated one; anything else (e.g. Cyrillic or emoji) is sent as
+    UCS-2, 70 UTF-16 code units in one SMS and 67 per segment.
+
+    Args:
+        text: The SMS text
+
+    Returns:
+        int: Number of segments
+    """
+    if all(char in GSM7_BASIC_CHARS or char in GSM7_EXTENDED_CHARS for char in text):
+        length = sum(2 if char in GSM7_EXTENDED_CHARS else 1 for char in text)
+        single, segment = 160, 153
+    else:
+        length = len(text.encode('utf-16-le')) // 2
+        single, segment = 70, 67
+    if length <= single:
+        return 1
+    return -(-length // segment)
+
+def load_db(db_path, user_id=None):
+    """Load messages from the telegram_messages table, optionally of one user."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        query = 'SELECT timestamp, chat_name, sender_name, message_text FROM telegram_messages'
+        params = ()
+        if user_id is not None:
+            query += ' WHERE user_id = ?'
+            params = (user_id,)
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+    return [{
+        'timestamp': parse_timestamp(row['timestamp']),
+        'chat_name': row['chat_name'] or 'Unknown Chat',
+        'sender_name': row['sender_name'] or 'Unknown',
+        'message_text': row['message_text'] or ''
+    } for row in rows]
+
+def schedule(messages, compression, max_gap):
+    """
+    Sort messages oldest first and give each a replay offset.
+
+    Args:
+        messages: Messages with a 'timestamp'
+        compression: How many times faster than real time to replay
+        max_gap: Idle gaps between messages are capped at this many (real) seconds
+
+    Returns:
+        list: The messages, each with an 'offset' in seconds from the start of the replay
+    """
+    messages = sorted(messages, key=lambda message: message['timestamp'])
+    offset = 0.0
+    for previous, message in zip([None] + messages, messages):
+        if previous is not None:
+            offset += min(message['timestamp'] - previous['timestamp'], max_gap) / compression
+        message['offset'] = offset
+    return messages
+
+class RecordingProvider:
+    """SMS provider wrapper recording what was sent, its segments and end-to-end latency."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.sent = []
+        self.segments = 0
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+    def send_sms(self, message, phone_number):
+        result = self.provider.send_sms(message, phone_number)
+        if result:
+            scheduled_at = event_scheduled_at.get()
+            with self.lock:
+                self.sent.append(message)
+                self.segments += count_sms_segments(message)
+                if scheduled_at is not None:
+                    self.latencies.append(time.time() - scheduled_at)
+        return result
+
+class ReplayRateLimiter(rate_limiter.RateLimiter):
+    """RateLimiter with time-compressed windows that counts why messages were limited."""
+
+    def __init__(self, compression, **limits):
+        self.compression = compression
+        self.reasons = {}
+        super().__init__(**limits)
+        self.time_window /= compression
+        self.chat_window /= compression
+        self.daily_reset_time = time.time() + 86400 / compression
+
+    def can_send_message(self, chat_id):
+        # The day is compressed too
+        current_time = time.time()
+        if current_time > self.daily_reset_time:
+            self.daily_counter = 0
+            self.daily_reset_time = current_time + 86400 / self.compression
+
+        can_send, reason = super().can_send_message(chat_id)
+        if not can_send:
+            limit = reason.split(':')[0]
+            self.reasons[limit] = self.reasons.get(limit, 0) + 1
+        return can_send, reason
+
+class ReplaySummarizer(MessageSummarizer):
+    """
+    MessageSummarizer that sends each summary when its chat's timer fires.
+
+    The summary goes through the rate limiter, format_summary_sms and the
+    provider; the end-to-end latency of every summarized message is measured
+    from when it was added.
+    """
+
+    def __init__(self, provider, rate_limiter, phone_number, chat_names, **kwargs):
+        super().__init__(**kwargs)
+        self.provider = provider
+        self.rate_limiter = rate_limiter
+        self.phone_number = phone_number
+        self.chat_names = chat_names
+        self.local = threading.local()
+        self.stats = {}
+        self.latencies = []
+        self.stats_lock = threading.Lock()
+
+    def count(self, outcome, count=1):
+        with self.stats_lock:
+            self.stats[outcome] = self.stats.get(outcome, 0) + count
+
+    def summarize_messages(self, messages):
+        self.local.timestamps = [message['timestamp'] for message in messages]
+        return super().summarize_messages(messages)
+
+    def process_chat_messages(self, chat_id):
+        self.local.timestamps = []
+        summary = super().process_chat_messages(chat_id)
+        timestamps = self.local.timestamps
+        if not summary:
+            self.count('summary_empty', len(timestamps))
+            return summary
+
+        can_send, reason = self.rate_limiter.can_send_message(chat_id)
+        if not can_send:
+            self.count('summary_rate_limited', len(timestamps))
+            return summary
+
+        sms_text = start_forwarder.format_summary_sms(self.chat_names.get(chat_id, 'Unknown Chat'), summary)
+        if self.provider.send_sms(sms_text, self.phone_number):
+            self.rate_limiter.record_message(chat_id)
+            sent_at = time.time()
+            with self.stats_lock:
+                self.latencies.extend(sent_at - timestamp for timestamp in timestamps)
+            self.count('summary_sent', len(timestamps))
+        else:
+            self.count('summary_send_failed', len(timestamps))
+        return summary
+
+    def wait_idle(self, timeout):
+        """Wait until every chat's pending messages have been summarized."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                timers = [timer for timer in self.chat_timers.values() if timer is not None]
+            if not timers:
+                return True
+            for timer in timers:
+                timer.join(max(0.0, deadline - time.time()))
+        return False
+
+async def replay(messages, args, temp_dir):
+    """Replay the scheduled messages through the handler and collect the results."""
+    client = FakeTelegramClient(chat_count=0, rpc_latency=args.rpc_latency, seed=args.seed)
+
+    # Chats whose every message is from a sender named like the chat are private chats
+    chat_senders = {}
+    for message in messages:
+        chat_senders.setdefault(message['chat_name'], set()).add(message['sender_name'])
+    dialogs = {}
+    for chat, senders in chat_senders.items():
+        kind = 'user' if senders == {chat} else 'group'
+        dialogs[chat] = client.add_chat(chat, kind, muted=client.random.random() < args.muted_fraction)
+    chat_names = {dialog.id: chat for chat, dialog in dialogs.items()}
+    await client.connect()
+    me = await client.get_me()
+
+    gateway = MockSMSGateway(latency=args.sms_latency, error_rate=args.sms_error_rate)
+    gateway.start()
+    os.environ.update({'SMSC_LOGIN': 'replay', 'SMSC_PASSWORD': 'replay', 'SMSC_API_URL': f"{gateway.url}/sys"})
+    provider = RecordingProvider(sms_providers.SMSCProvider())
+    phone_number = os.environ['YOUR_PHONE_NUMBER']
+
+    rate_limiter.RATE_LIMITER_STATE_FILE = os.path.join(temp_dir, 'rate_limiter_state.json')
+    limiter = ReplayRateLimiter(args.compression, max_messages=args.max_messages, time_window=args.time_window,
+                                max_per_chat=args.max_per_chat, chat_window=args.chat_window,
+                                daily_limit=args.daily_limit)
+
+    summarizer = None
+    if config.ENABLE_MESSAGE_SUMMARIZATION:
+        summarizer = ReplaySummarizer(provider, limiter, phone_number, chat_names,
+                                      delay_seconds=config.SUMMARIZATION_DELAY / args.compression,
+                                      max_messages=config.MAX_SUMMARY_MESSAGES,
+                                      max_summary_length=config.MAX_SMS_LENGTH)
+
+    stats = {}
+    client.add_event_handler(start_forwarder.create_message_handler(
+        client, me, provider, summarizer, phone_number=phone_number, rate_limiter=limiter, stats=stats
+    ))
+
+    handler_times = []
+
+    async def deliver(message, scheduled_at):
+        event_scheduled_at.set(scheduled_at)
+        dialog = dialogs[message['chat_name']]
+        sender = dialog.entity if dialog.is_user else client.add_user(message['sender_name'])
+        handler_times.append(await client.dispatch(client.make_event(dialog, message['message_text'], sender=sender)))
+
+    started_at = time.time()
+    tasks = []
+    try:
+        for message in messages:
+            scheduled_at = started_at + message['offset']
+            delay = scheduled_at - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(deliver(message, scheduled_at)))
+        await asyncio.gather(*tasks)
+        if summarizer is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, summarizer.wait_idle, config.SUMMARIZATION_DELAY / args.compression + 60
+            )
+        wall_time = time.time() - started_at
+    finally:
+        provider.close()
+        gateway.stop()
+
+    outcomes = dict(stats)
+    latencies = list(provider.latencies)
+    if summarizer is not None:
+        # A summary covers the chat's last MAX_SUMMARY_MESSAGES messages, the others are dropped
+        summary_outcomes = dict(summarizer.stats)
+        summarized = sum(summary_outcomes.values())
+        if outcomes.get('summarized', 0) > summarized:
+            summary_outcomes['summary_overflow'] = outcomes['summarized'] - summarized
+        outcomes.pop('summarized', None)
+        outcomes.update(summary_outcomes)
+        latencies.extend(summarizer.latencies)
+
+    return {
+        'messages': len(messages),
+        'chats': len(dialogs),
+        'replayed_span': messages[-1]['offset'] if messages else 0.0,
+        'wall_time': wall_time,
+        'throughput': len(messages) / wall_time if wall_time else 0.0,
+        'handler_ms': {name: percentile(handler_times, fraction) * 1000
+                       for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+        'e2e_ms': {name: percentile(latencies, fraction) * 1000
+                   for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+        'delivered_messages': len(latencies),
+        'sms_sent': len(provider.sent),
+        'sms_segments': provider.segments,
+        'outcomes': outcomes,
+        'rate_limit_reasons': limiter.reasons,
+        'telegram_rpcs': client.stats['rpcs']
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay message history through the forwarder pipeline offline')
+    parser.add_argument('--csv', default='telegram_messages.csv', help='Message history CSV file')
+    parser.add_argument('--db', help='Replay the telegram_messages table of this database instead of the CSV')
+    parser.add_argument('--user-id', type=int, help='Only replay this user\'s messages (with --db)')
+    parser.add_argument('--limit', type=int, help='Only replay the oldest N messages')
+    parser.add_argument('--compression', type=float, default=3600, help='Replay this many times faster than real time')
+    parser.add_argument('--max-gap', type=float, default=300, help='Cap idle gaps between messages at this many seconds')
+    parser.add_argument('--muted-fraction', type=float, default=0.0, help='Fraction of the chats to mute')
+    parser.add_argument('--rpc-latency', default='constant:0.005', help='Telegram RPC latency distribution')
+    parser.add_argument('--sms-latency', default='0', help='SMS gateway latency distribution')
+    parser.add_argument('--sms-error-rate', type=float, default=0.0, help='Fraction of SMS sends failing with an API error')
+    parser.add_argument('--max-messages', type=int, default=rate_limiter.rate_limiter.max_messages, help='Rate limit: messages per time window')
+    parser.add_argument('--time-window', type=float, default=rate_limiter.rate_limiter.time_window, help='Rate limit: time window in seconds')
+    parser.add_argument('--max-per-chat', type=int, default=rate_limiter.rate_limiter.max_per_chat, help='Rate limit: messages per chat window')
+    parser.add_argument('--chat-window', type=float, default=rate_limiter.rate_limiter.chat_window, help='Rate limit: chat window in seconds')
+    parser.add_argument('--daily-limit', type=int, default=rate_limiter.rate_limiter.daily_limit, help='Rate limit: messages per day')
+    parser.add_argument('--summarize', choices=('config', 'on', 'off'), default='config', help='Summarize messages of non-muted chats')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    args = parser.parse_args()
+
+    if args.compression <= 0:
+        parser.error('--compression must be positive')
+
+    messages = load_db(args.db, args.user_id) if args.db else load_history_csv(args.csv)
+    messages = schedule(messages, args.compression, args.max_gap)[:args.limit]
+
+    # The history's chats have no IDs to match MONITORED_CHATS against
+    config.FORWARD_ALL_CHATS = True
+    if args.summarize != 'config':
+        config.ENABLE_MESSAGE_SUMMARIZATION = args.summarize == 'on'
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Keep the replay's writes out of forwarder.db
+        message_store.db_path = delivery_reports.db_path = os.path.join(temp_dir, 'replay.db')
+        message_store.init_db()
+
+        result = asyncio.run(replay(messages, args, temp_dir))
+        message_store.flush()
+
+    print(f"{result['messages']} messages in {result['chats']} chats, compression {args.compression:g}x, "
+          f"summarization {'on' if config.ENABLE_MESSAGE_SUMMARIZATION else 'off'}")
+    print(f"Wall time:      {result['wall_time']:.2f}s for {result['replayed_span']:.2f}s of replayed history "
+          f"({result['throughput']:.0f} messages/s)")
+    print(f"Handler time:   p50 {result['handler_ms']['p50']:.1f} ms, p95 {result['handler_ms']['p95']:.1f} ms, "
+          f"p99 {result['handler_ms']['p99']:.1f} ms")
+    print(f"End to end:     p50 {result['e2e_ms']['p50']:.1f} ms, p95 {result['e2e_ms']['p95']:.1f} ms, "
+          f"p99 {result['e2e_ms']['p99']:.1f} ms ({result['delivered_messages']} messages delivered)")
+    segments_per_sms = result['sms_segments'] / result['sms_sent'] if result['sms_sent'] else 0.0
+    print(f"SMS sent:       {result['sms_sent']} ({result['sms_segments']} segments, {segments_per_sms:.2f} per SMS)")
+    print("Outcomes:")
+    for outcome, count in sorted(result['outcomes'].items(), key=lambda item: -item[1]):
+        print(f"  {outcome:<30} {count:>6}")
+    for reason, count in sorted(result['rate_limit_reasons'].items(), key=lambda item: -item[1]):
+        print(f"  {'- ' + reason:<30} {count:>6}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(result, args=vars(args)), f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Response Cache
+This module provides a short-lived, single-flight cache of JSON API responses, so
+concurrent identical refresh requests (several tabs, or a tab and a retry) share one
+computation instead of each opening Telegram clients and repeating the same work.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached response stays valid when nothing invalidates it earlier
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '15'))
+
+class ResponseCache:
+    """
+    TTL cache of JSON responses keyed by (user ID, endpoint, params).
+
+    A request for a key that is being computed waits for that computation
+    instead of starting its own. Every response gets an ETag derived from its
+    body, so unchanged responses can be answered with 304 Not Modified.
+    invalidate() drops a user's entries when their data changes; a computation
+    that was already running at that point is returned to its waiters but not
+    stored.
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, max_entries=256):
+        """
+        Initialize the ResponseCache.
+
+        Args:
+            ttl: Seconds after which an entry expires
+            max_entries: Maximum number of responses to keep
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.in_flight = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'invalidations': 0}
+
+    @staticmethod
+    def make_key(user_id, endpoint, params=None):
+        """
+        Build a cache key.
+
+        Args:
+            user_id: The user's Telegram ID
+            endpoint: Endpoint name
+            params: Optional mapping of request parameters
+
+        Returns:
+            tuple: The cache key
+        """
+        return (user_id, endpoint, tuple(sorted((params or {}).items())))
+
+    @staticmethod
+    def make_etag(body):
+        """Get the ETag of a response body."""
+        return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+    def get(self, key, compute):
+        """
+        Get a response from the cache, computing it once if it is missing or expired.
+
+        Args:
+            key: Key returned by make_key
+            compute: Function returning the JSON-serializable response data;
+                exceptions are raised to every waiting caller and nothing is cached
+
+        Returns:
+            tuple: (JSON body, ETag)
+        """
+        owner = False
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] > time.monotonic():
+                self.stats['hits'] += 1
+                return entry[0], entry[1]
+
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+            else:
+                self.stats['misses'] += 1
+                future = self.in_flight[key] = concurrent.futures.Future()
+                generation = self.generations.get(key[0], 0)
+                owner = True
+
+        if not owner:
+            # Another request is computing this response
+            return future.result()
+
+        try:
+            body = json.dumps(compute(), default=str)
+            result = (body, self.make_etag(body))
+        except Exception as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.in_flight[key]
+            if self.generations.get(key[0], 0) == generation:
+                if len(self.entries) >= self.max_entries:
+                    self.evict_expired()
+                self.entries[key] = (result[0], result[1], time.monotonic() + self.ttl)
+        future.set_result(result)
+        return result
+
+    def evict_expired(self):
+        """Drop expired entries, and the oldest ones if the cache is still full. Called with the lock held."""
+        now = time.monotonic()
+        for key in [key for key, entry in self.entries.items() if entry[2] <= now]:
+            del self.entries[key]
+        while len(self.entries) >= self.max_entries:
+            del self.entries[min(self.entries, key=lambda key: self.entries[key][2])]
+
+    def invalidate(self, user_id, endpoint=None):
+        """
+        Drop a user's cached responses.
+
+        Args:
+            user_id: The user's Telegram ID
+            endpoint: Only drop this endpoint's responses (all of the user's by default)
+        """
+        with self.lock:
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+            for key in [key for key in self.entries if key[0] == user_id and endpoint in (None, key[1])]:
+                del self.entries[key]
+            self.stats['invalidations'] += 1
+
+# Create a global instance of the response cache
+response_cache = ResponseCache()
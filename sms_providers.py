@@ -5,9 +5,15 @@ This module provides a unified interface for different SMS providers.
 """
 
 import os
+import time
 import logging
+import threading
+import concurrent.futures
+from collections import deque
 import requests
 from abc import ABC, abstractmethod
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 # Configure logging
@@ -20,23 +26,141 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Provider used when SMS_PROVIDER is not set
+DEFAULT_SMS_PROVIDER = 'smsc'
+
+# HTTP settings for provider API calls
+SMS_HTTP_TIMEOUT = (float(os.getenv('SMS_HTTP_CONNECT_TIMEOUT', '5')), float(os.getenv('SMS_HTTP_READ_TIMEOUT', '15')))
+SMS_HTTP_RETRIES = 3
+SMS_HTTP_BACKOFF = 0.5  # Seconds; doubled after every retry
+SMS_HTTP_POOL_SIZE = 10
+
+# Seconds a replaced provider instance stays open for sends already using it
+SMS_PROVIDER_CLOSE_GRACE = 300
+
+# Routing provider settings
+SMS_ROUTING_PROVIDERS = 'smsc,smsprosto'  # Default providers to route between, most preferred first
+SMS_ROUTING_WINDOW = 20  # Recent sends per provider the success rate and latency are computed over
+SMS_BREAKER_FAILURES = int(os.getenv('SMS_BREAKER_FAILURES', '3'))  # Consecutive failures that open a circuit breaker
+SMS_BREAKER_COOLDOWN = int(os.getenv('SMS_BREAKER_COOLDOWN', '60'))  # Seconds before an open breaker lets a trial send through
+SMS_HEDGE_DELAY = float(os.getenv('SMS_HEDGE_DELAY', '5'))  # Seconds before a slow send is also tried with the next provider
+
+# Provider API base URLs; override them to point at a local mock gateway (see mock_sms_gateway.py)
+SMSC_API_URL = 'https://smsc.ru/sys'
+SMSPROSTO_API_URL = 'https://api.sms-prosto.ru'
+
+# Maximum number of messages per delivery status request
+SMS_STATUS_BATCH_SIZE = 100
+
+# SMSC status codes (status.php) by delivery state
+SMSC_DELIVERED_STATUSES = (1, 2, 4)  # Delivered, read, link followed
+SMSC_PENDING_STATUSES = (-1, 0)  # Waiting to be sent, handed to the operator
+
+def create_http_session(idempotent=True):
+    """
+    Create a requests session with keep-alive connection pooling and retries.
+    
+    Args:
+        idempotent: Whether the session's calls can safely be repeated (e.g. a
+            balance query). Otherwise only attempts that failed to connect are
+            retried, since a request that reached the provider may have sent an SMS.
+    
+    Returns:
+        requests.Session: The session
+    """
+    if idempotent:
+        retry = Retry(total=SMS_HTTP_RETRIES, backoff_factor=SMS_HTTP_BACKOFF,
+                      status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+    else:
+        retry = Retry(total=SMS_HTTP_RETRIES, connect=SMS_HTTP_RETRIES, read=0, status=0, other=0,
+                      backoff_factor=SMS_HTTP_BACKOFF)
+    
+    adapter = HTTPAdapter(pool_connections=SMS_HTTP_POOL_SIZE, pool_maxsize=SMS_HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 class SMSProvider(ABC):
     """Abstract base class for SMS providers."""
     
+    # Provider name in PROVIDER_CLASSES
+    name = None
+    
+    # Whether get_delivery_statuses is implemented
+    delivery_reports = False
+    
     @abstractmethod
     def send_sms(self, message_text, to_number):
-        """Send an SMS message."""
+        """
+        Send an SMS message.
+        
+        Returns:
+            The provider's message ID (str) if the SMS was accepted and the
+            provider returned one, True if it was accepted without one, or
+            False if sending failed
+        """
         pass
     
     @abstractmethod
     def verify_credentials(self):
         """Verify that the provider credentials are valid."""
         pass
+    
+    def init_http(self):
+        """Create the provider's pooled HTTP sessions: one for queries and one for sending."""
+        self.session = create_http_session(idempotent=True)
+        self.send_session = create_http_session(idempotent=False)
+    
+    def close(self):
+        """Close the provider's HTTP sessions."""
+        for http_session in (getattr(self, 'session', None), getattr(self, 'send_session', None)):
+            if http_session is not None:
+                http_session.close()
+    
+    def get_balance(self):
+        """
+        Get the account balance.
+        
+        Returns:
+            float: The balance, or None if the provider doesn't report one
+        
+        Raises:
+            Exception: If the credentials are invalid or the provider can't be reached
+        """
+        if not self.verify_credentials():
+            raise ValueError("Credentials verification failed")
+        return None
+    
+    def split_message_id(self, message_id):
+        """
+        Get the provider that sent a message from the message ID send_sms returned.
+        
+        Returns:
+            tuple: (provider name, the provider's message ID)
+        """
+        return self.name, message_id
+    
+    def get_delivery_statuses(self, messages):
+        """
+        Get the delivery status of sent messages.
+        
+        Args:
+            messages: List of (message ID, phone number) tuples
+        
+        Returns:
+            dict: Message ID to a dictionary with state ('pending', 'delivered'
+                or 'failed'), status_code, cost, delivered_at (Unix time) and
+                error; messages the provider doesn't know are left out
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} doesn't report delivery status")
 
 # Define dummy classes for other providers to avoid import errors
 class TwilioProvider(SMSProvider):
     """Dummy Twilio SMS provider implementation."""
     
+    name = 'twilio'
+    
     def __init__(self):
         logger.error("Twilio provider is not available in this deployment")
         raise ValueError("Twilio provider is not available in this deployment")
@@ -52,6 +176,9 @@ class TwilioProvider(SMSProvider):
 class SMSCProvider(SMSProvider):
     """SMSC.ru SMS provider implementation."""
     
+    name = 'smsc'
+    delivery_reports = True
+    
     def __init__(self):
         self.login = os.getenv('SMSC_LOGIN')
         self.password = os.getenv('SMSC_PASSWORD')
@@ -63,7 +190,8 @@ class SMSCProvider(SMSProvider):
             raise ValueError("Missing required SMSC environment variables")
         
         # API endpoint
-        self.base_url = "https://smsc.ru/sys/send.php"
+        self.base_url = os.getenv('SMSC_API_URL', SMSC_API_URL).rstrip('/')
+        self.init_http()
     
     def send_sms(self, message_text, to_number):
         """Send an SMS using SMSC.ru."""
@@ -78,7 +206,7 @@ class SMSCProvider(SMSProvider):
         }
         
         try:
-            response = requests.get(self.base_url, params=params)
+            response = self.send_session.get(f"{self.base_url}/send.php", params=params, timeout=SMS_HTTP_TIMEOUT)
             response.raise_for_status()
             result = response.json()
             
@@ -87,13 +215,13 @@ class SMSCProvider(SMSProvider):
                 return False
             
             logger.info(f"SMS sent successfully via SMSC: {result.get('id', 'Unknown ID')}")
-            return True
+            return str(result['id']) if result.get('id') is not None else True
         except Exception as e:
             logger.error(f"Failed to send SMS via SMSC: {e}")
             return False
     
-    def verify_credentials(self):
-        """Verify SMSC credentials."""
+    def get_balance(self):
+        """Get the SMSC account balance."""
         params = {
             'login': self.login,
             'psw': self.password,
@@ -101,16 +229,64 @@ class SMSCProvider(SMSProvider):
             'fmt': 3  # JSON response format
         }
         
-        try:
-            response = requests.get("https://smsc.ru/sys/balance.php", params=params)
+        response = self.session.get(f"{self.base_url}/balance.php", params=params, timeout=SMS_HTTP_TIMEOUT)
+        response.raise_for_status()
+        result = response.json()
+        
+        if 'error' in result:
+            raise ValueError(result['error'])
+        
+        balance = result.get('balance')
+        return float(balance) if balance is not None else None
+    
+    def get_delivery_statuses(self, messages):
+        """Get the delivery status of SMSC messages, SMS_STATUS_BATCH_SIZE messages per request."""
+        statuses = {}
+        for start in range(0, len(messages), SMS_STATUS_BATCH_SIZE):
+            batch = messages[start:start + SMS_STATUS_BATCH_SIZE]
+            params = {
+                'login': self.login,
+                'psw': self.password,
+                'id': ','.join(str(message_id) for message_id, _ in batch),
+                'phone': ','.join(phone for _, phone in batch),
+                'all': 1,  # Include the cost
+                'fmt': 3  # JSON response format
+            }
+            
+            response = self.session.get(f"{self.base_url}/status.php", params=params, timeout=SMS_HTTP_TIMEOUT)
             response.raise_for_status()
             result = response.json()
             
-            if 'error' in result:
-                logger.error(f"SMSC credentials verification failed: {result['error']}")
-                return False
+            if isinstance(result, dict):
+                if 'error' in result:
+                    raise ValueError(result['error'])
+                result = [result]
             
-            logger.info(f"SMSC credentials verified. Balance: {result.get('balance', 'Unknown')}")
+            for item in result:
+                if item.get('id') is None or item.get('status') is None:
+                    continue
+                status_code = int(item['status'])
+                if status_code in SMSC_DELIVERED_STATUSES:
+                    state = 'delivered'
+                elif status_code in SMSC_PENDING_STATUSES:
+                    state = 'pending'
+                else:
+                    state = 'failed'
+                cost = item.get('cost')
+                statuses[str(item['id'])] = {
+                    'state': state,
+                    'status_code': status_code,
+                    'cost': float(cost) if cost not in (None, '') else None,
+                    'delivered_at': int(item['last_timestamp']) if state == 'delivered' and item.get('last_timestamp') else None,
+                    'error': item.get('err') if state == 'failed' else None
+                }
+        return statuses
+    
+    def verify_credentials(self):
+        """Verify SMSC credentials."""
+        try:
+            balance = self.get_balance()
+            logger.info(f"SMSC credentials verified. Balance: {balance if balance is not None else 'Unknown'}")
             return True
         except Exception as e:
             logger.error(f"SMSC credentials verification failed: {e}")
@@ -119,6 +295,8 @@ class SMSCProvider(SMSProvider):
 class SMSProstoProvider(SMSProvider):
     """SMS-PROSTO.RU SMS provider implementation."""
     
+    name = 'smsprosto'
+    
     def __init__(self):
         self.api_key = os.getenv('SMSPROSTO_API_KEY')
         self.sender = os.getenv('SMSPROSTO_SENDER', 'SMS')
@@ -129,7 +307,8 @@ class SMSProstoProvider(SMSProvider):
             raise ValueError("Missing required SMS-PROSTO environment variables")
         
         # API endpoint
-        self.base_url = "https://api.sms-prosto.ru"
+        self.base_url = os.getenv('SMSPROSTO_API_URL', SMSPROSTO_API_URL).rstrip('/')
+        self.init_http()
     
     def send_sms(self, message_text, to_number):
         """Send an SMS using SMS-PROSTO.RU."""
@@ -145,7 +324,7 @@ class SMSProstoProvider(SMSProvider):
         }
         
         try:
-            response = requests.get(f"{self.base_url}/messages/send", params=params)
+            response = self.send_session.get(f"{self.base_url}/messages/send", params=params, timeout=SMS_HTTP_TIMEOUT)
             response.raise_for_status()
             result = response.json()
             
@@ -154,27 +333,32 @@ class SMSProstoProvider(SMSProvider):
                 return False
             
             logger.info(f"SMS sent successfully via SMS-PROSTO: {result.get('id', 'Unknown ID')}")
-            return True
+            return str(result['id']) if result.get('id') is not None else True
         except Exception as e:
             logger.error(f"Failed to send SMS via SMS-PROSTO: {e}")
             return False
     
-    def verify_credentials(self):
-        """Verify SMS-PROSTO credentials."""
+    def get_balance(self):
+        """Get the SMS-PROSTO account balance."""
         params = {
             'apiKey': self.api_key
         }
         
+        response = self.session.get(f"{self.base_url}/balance", params=params, timeout=SMS_HTTP_TIMEOUT)
+        response.raise_for_status()
+        result = response.json()
+        
+        if result.get('status') == 'error':
+            raise ValueError(result.get('message', 'Unknown error'))
+        
+        balance = result.get('balance')
+        return float(balance) if balance is not None else None
+    
+    def verify_credentials(self):
+        """Verify SMS-PROSTO credentials."""
         try:
-            response = requests.get(f"{self.base_url}/balance", params=params)
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get('status') == 'error':
-                logger.error(f"SMS-PROSTO credentials verification failed: {result.get('message', 'Unknown error')}")
-                return False
-            
-            logger.info(f"SMS-PROSTO credentials verified. Balance: {result.get('balance', 'Unknown')}")
+            balance = self.get_balance()
+            logger.info(f"SMS-PROSTO credentials verified. Balance: {balance if balance is not None else 'Unknown'}")
             return True
         except Exception as e:
             logger.error(f"SMS-PROSTO credentials verification failed: {e}")
@@ -183,6 +367,8 @@ class SMSProstoProvider(SMSProvider):
 class MessageBirdProvider(SMSProvider):
     """Dummy MessageBird SMS provider implementation."""
     
+    name = 'messagebird'
+    
     def __init__(self):
         logger.error("MessageBird provider is not available in this deployment")
         raise ValueError("MessageBird provider is not available in this deployment")
@@ -198,6 +384,8 @@ class MessageBirdProvider(SMSProvider):
 class VonageProvider(SMSProvider):
     """Dummy Vonage SMS provider implementation."""
     
+    name = 'vonage'
+    
     def __init__(self):
         logger.error("Vonage provider is not available in this deployment")
         raise ValueError("Vonage provider is not available in this deployment")
@@ -210,49 +398,359 @@ class VonageProvider(SMSProvider):
         """Verify Vonage credentials."""
         raise NotImplementedError("Vonage provider is not available in this deployment")
 
+class ProviderStats:
+    """
+    Rolling success rate and latency of one provider, with a circuit breaker.
+    
+    The breaker opens after SMS_BREAKER_FAILURES consecutive failures. While
+    it is open the provider gets no sends, except that after
+    SMS_BREAKER_COOLDOWN seconds a single trial send is let through
+    (half-open); its success closes the breaker, its failure opens it again.
+    """
+    
+    def __init__(self, window=SMS_ROUTING_WINDOW):
+        """
+        Initialize the ProviderStats.
+        
+        Args:
+            window: Number of recent sends to keep
+        """
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+    
+    def success_rate(self):
+        """Share of recent sends that succeeded (1.0 without any sends yet)."""
+        if not self.outcomes:
+            return 1.0
+        return sum(1 for ok, _ in self.outcomes if ok) / len(self.outcomes)
+    
+    def average_latency(self):
+        """Average duration of recent successful sends in seconds (0 without any)."""
+        latencies = [latency for ok, latency in self.outcomes if ok]
+        return sum(latencies) / len(latencies) if latencies else 0.0
+    
+    def is_open(self):
+        """Whether the breaker is open (half-open counts as open once its trial send is running)."""
+        if self.opened_at is None:
+            return False
+        return self.trial_running or time.monotonic() - self.opened_at < SMS_BREAKER_COOLDOWN
+    
+    def try_acquire(self):
+        """
+        Claim a send on this provider.
+        
+        Returns:
+            bool: False if the breaker is open and no trial send is due
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.is_open():
+                return False
+            self.trial_running = True
+            return True
+    
+    def record(self, ok, latency):
+        """Record the outcome of a send."""
+        with self.lock:
+            self.outcomes.append((ok, latency))
+            self.trial_running = False
+            if ok:
+                self.consecutive_failures = 0
+                self.opened_at = None
+            else:
+                self.consecutive_failures += 1
+                if self.opened_at is not None or self.consecutive_failures >= SMS_BREAKER_FAILURES:
+                    self.opened_at = time.monotonic()
+    
+    def score(self, hedge_delay=SMS_HEDGE_DELAY):
+        """Health score for routing: recent success rate, discounted by latency relative to the hedge delay."""
+        return self.success_rate() / (1 + self.average_latency() / hedge_delay)
+    
+    def to_dict(self):
+        """Get the statistics as a dictionary."""
+        return {
+            'success_rate': round(self.success_rate(), 3),
+            'average_latency': round(self.average_latency(), 3),
+            'sends': len(self.outcomes),
+            'consecutive_failures': self.consecutive_failures,
+            'breaker_open': self.is_open()
+        }
+
+class RoutingProvider(SMSProvider):
+    """
+    SMS provider that routes every send to the healthiest of several providers.
+    
+    Providers are ranked by their ProviderStats score; ones with an open
+    circuit breaker are skipped. If the chosen provider hasn't answered within
+    SMS_HEDGE_DELAY seconds, the send is also started on the next provider and
+    the first success wins (so in rare cases both deliver the SMS). A send
+    that fails is retried with the remaining providers in order.
+    
+    Message IDs returned by send_sms are prefixed with the name of the
+    provider that sent the message ("smsc:12345").
+    """
+    
+    name = 'routing'
+    
+    def __init__(self, providers=None, hedge_delay=SMS_HEDGE_DELAY):
+        """
+        Initialize the RoutingProvider.
+        
+        Args:
+            providers: Dictionary of provider name to SMSProvider, in order of
+                preference; by default the SMS_ROUTING_PROVIDERS providers
+                that can be initialized
+            hedge_delay: Seconds before a slow send is also tried with the next provider
+        
+        Raises:
+            ValueError: If no provider is available
+        """
+        if providers is None:
+            providers = {}
+            for name in os.getenv('SMS_ROUTING_PROVIDERS', SMS_ROUTING_PROVIDERS).split(','):
+                name = name.strip().lower()
+                if name in providers or name not in PROVIDER_CLASSES or name == 'routing':
+                    continue
+                try:
+                    providers[name] = PROVIDER_CLASSES[name]()
+                except Exception as e:
+                    logger.warning(f"SMS provider {name} is not available for routing: {e}")
+        
+        if not providers:
+            logger.error("No SMS providers available for routing")
+            raise ValueError("No SMS providers available for routing")
+        
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.stats = {name: ProviderStats() for name in providers}
+        # As many concurrent sends per provider as its HTTP connection pool holds
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=SMS_HTTP_POOL_SIZE * len(providers),
+                                                              thread_name_prefix='sms-router')
+        logger.info(f"Routing SMS between providers: {', '.join(providers)}")
+    
+    def rank(self):
+        """Get the provider names in routing order: closed breakers first, then by score, then by preference."""
+        order = list(self.providers)
+        return sorted(order, key=lambda name: (self.stats[name].is_open(), -self.stats[name].score(self.hedge_delay),
+                                             order.index(name)))
+    
+    def attempt(self, name, message_text, to_number):
+        """Send with one provider and record the outcome; returns send_sms's result."""
+        started_at = time.monotonic()
+        try:
+            result = self.providers[name].send_sms(message_text, to_number)
+        except Exception as e:
+            logger.error(f"SMS provider {name} raised while sending: {e}")
+            result = False
+        self.stats[name].record(bool(result), time.monotonic() - started_at)
+        return result
+    
+    def send_sms(self, message_text, to_number):
+        """Send an SMS with the healthiest provider, hedging slow sends and failing over on errors."""
+        pending = {}
+        candidates = self.rank()
+        
+        def start_next():
+            while candidates:
+                name = candidates.pop(0)
+                if self.stats[name].try_acquire():
+                    pending[self.executor.submit(self.attempt, name, message_text, to_number)] = name
+                    return True
+            return False
+        
+        if not start_next():
+            logger.error("Failed to send SMS: every provider's circuit breaker is open")
+            return False
+        
+        while pending:
+            done, _ = concurrent.futures.wait(pending, timeout=self.hedge_delay,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                # Hedge: also try the next provider while the slow one may still finish
+                slow = ', '.join(pending.values())
+                if start_next():
+                    logger.warning(f"SMS send via {slow} is slow, also trying {list(pending.values())[-1]}")
+                continue
+            
+            for future in done:
+                name = pending.pop(future)
+                result = future.result()
+                if result:
+                    if len(self.providers) > 1:
+                        logger.info(f"SMS sent via {name}")
+                    return f"{name}:{result}" if isinstance(result, str) else True
+                logger.warning(f"SMS send via {name} failed")
+            
+            if not pending:
+                # Fail over to the next provider
+                start_next()
+        
+        logger.error("Failed to send SMS with every available provider")
+        return False
+    
+    def verify_credentials(self):
+        """Verify that at least one provider's credentials are valid."""
+        return any(provider.verify_credentials() for provider in self.providers.values())
+    
+    def get_balance(self):
+        """Get the balance of the provider sends are currently routed to."""
+        return self.providers[self.rank()[0]].get_balance()
+    
+    def split_message_id(self, message_id):
+        """Get the provider that sent a message from its prefixed message ID."""
+        return tuple(message_id.split(':', 1))
+    
+    def get_stats(self):
+        """
+        Get routing statistics.
+        
+        Returns:
+            dict: ProviderStats.to_dict() of each provider, in routing order
+        """
+        return {name: self.stats[name].to_dict() for name in self.rank()}
+    
+    def close(self):
+        """Close every provider's HTTP sessions."""
+        self.executor.shutdown(wait=False)
+        for provider in self.providers.values():
+            provider.close()
+
+# Provider classes by SMS_PROVIDER name
+PROVIDER_CLASSES = {
+    'smsc': SMSCProvider,
+    'smsprosto': SMSProstoProvider,
+    'messagebird': MessageBirdProvider,
+    'vonage': VonageProvider,
+    'twilio': TwilioProvider,
+    'routing': RoutingProvider
+}
+
+# Environment variables each provider is configured with
+PROVIDER_SETTINGS = {
+    'smsc': ('SMSC_LOGIN', 'SMSC_PASSWORD', 'SMSC_SENDER', 'SMSC_API_URL'),
+    'smsprosto': ('SMSPROSTO_API_KEY', 'SMSPROSTO_SENDER', 'SMSPROSTO_API_URL'),
+    'routing': ('SMS_ROUTING_PROVIDERS', 'SMSC_LOGIN', 'SMSC_PASSWORD', 'SMSC_SENDER', 'SMSC_API_URL',
+                'SMSPROSTO_API_KEY', 'SMSPROSTO_SENDER', 'SMSPROSTO_API_URL')
+}
+
+class ProviderRegistry:
+    """
+    Process-wide registry of SMS provider instances.
+    
+    Each provider is built once, with its pooled HTTP sessions, and shared by
+    every caller in the process. When the provider's settings in the
+    environment change (see reload), a new instance is built and swapped in
+    with a single assignment. Callers still holding the old instance can
+    finish with it; it is closed after SMS_PROVIDER_CLOSE_GRACE seconds.
+    """
+    
+    def __init__(self):
+        """Initialize the ProviderRegistry."""
+        self.providers = {}
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def get_config(provider_name):
+        """Get the current settings of a provider, used to notice configuration changes."""
+        return tuple(os.getenv(name) for name in PROVIDER_SETTINGS.get(provider_name, ()))
+    
+    @staticmethod
+    def get_provider_name(provider_name=None):
+        """Get the provider to use: the given one, SMS_PROVIDER, or the default."""
+        provider_name = (provider_name or os.getenv('SMS_PROVIDER') or DEFAULT_SMS_PROVIDER).lower()
+        if provider_name not in PROVIDER_CLASSES:
+            logger.error(f"Unknown SMS provider: {provider_name}. Falling back to {DEFAULT_SMS_PROVIDER}.")
+            provider_name = DEFAULT_SMS_PROVIDER
+        return provider_name
+    
+    def create(self, provider_name):
+        """Build a provider instance, falling back to the default provider if it can't be initialized."""
+        try:
+            logger.info(f"Using SMS provider: {provider_name}")
+            return PROVIDER_CLASSES[provider_name]()
+        except Exception as e:
+            logger.error(f"Failed to initialize SMS provider {provider_name}: {e}")
+            
+            # Try the default provider as a fallback
+            if provider_name != DEFAULT_SMS_PROVIDER:
+                try:
+                    logger.info(f"Falling back to {DEFAULT_SMS_PROVIDER} provider")
+                    return PROVIDER_CLASSES[DEFAULT_SMS_PROVIDER]()
+                except Exception as fallback_e:
+                    logger.error(f"Failed to initialize fallback {DEFAULT_SMS_PROVIDER} provider: {fallback_e}")
+            
+            raise ValueError(f"Failed to initialize any SMS provider")
+    
+    def get(self, provider_name=None):
+        """
+        Get the shared instance of a provider, building it on first use or after a configuration change.
+        
+        Args:
+            provider_name (str, optional): The provider; SMS_PROVIDER or the default if not given
+        
+        Returns:
+            SMSProvider: The provider instance
+        
+        Raises:
+            ValueError: If neither the provider nor the default provider can be initialized
+        """
+        provider_name = self.get_provider_name(provider_name)
+        config = self.get_config(provider_name)
+        
+        entry = self.providers.get(provider_name)
+        if entry is not None and entry[0] == config:
+            return entry[1]
+        
+        with self.lock:
+            # Another thread may have built it while this one waited
+            entry = self.providers.get(provider_name)
+            if entry is not None and entry[0] == config:
+                return entry[1]
+            
+            provider = self.create(provider_name)
+            self.providers[provider_name] = (config, provider)
+            if entry is not None:
+                logger.info(f"SMS provider {provider_name} settings changed, replaced its instance")
+                self.retire(entry[1])
+            return provider
+    
+    @staticmethod
+    def retire(provider):
+        """Close a replaced provider instance once the sends already using it have had time to finish."""
+        timer = threading.Timer(SMS_PROVIDER_CLOSE_GRACE, provider.close)
+        timer.daemon = True
+        timer.start()
+    
+    def reload(self):
+        """Re-read the .env file and rebuild the providers whose settings changed."""
+        load_dotenv(override=True)
+        for provider_name in list(self.providers):
+            try:
+                self.get(provider_name)
+            except ValueError as e:
+                logger.error(f"Failed to reload SMS provider {provider_name}: {e}")
+
+# Create a global instance of the provider registry
+provider_registry = ProviderRegistry()
+
 def get_sms_provider(provider_name=None):
     """
-    Get an instance of the specified SMS provider.
+    Get the shared instance of the specified SMS provider.
     
     Args:
         provider_name (str, optional): The name of the SMS provider to use.
             If not specified, the SMS_PROVIDER environment variable is used.
-            If that is not set, SMS-PROSTO is used as the default.
+            If that is not set, SMSC is used as the default.
     
     Returns:
-        SMSProvider: An instance of the specified SMS provider.
+        SMSProvider: The process-wide instance of the specified SMS provider.
     
     Raises:
         ValueError: If the specified provider is not supported or if the required
             environment variables for the provider are not set.
     """
-    if not provider_name:
-        provider_name = os.getenv('SMS_PROVIDER', 'smsprosto').lower()
-    
-    providers = {
-        'smsc': SMSCProvider,
-        'smsprosto': SMSProstoProvider,
-        'messagebird': MessageBirdProvider,
-        'vonage': VonageProvider,
-        'twilio': TwilioProvider
-    }
-    
-    if provider_name not in providers:
-        logger.error(f"Unknown SMS provider: {provider_name}. Falling back to SMS-PROSTO.")
-        provider_name = 'smsprosto'
-    
-    try:
-        logger.info(f"Using SMS provider: {provider_name}")
-        return providers[provider_name]()
-    except Exception as e:
-        logger.error(f"Failed to initialize SMS provider {provider_name}: {e}")
-        
-        # Try SMS-PROSTO as a fallback
-        if provider_name != 'smsprosto':
-            try:
-                logger.info(f"Falling back to SMS-PROSTO provider")
-                return SMSProstoProvider()
-            except Exception as fallback_e:
-                logger.error(f"Failed to initialize fallback SMS-PROSTO provider: {fallback_e}")
-        
-        raise ValueError(f"Failed to initialize any SMS provider") 
\ No newline at end of file
+    return provider_registry.get(provider_name)
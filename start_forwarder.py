@@ -11,13 +11,18 @@ import signal
 import sys
 import time
 import threading
-from telethon import TelegramClient, events
-from telethon.tl.types import User, Chat, Channel
+from telethon import events
 from dotenv import load_dotenv
 import config
-from sms_providers import get_sms_provider
+from sms_providers import get_sms_provider, provider_registry
+from provider_health import provider_health
+from delivery_reports import delivery_reports
 from datetime import datetime
 from message_summarizer import MessageSummarizer  # Import the message summarizer
+from summary_worker import SummaryWorker, SUMMARY_WORKER_ENABLED
+from message_store import message_store
+from chat_sync import get_display_name, get_media_type
+from telegram_scheduler import ScheduledTelegramClient, request_priority, PRIORITY_LIVE, PRIORITY_BULK
 
 # Configure logging
 logging.basicConfig(
@@ -46,6 +51,9 @@ WEB_LOGIN_SESSION_PATH = 'telegram_sessions/web_login_session'
 # Global flag to control the forwarder
 running = True
 
+# Seconds between refreshes of the stored chat list (names, mute and archive state)
+STORED_CHATS_REFRESH_INTERVAL = 300
+
 # Check if all required environment variables are set
 required_vars = [
     ('TELEGRAM_API_ID', API_ID),
@@ -59,27 +67,6 @@ if missing_vars:
     logger.error("Please create a .env file with these variables or set them in your environment.")
     sys.exit(1)
 
-def get_display_name(entity):
-    """Get a display name for a user, chat, or channel."""
-    if isinstance(entity, User):
-        if entity.first_name and entity.last_name:
-            return f"{entity.first_name} {entity.last_name}"
-        elif entity.first_name:
-            return entity.first_name
-        elif entity.username:
-            return entity.username
-        else:
-            return f"User {entity.id}"
-    elif isinstance(entity, (Chat, Channel)):
-        if entity.title:
-            return entity.title
-        elif getattr(entity, 'username', None):
-            return entity.username
-        else:
-            return f"Chat {entity.id}"
-    else:
-        return "Unknown"
-
 async def is_monitored_chat(client, chat_id):
     """Check if a chat should be monitored."""
     logger.info(f"Checking if chat {chat_id} should be monitored")
@@ -95,7 +82,7 @@ async def is_monitored_chat(client, chat_id):
                 if hasattr(d, 'id') and d.id == chat_id:
                     found_dialog = True
                     # Check if the chat is muted
-                    if d.archived or d.notify_settings.mute_until:
+                    if d.archived or d.dialog.notify_settings.mute_until:
                         logger.info(f"Chat {chat_id} is muted, skipping")
                         return False
                     logger.info(f"Chat {chat_id} is not muted")
@@ -138,24 +125,207 @@ async def is_monitored_chat(client, chat_id):
     
     return False
 
-def get_media_type(event):
-    """Get the type of media in a message."""
-    if event.photo:
-        return "Photo"
-    elif event.video:
-        return "Video"
-    elif event.audio:
-        return "Audio"
-    elif event.voice:
-        return "Voice"
-    elif event.document:
-        return "Document"
-    elif event.sticker:
-        return "Sticker"
-    elif event.gif:
-        return "GIF"
+def format_sms(chat_name, sender_name, message_text):
+    """
+    Format a forwarded message as an SMS, truncated to MAX_SMS_LENGTH.
+    
+    Args:
+        chat_name: Name of the chat the message is from
+        sender_name: Name of the sender
+        message_text: The message text
+    
+    Returns:
+        str: The SMS text
+    """
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    if config.INCLUDE_SENDER_NAME:
+        sms_text = f"[{timestamp}] {chat_name} - {sender_name}: {message_text}"
     else:
-        return "Media"
+        sms_text = f"[{timestamp}] {chat_name}: {message_text}"
+    
+    # Truncate message if it's too long
+    if len(sms_text) > config.MAX_SMS_LENGTH:
+        sms_text = sms_text[:config.MAX_SMS_LENGTH - 3] + "..."
+    return sms_text
+
+def format_summary_sms(chat_name, summary_text):
+    """Format a chat summary as an SMS, truncated to MAX_SMS_LENGTH."""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    sms_text = f"[{timestamp}] Summary from {chat_name}: {summary_text}"
+    
+    # Truncate message if it's too long
+    if len(sms_text) > config.MAX_SMS_LENGTH:
+        sms_text = sms_text[:config.MAX_SMS_LENGTH - 3] + "..."
+    return sms_text
+
+def create_message_handler(client, me, sms_provider, summarizer=None, summary_worker=None, phone_number=None,
+                           rate_limiter=None, stats=None, get_provider=None):
+    """
+    Create the NewMessage event handler that forwards messages to SMS.
+    
+    Args:
+        client: Connected Telegram client (a TelegramClient, or a
+            fake_telegram.FakeTelegramClient in benchmarks)
+        me: The logged in user
+        sms_provider: The SMSProvider to send with
+        summarizer: MessageSummarizer to add messages to instead of sending
+            them, if summarization is enabled
+        summary_worker: SummaryWorker to notify of new messages, if any
+        phone_number: Phone number to send to (YOUR_PHONE_NUMBER by default)
+        rate_limiter: RateLimiter to check before sending, if any
+        stats: Dictionary counting what happened to each message ("sent",
+            "send_failed", "summarized", or why it was dropped), if wanted
+        get_provider: Function returning the SMSProvider to send each message
+            with, so a provider rebuilt by a reload is picked up; sms_provider
+            is used if not given
+    
+    Returns:
+        function: The async event handler
+    """
+    phone_number = phone_number or YOUR_PHONE_NUMBER
+    
+    def count(outcome):
+        if stats is not None:
+            stats[outcome] = stats.get(outcome, 0) + 1
+    
+    async def handle_new_message(event):
+        try:
+            # Get the chat where the message was sent
+            chat = await event.get_chat()
+            chat_id = event.chat_id
+            
+            # Log the message
+            logger.info(f"Received message from chat: {chat_id} ({get_display_name(chat)})")
+            
+            # Store every message, monitored or not; the write happens in the next batch
+            try:
+                sender = await event.get_sender()
+                message_store.add_message(
+                    me.id, chat.id, event.message.id, get_display_name(chat),
+                    sender.id if sender else None, get_display_name(sender) if sender else "Unknown",
+                    event.message.text, get_media_type(event.message) if event.media else None,
+                    event.message.date.timestamp(), event.out
+                )
+            except Exception as e:
+                logger.error(f"Error adding message to the message store: {e}")
+            
+            # The summary page covers all non-muted chats, not only the monitored ones
+            if summary_worker:
+                summary_worker.notify(chat_id)
+            
+            # Skip if this chat is not monitored
+            monitored = await is_monitored_chat(client, chat_id)
+            logger.info(f"Is chat monitored: {monitored}")
+            if not monitored:
+                logger.info(f"Skipping message from non-monitored chat: {chat_id}")
+                count('not_monitored')
+                return
+            
+            # Skip own messages if configured to do so
+            if event.out and not config.FORWARD_OWN_MESSAGES:
+                logger.info("Skipping own message")
+                count('own_message')
+                return
+            
+            # Get the sender
+            sender = await event.get_sender()
+            sender_name = "You" if event.out else get_display_name(sender)
+            
+            # Get chat name
+            chat_name = get_display_name(chat)
+            
+            # Handle media messages
+            if event.media and config.FORWARD_MEDIA:
+                media_type = get_media_type(event.message)
+                message_text = f"[{media_type}]"
+                if event.message.text:
+                    message_text += f" {event.message.text}"
+            else:
+                # Skip media messages if not configured to forward them
+                if event.media and not config.FORWARD_MEDIA:
+                    logger.info("Skipping media message")
+                    count('media')
+                    return
+                
+                message_text = event.message.text
+            
+            # Skip empty messages
+            if not message_text:
+                logger.info("Skipping empty message")
+                count('empty')
+                return
+            
+            # Check if the chat is muted
+            is_muted = False
+            if config.ONLY_NON_MUTED_CHATS:
+                try:
+                    dialogs = await client.get_dialogs(limit=200)
+                    for d in dialogs:
+                        if (hasattr(d, 'id') and d.id == chat_id) or \
+                           (hasattr(d, 'entity') and hasattr(d.entity, 'id') and d.entity.id == chat_id):
+                            if d.archived or d.dialog.notify_settings.mute_until:
+                                is_muted = True
+                            break
+                except Exception as e:
+                    logger.error(f"Error checking mute status: {e}")
+            
+            # Skip muted chats entirely
+            if is_muted:
+                logger.info(f"Skipping message from muted chat {chat_name}")
+                count('muted')
+                return
+            
+            # For non-muted chats, either send immediately or add to summarizer based on config
+            if config.ENABLE_MESSAGE_SUMMARIZATION and summarizer:
+                logger.info(f"Adding message from non-muted chat {chat_name} to summarizer")
+                summarizer.add_message(chat_id, message_text, sender_name)
+                count('summarized')
+                return
+            
+            # Check rate limits
+            if rate_limiter is not None:
+                can_send, reason = rate_limiter.can_send_message(chat_id)
+                if not can_send:
+                    logger.warning(f"Rate limit exceeded: {reason}")
+                    count('rate_limited')
+                    return
+            
+            # Format the message for SMS
+            sms_text = format_sms(chat_name, sender_name, message_text)
+            
+            # Log the message
+            logger.info(f"Forwarding message from {chat_name}: {message_text[:30]}...")
+            
+            # Send the SMS
+            try:
+                # Send SMS off the event loop; a routed send can wait through several providers
+                logger.info(f"Sending SMS to {phone_number}: {sms_text[:30]}...")
+                provider = get_provider() if get_provider is not None else sms_provider
+                success = await asyncio.get_running_loop().run_in_executor(None, provider.send_sms, sms_text, phone_number)
+                
+                if success:
+                    logger.info(f"SMS sent successfully to {phone_number}")
+                    count('sent')
+                    if rate_limiter is not None:
+                        rate_limiter.record_message(chat_id)
+                    
+                    # Save the message and its delivery report off the event loop
+                    def record_delivery():
+                        message_row_id = delivery_reports.save_message(me.id, chat_name, sender_name, message_text)
+                        delivery_reports.record(provider, success, phone_number, me.id, chat_id, chat_name, message_row_id)
+                    await asyncio.get_running_loop().run_in_executor(None, record_delivery)
+                else:
+                    logger.error(f"Failed to send SMS to {phone_number}")
+                    count('send_failed')
+                    
+            except Exception as e:
+                logger.error(f"Failed to send SMS: {e}")
+                count('send_failed')
+        except Exception as e:
+            logger.error(f"Error handling message: {e}")
+            count('error')
+    
+    return handle_new_message
 
 async def run_forwarder():
     """Run the Telegram to SMS forwarder."""
@@ -167,11 +337,17 @@ async def run_forwarder():
         provider_name = sms_provider.__class__.__name__.replace('Provider', '')
         logger.info(f"Using SMS provider: {provider_name}")
         
-        # Verify credentials
-        if not sms_provider.verify_credentials():
+        # Verify credentials, reusing a recent health check (e.g. from before a restart)
+        if not provider_health.get_or_check(lambda: sms_provider)['ok']:
             logger.error(f"{provider_name} credentials verification failed")
             return
         
+        # Keep the shared health state current while forwarding
+        provider_health.start(get_sms_provider)
+        
+        # Collect delivery reports of the messages sent
+        delivery_reports.start(get_sms_provider)
+        
         logger.info(f"SMS provider credentials verified successfully")
     except Exception as e:
         logger.error(f"Error with SMS provider: {e}")
@@ -191,10 +367,11 @@ async def run_forwarder():
         logger.info("Message summarization is disabled")
     
     # Create client using the web login session
-    client = TelegramClient(WEB_LOGIN_SESSION_PATH, API_ID, API_HASH)
-    
-    # Set up automatic reconnection
-    client.flood_sleep_threshold = 60  # Sleep for 60 seconds when flood wait occurs
+    # Its requests are paced by the request scheduler and go ahead of background work
+    client = ScheduledTelegramClient(WEB_LOGIN_SESSION_PATH, API_ID, API_HASH, priority=PRIORITY_LIVE)
+    summary_worker = None
+    message_store_task = None
+    stored_chats_task = None
     
     try:
         # Connect to Telegram
@@ -221,115 +398,46 @@ async def run_forwarder():
         if config.ENABLE_MESSAGE_SUMMARIZATION:
             logger.info(f"SUMMARIZATION_DELAY: {config.SUMMARIZATION_DELAY} seconds")
             logger.info(f"MAX_SUMMARY_MESSAGES: {config.MAX_SUMMARY_MESSAGES}")
+        logger.info(f"SUMMARY_WORKER_ENABLED: {SUMMARY_WORKER_ENABLED}")
         
-        # Register event handler for new messages
-        @client.on(events.NewMessage)
-        async def handle_new_message(event):
-            try:
-                # Get the chat where the message was sent
-                chat = await event.get_chat()
-                chat_id = event.chat_id
-                
-                # Log the message
-                logger.info(f"Received message from chat: {chat_id} ({get_display_name(chat)})")
-                
-                # Skip if this chat is not monitored
-                monitored = await is_monitored_chat(client, chat_id)
-                logger.info(f"Is chat monitored: {monitored}")
-                if not monitored:
-                    logger.info(f"Skipping message from non-monitored chat: {chat_id}")
-                    return
-                
-                # Skip own messages if configured to do so
-                if event.out and not config.FORWARD_OWN_MESSAGES:
-                    logger.info("Skipping own message")
-                    return
-                
-                # Get the sender
-                sender = await event.get_sender()
-                sender_name = "You" if event.out else get_display_name(sender)
-                
-                # Get chat name
-                chat_name = get_display_name(chat)
-                
-                # Handle media messages
-                if event.media and config.FORWARD_MEDIA:
-                    media_type = get_media_type(event)
-                    message_text = f"[{media_type}]"
-                    if event.message.text:
-                        message_text += f" {event.message.text}"
-                else:
-                    # Skip media messages if not configured to forward them
-                    if event.media and not config.FORWARD_MEDIA:
-                        logger.info("Skipping media message")
-                        return
-                    
-                    message_text = event.message.text
-                
-                # Skip empty messages
-                if not message_text:
-                    logger.info("Skipping empty message")
-                    return
-                
-                # Check if the chat is muted
-                is_muted = False
-                if config.ONLY_NON_MUTED_CHATS:
-                    try:
-                        dialogs = await client.get_dialogs(limit=200)
-                        for d in dialogs:
-                            if (hasattr(d, 'id') and d.id == chat_id) or \
-                               (hasattr(d, 'entity') and hasattr(d.entity, 'id') and d.entity.id == chat_id):
-                                if d.archived or d.notify_settings.mute_until:
-                                    is_muted = True
-                                break
-                    except Exception as e:
-                        logger.error(f"Error checking mute status: {e}")
-                
-                # Skip muted chats entirely
-                if is_muted:
-                    logger.info(f"Skipping message from muted chat {chat_name}")
-                    return
-                
-                # For non-muted chats, either send immediately or add to summarizer based on config
-                if config.ENABLE_MESSAGE_SUMMARIZATION and summarizer:
-                    logger.info(f"Adding message from non-muted chat {chat_name} to summarizer")
-                    summarizer.add_message(chat_id, message_text, sender_name)
-                    return
-                
-                # Format the message for SMS
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                if config.INCLUDE_SENDER_NAME:
-                    sms_text = f"[{timestamp}] {chat_name} - {sender_name}: {message_text}"
-                else:
-                    sms_text = f"[{timestamp}] {chat_name}: {message_text}"
-                
-                # Log the message
-                logger.info(f"Forwarding message from {chat_name}: {message_text[:30]}...")
-                
-                # Send the SMS
+        # Copy every received message into the local message store for the web app
+        message_store.init_db()
+        message_store_task = asyncio.create_task(message_store.run(me.id))
+        
+        async def refresh_stored_chats():
+            # Background work, so it must not hold up message handling
+            request_priority.set(PRIORITY_BULK)
+            while running:
                 try:
-                    # Truncate message if it's too long
-                    if len(sms_text) > config.MAX_SMS_LENGTH:
-                        sms_text = sms_text[:config.MAX_SMS_LENGTH - 3] + "..."
-                    
-                    # Send SMS and get success status
-                    logger.info(f"Sending SMS to {YOUR_PHONE_NUMBER}: {sms_text[:30]}...")
-                    success = sms_provider.send_sms(sms_text, YOUR_PHONE_NUMBER)
-                    
-                    if success:
-                        logger.info(f"SMS sent successfully to {YOUR_PHONE_NUMBER}")
-                    else:
-                        logger.error(f"Failed to send SMS to {YOUR_PHONE_NUMBER}")
-                        
+                    dialogs = await client.get_dialogs(limit=200)
+                    message_store.save_chats(me.id, [{
+                        'chat_id': dialog.entity.id,
+                        'chat_name': get_display_name(dialog.entity),
+                        'is_muted': bool(dialog.dialog.notify_settings.mute_until),
+                        'is_archived': dialog.archived,
+                        'last_message_at': dialog.date.timestamp() if dialog.date else 0
+                    } for dialog in dialogs])
                 except Exception as e:
-                    logger.error(f"Failed to send SMS: {e}")
-            except Exception as e:
-                logger.error(f"Error handling message: {e}")
+                    logger.error(f"Error refreshing stored chats: {e}")
+                await asyncio.sleep(STORED_CHATS_REFRESH_INTERVAL)
+        
+        stored_chats_task = asyncio.create_task(refresh_stored_chats())
+        
+        # Keep the summary page's summaries fresh in the background
+        if SUMMARY_WORKER_ENABLED:
+            summary_worker = SummaryWorker(client, me.id)
+            summary_worker.start()
+        
+        # Register event handler for new messages
+        client.add_event_handler(
+            create_message_handler(client, me, sms_provider, summarizer, summary_worker, get_provider=get_sms_provider),
+            events.NewMessage
+        )
         
         # Send a notification that the forwarder has started
         notification = f"Telegram to SMS Forwarder started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         logger.info(f"Sending startup notification: {notification}")
-        sms_provider.send_sms(notification, YOUR_PHONE_NUMBER)
+        await asyncio.get_running_loop().run_in_executor(None, sms_provider.send_sms, notification, YOUR_PHONE_NUMBER)
         
         # Log that we're starting to listen for messages
         logger.info(f"Started listening for messages")
@@ -392,19 +500,16 @@ async def run_forwarder():
                 # We'll use a generic name since we can't easily get the chat entity here
                 
                 # Format the message for SMS
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                sms_text = f"[{timestamp}] Summary from {chat_name}: {summary_text}"
-                
-                # Truncate message if it's too long
-                if len(sms_text) > config.MAX_SMS_LENGTH:
-                    sms_text = sms_text[:config.MAX_SMS_LENGTH - 3] + "..."
+                sms_text = format_summary_sms(chat_name, summary_text)
                 
                 # Send SMS and get success status
                 logger.info(f"Sending summary SMS to {YOUR_PHONE_NUMBER}: {sms_text[:30]}...")
-                success = sms_provider.send_sms(sms_text, YOUR_PHONE_NUMBER)
+                provider = get_sms_provider()
+                success = provider.send_sms(sms_text, YOUR_PHONE_NUMBER)
                 
                 if success:
                     logger.info(f"Summary SMS sent successfully to {YOUR_PHONE_NUMBER}")
+                    delivery_reports.record(provider, success, YOUR_PHONE_NUMBER, me.id, chat_id, chat_name)
                 else:
                     logger.error(f"Failed to send summary SMS to {YOUR_PHONE_NUMBER}")
             except Exception as e:
@@ -441,11 +546,24 @@ async def run_forwarder():
         # Set the running flag to False to stop the keep-alive task
         running = False
         
+        # Stop the summary worker
+        if summary_worker:
+            await summary_worker.stop()
+        
+        # Stop the message store tasks; the store writes its last batch on cancellation
+        for task in (stored_chats_task, message_store_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        
         # Send a notification that the forwarder has stopped
         try:
             notification = f"Telegram to SMS Forwarder stopped at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
             logger.info(f"Sending shutdown notification: {notification}")
-            sms_provider.send_sms(notification, YOUR_PHONE_NUMBER)
+            await asyncio.get_running_loop().run_in_executor(None, get_sms_provider().send_sms, notification, YOUR_PHONE_NUMBER)
         except Exception as e:
             logger.error(f"Failed to send shutdown notification: {e}")
         
@@ -464,6 +582,12 @@ def signal_handler(sig, frame):
     running = False
     sys.exit(0)
 
+def reload_handler(sig, frame):
+    """Rebuild SMS providers whose settings in the .env file changed."""
+    logger.info(f"Received signal {sig}, reloading SMS provider settings...")
+    # Reload in a thread: the registry's lock may be held by the code this signal interrupted
+    threading.Thread(target=provider_registry.reload, name='provider-reload', daemon=True).start()
+
 async def main():
     """Main function with automatic restart."""
     global running
@@ -471,6 +595,8 @@ async def main():
     # Set up signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, reload_handler)
     
     logger.info("Starting Telegram to SMS Forwarder with automatic restart...")
     
@@ -41,8 +41,43 @@ document.addEventListener('DOMContentLoaded', function() {
     if (statusButton) {
         statusButton.addEventListener('click', checkServiceStatus);
     }
+    
+    // Keep the status indicator current without polling /check_status
+    var events = typeof liveEvents === 'function' ? liveEvents() : null;
+    if (events && document.getElementById('status-indicator')) {
+        events.addEventListener('status', function(event) {
+            updateStatusIndicator(JSON.parse(event.data));
+        });
+    }
 });
 
+// Function to show a service status received from the server
+function updateStatusIndicator(data) {
+    var statusIndicator = document.getElementById('status-indicator');
+    var statusText = document.getElementById('status-text');
+    var lastChecked = document.getElementById('last-checked');
+    
+    statusIndicator.className = 'status-indicator';
+    
+    if (data.status === 'running') {
+        statusIndicator.classList.add('status-running');
+        statusText.textContent = 'Running';
+        statusText.className = 'text-success';
+    } else if (data.status === 'error') {
+        statusIndicator.classList.add('status-error');
+        statusText.textContent = 'Error';
+        statusText.className = 'text-danger';
+    } else {
+        statusIndicator.classList.add('status-unknown');
+        statusText.textContent = 'Unknown';
+        statusText.className = 'text-secondary';
+    }
+    
+    // Update last checked time
+    var now = new Date();
+    lastChecked.textContent = now.toLocaleTimeString();
+}
+
 // Function to check service status
 function checkServiceStatus() {
     var statusButton = document.getElementById('check-status-btn');
@@ -64,25 +99,7 @@ function checkServiceStatus() {
     .then(response => response.json())
     .then(data => {
         // Update status indicator and text
-        statusIndicator.className = 'status-indicator';
-        
-        if (data.status === 'running') {
-            statusIndicator.classList.add('status-running');
-            statusText.textContent = 'Running';
-            statusText.className = 'text-success';
-        } else if (data.status === 'error') {
-            statusIndicator.classList.add('status-error');
-            statusText.textContent = 'Error';
-            statusText.className = 'text-danger';
-        } else {
-            statusIndicator.classList.add('status-unknown');
-            statusText.textContent = 'Unknown';
-            statusText.className = 'text-secondary';
-        }
-        
-        // Update last checked time
-        var now = new Date();
-        lastChecked.textContent = now.toLocaleTimeString();
+        updateStatusIndicator(data);
         
         // Re-enable button
         statusButton.disabled = false;
@@ -8,13 +8,68 @@ document.addEventListener('DOMContentLoaded', function() {
             checkServiceStatus();
         });
     }
+
+    // Keep the status display current without polling /check_status
+    const events = liveEvents();
+    if (events && document.getElementById('service-status')) {
+        events.addEventListener('status', function(event) {
+            showServiceStatus(JSON.parse(event.data));
+        });
+    }
 });
 
+// Shared Server-Sent Events connection of the page (null if the browser has no EventSource)
+let liveEventSource = null;
+
+function liveEvents() {
+    if (!window.EventSource) {
+        return null;
+    }
+    if (!liveEventSource) {
+        liveEventSource = new EventSource('/events');
+    }
+    return liveEventSource;
+}
+
+// Escape text from Telegram before putting it into HTML
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text == null ? '' : String(text);
+    return div.innerHTML;
+}
+
+// Function to show a service status received from the server
+function showServiceStatus(data) {
+    const statusElement = document.getElementById('service-status');
+    const statusTextElement = document.getElementById('status-text');
+    const statusTimeElement = document.getElementById('status-last-check');
+    
+    if (!statusElement || !statusTextElement) {
+        return;
+    }
+    
+    if (data.status === 'running') {
+        statusElement.className = 'status-running';
+        statusTextElement.innerHTML = 'Running';
+    } else if (data.status === 'error') {
+        statusElement.className = 'status-error';
+        statusTextElement.innerHTML = 'Error: ' + (data.message || 'Unknown error');
+    } else {
+        statusElement.className = 'status-unknown';
+        statusTextElement.innerHTML = 'Unknown';
+    }
+    
+    // Update last checked time
+    if (statusTimeElement) {
+        const now = new Date();
+        statusTimeElement.innerHTML = now.toLocaleString();
+    }
+}
+
 // Function to check service status
 function checkServiceStatus() {
     const statusElement = document.getElementById('service-status');
     const statusTextElement = document.getElementById('status-text');
-    const statusTimeElement = document.getElementById('status-last-check');
     const checkButton = document.getElementById('check-status-btn');
     
     if (!statusElement || !statusTextElement || !checkButton) {
@@ -29,22 +84,7 @@ function checkServiceStatus() {
         .then(response => response.json())
         .then(data => {
             // Update status display
-            if (data.status === 'running') {
-                statusElement.className = 'status-running';
-                statusTextElement.innerHTML = 'Running';
-            } else if (data.status === 'error') {
-                statusElement.className = 'status-error';
-                statusTextElement.innerHTML = 'Error: ' + (data.message || 'Unknown error');
-            } else {
-                statusElement.className = 'status-unknown';
-                statusTextElement.innerHTML = 'Unknown';
-            }
-            
-            // Update last checked time
-            if (statusTimeElement) {
-                const now = new Date();
-                statusTimeElement.innerHTML = now.toLocaleString();
-            }
+            showServiceStatus(data);
         })
         .catch(error => {
             console.error('Error checking status:', error);
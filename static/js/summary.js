@@ -3,7 +3,16 @@
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Summary page loaded');
     
-    // Auto-refresh messages every 30 seconds
+    // Summaries are pushed by the server when they change
+    const events = liveEvents();
+    if (events) {
+        events.addEventListener('summary', function(event) {
+            updateSummaryDisplay(JSON.parse(event.data));
+        });
+        return;
+    }
+
+    // Browsers without Server-Sent Events: auto-refresh messages every 30 seconds
     setInterval(function() {
         refreshSummary();
     }, 30000);
@@ -74,7 +83,7 @@ function updateSummaryDisplay(messages) {
         console.log(`Processing message ${messageCount}:`, message);
         
         // Create the chat name part
-        let chatNameHTML = `<h2 class="summary-chat-name">${message.chat_name}</h2>`;
+        let chatNameHTML = `<h2 class="summary-chat-name">${escapeHtml(message.chat_name)}</h2>`;
         
         // Create the message text part
         let messageTextHTML = '';
@@ -89,7 +98,7 @@ function updateSummaryDisplay(messages) {
             if (isAiSummary) {
                 let cleanMessage = removeEmojis(message.message_text);
                 console.log(`AI summary (filtered): ${cleanMessage}`);
-                messageTextHTML = `<span class="summary-message-text ai-summary">${cleanMessage}</span>`;
+                messageTextHTML = `<span class="summary-message-text ai-summary">${escapeHtml(cleanMessage)}</span>`;
             } else {
                 // Join all messages with a space
                 let allMessages = '';
@@ -99,12 +108,12 @@ function updateSummaryDisplay(messages) {
                     console.log(`Sub-message ${i+1} (filtered):`, cleanMessage);
                     allMessages += cleanMessage;
                 }
-                messageTextHTML = `<span class="summary-message-text">${allMessages}</span>`;
+                messageTextHTML = `<span class="summary-message-text">${escapeHtml(allMessages)}</span>`;
             }
         } else {
             let cleanMessage = removeEmojis(message.message_text);
             console.log(`Message ${messageCount} text (filtered):`, cleanMessage);
-            messageTextHTML = `<span class="summary-message-text">${cleanMessage}</span>`;
+            messageTextHTML = `<span class="summary-message-text">${escapeHtml(cleanMessage)}</span>`;
         }
         
         // Combine them into a single line
@@ -0,0 +1,119 @@
+"""
+Summary Memory Cache
+This module provides an in-process LRU cache for chat summaries, placed in front of
+the summary_cache table so repeated summary polls don't touch the database.
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class SummaryMemoryCache:
+    """
+    LRU cache of chat summaries with a time-to-live.
+
+    Entries are content-addressed: the key is a hash of the user, the chat and
+    the ordered IDs of the messages that were summarized, so a new message in a
+    chat produces a new key and the old entry simply ages out.
+    """
+
+    def __init__(self, max_entries=512, ttl=600):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of summaries to keep in memory
+            ttl: Time in seconds after which an entry expires
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(user_id, chat_id, message_ids):
+        """
+        Build a cache key from a chat and the IDs of its messages.
+
+        Args:
+            user_id: The user's Telegram ID
+            chat_id: The chat ID
+            message_ids: IDs of the chat's messages, newest first
+
+        Returns:
+            str: Hex digest identifying this exact set of messages
+        """
+        content = f"{user_id}:{chat_id}:" + ",".join(str(message_id) for message_id in message_ids)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Get a cached summary.
+
+        Args:
+            key: Key returned by make_key
+
+        Returns:
+            str: The cached summary text, or None if missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                self.misses += 1
+                return None
+
+            # Mark as most recently used
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Store a summary, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key: Key returned by make_key
+            value: The summary text to cache
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        """
+        Get cache statistics.
+
+        Returns:
+            dict: Number of entries, hits and misses
+        """
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+# Create a global instance of the summary cache
+# Default: up to 512 summaries, each kept for 10 minutes
+summary_memory_cache = SummaryMemoryCache(max_entries=512, ttl=600)
@@ -0,0 +1,789 @@
+"""
+Summary Service
+This module generates chat summaries and keeps them in the summary_cache table. It is
+used by the forwarder's summary worker to precompute summaries, and by the web app to
+read them back without contacting Telegram or the summarization API.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import aiohttp
+from summary_memory_cache import summary_memory_cache
+from extractive_summarizer import extractive_summarizer, SUMMARY_ENGINE
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DATABASE_PATH = 'forwarder.db'
+
+# Anthropic summarization settings
+ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))  # Parallel summarization requests
+SUMMARY_REQUEST_TIMEOUT = float(os.getenv('SUMMARY_REQUEST_TIMEOUT', '10'))  # Seconds per request
+SUMMARY_PAGE_DEADLINE = float(os.getenv('SUMMARY_PAGE_DEADLINE', '12'))  # Seconds for one round of summaries
+SUMMARY_MODE = os.getenv('SUMMARY_MODE', 'per_chat').lower()  # 'per_chat' or 'batch'
+SUMMARY_BATCH_SIZE = int(os.getenv('SUMMARY_BATCH_SIZE', '8'))  # Chats per batched request
+SUMMARY_MAX_LENGTH = 300  # Longest accepted summary in a batched response
+SUMMARY_INCREMENTAL = os.getenv('SUMMARY_INCREMENTAL', 'true').lower() == 'true'  # Update cached summaries with new messages only
+SUMMARY_EXTRACTIVE_MESSAGES = 50  # Messages per chat given to the extractive engine
+SUMMARY_AI_MESSAGES = 5  # Messages per chat sent to the AI engine
+
+def get_db_connection():
+    """Get a database connection."""
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_summary_cache():
+    """Create the summary_cache table and its indexes if they don't exist."""
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS summary_cache (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            chat_id INTEGER,
+            chat_name TEXT,
+            summary_text TEXT,
+            message_count INTEGER,
+            latest_message_id INTEGER,
+            latest_timestamp INTEGER,
+            created_at INTEGER,
+            updated_at INTEGER,
+            summary_engine TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id, chat_id)
+        )
+        ''')
+        
+        # Check if the summary_engine column exists in older databases
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(summary_cache)").fetchall()]
+        if 'summary_engine' not in columns:
+            logger.info("Adding summary_engine column to summary_cache table")
+            conn.execute("ALTER TABLE summary_cache ADD COLUMN summary_engine TEXT")
+        
+        # The summary page reads a user's most recently active chats
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_summary_cache_user_timestamp ON summary_cache (user_id, latest_timestamp)')
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Error initializing summary cache: {str(e)}")
+    finally:
+        conn.close()
+
+def get_cached_summary(user_id, chat_id, chat_name=None):
+    """Get a cached summary for a chat if it exists and is not outdated."""
+    conn = get_db_connection()
+    try:
+        # Get the cached summary
+        cached = conn.execute(
+            'SELECT * FROM summary_cache WHERE user_id = ? AND chat_id = ?',
+            (user_id, chat_id)
+        ).fetchone()
+        
+        chat_info = f"chat {chat_id}" + (f" ({chat_name})" if chat_name else "")
+        
+        if cached:
+            logger.info(f"Found cached summary for {chat_info}")
+            return dict(cached)
+        else:
+            logger.info(f"No cached summary found for {chat_info}")
+            return None
+    except Exception as e:
+        logger.error(f"Error getting cached summary: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+def get_cached_summaries(user_id, chat_ids):
+    """Get the cached summaries for several chats with a single query.
+    
+    Returns:
+        Dictionary mapping chat_id to the cached summary row
+    """
+    if not chat_ids:
+        return {}
+    
+    conn = get_db_connection()
+    try:
+        placeholders = ','.join('?' for _ in chat_ids)
+        rows = conn.execute(
+            f'SELECT * FROM summary_cache WHERE user_id = ? AND chat_id IN ({placeholders})',
+            (user_id, *chat_ids)
+        ).fetchall()
+        
+        logger.info(f"Found {len(rows)} cached summaries for {len(chat_ids)} chats")
+        return {row['chat_id']: dict(row) for row in rows}
+    except Exception as e:
+        logger.error(f"Error getting cached summaries: {str(e)}")
+        return {}
+    finally:
+        conn.close()
+
+def save_summary_to_cache(user_id, chat_id, chat_name, summary_text, message_count, latest_message_id, latest_timestamp,
+                          summary_engine='anthropic'):
+    """Save or update a summary in the cache.
+    
+    summary_engine records what produced the text: 'anthropic', 'extractive',
+    or 'message' for a chat whose only message is stored as is.
+    """
+    conn = get_db_connection()
+    try:
+        current_time = int(time.time())
+        
+        # Check if a summary already exists for this chat
+        existing = conn.execute(
+            'SELECT id FROM summary_cache WHERE user_id = ? AND chat_id = ?',
+            (user_id, chat_id)
+        ).fetchone()
+        
+        if existing:
+            # Update existing summary
+            conn.execute(
+                '''UPDATE summary_cache 
+                SET summary_text = ?, message_count = ?, latest_message_id = ?, 
+                latest_timestamp = ?, updated_at = ?, chat_name = ?, summary_engine = ?
+                WHERE user_id = ? AND chat_id = ?''',
+                (summary_text, message_count, latest_message_id, latest_timestamp, 
+                 current_time, chat_name, summary_engine, user_id, chat_id)
+            )
+            logger.info(f"Updated cached summary for chat {chat_id} ({chat_name})")
+        else:
+            # Insert new summary
+            conn.execute(
+                '''INSERT INTO summary_cache 
+                (user_id, chat_id, chat_name, summary_text, message_count, 
+                latest_message_id, latest_timestamp, created_at, updated_at, summary_engine)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (user_id, chat_id, chat_name, summary_text, message_count, 
+                 latest_message_id, latest_timestamp, current_time, current_time, summary_engine)
+            )
+            logger.info(f"Created new cached summary for chat {chat_id} ({chat_name})")
+        
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error saving summary to cache: {str(e)}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def should_generate_new_summary(user_id, chat_id, chat_name, messages, cached_summaries=None, summary_engine=None):
+    """Check if we should generate a new summary based on new messages.
+    
+    If cached_summaries (as returned by get_cached_summaries) is given, the cached
+    summary is taken from it instead of querying the database again. If
+    summary_engine is given, a summary produced by a different engine (e.g. an
+    extractive fallback) is regenerated as well.
+    """
+    # Guard clauses
+    if not messages:
+        logger.warning(f"No messages to generate summary for chat {chat_name}")
+        return False
+        
+    # Sort messages by timestamp (newest first)
+    sorted_messages = sorted(messages, key=lambda x: x.get('timestamp', 0), reverse=True)
+    
+    latest_message = sorted_messages[0]
+    latest_message_id = latest_message.get('id')
+    latest_timestamp = latest_message.get('timestamp')
+    
+    # Get cached summary
+    if cached_summaries is not None:
+        cached = cached_summaries.get(chat_id)
+    else:
+        cached = get_cached_summary(user_id, chat_id)
+    
+    # If there's no cached summary, we should generate a new one
+    if not cached:
+        logger.info(f"No cached summary exists for chat {chat_id} ({chat_name}), generating new one")
+        return True
+    
+    # Safety check - if cached doesn't have the expected fields, generate a new summary
+    if 'latest_message_id' not in cached or 'latest_timestamp' not in cached or 'message_count' not in cached:
+        logger.warning(f"Cached summary for chat {chat_id} ({chat_name}) is missing fields, generating new one")
+        return True
+    
+    # Summaries from before the summary_engine column were AI summaries
+    if summary_engine and (cached.get('summary_engine') or 'anthropic') != summary_engine:
+        logger.info(f"Cached summary for chat {chat_id} ({chat_name}) was made by another engine, generating new one")
+        return True
+    
+    # If the latest message is newer than our cached summary, generate a new one
+    if latest_message_id != cached['latest_message_id'] or latest_timestamp > cached['latest_timestamp']:
+        logger.info(f"New messages in chat {chat_id} ({chat_name}), generating new summary")
+        return True
+    
+    # If the message count has changed significantly, generate a new summary
+    if abs(len(messages) - cached['message_count']) >= 2:  # If 2+ new messages
+        logger.info(f"Message count changed for chat {chat_id} ({chat_name}), generating new summary")
+        return True
+        
+    logger.info(f"Using cached summary for chat {chat_id} ({chat_name})")
+    return False
+
+def create_anthropic_session():
+    """Create an aiohttp session for the Anthropic API with keep-alive connection reuse."""
+    connector = aiohttp.TCPConnector(limit=SUMMARY_CONCURRENCY, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=SUMMARY_REQUEST_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def format_messages_for_prompt(messages):
+    """Format messages as 'sender: text' lines for a summarization prompt."""
+    return "\n".join([f"{message.get('sender_name', 'Unknown')}: {message.get('message_text', '')}" 
+                      for message in messages if message.get('message_text')])
+
+async def request_anthropic_completion(prompt, max_tokens=100, http_session=None, stats=None):
+    """
+    Send a single-turn prompt to the Anthropic Messages API.
+    
+    Args:
+        prompt: The user prompt text
+        max_tokens: Maximum number of tokens in the response
+        http_session: Optional aiohttp session to reuse; a temporary one is created if omitted
+        stats: Optional dictionary whose 'requests' counter is incremented per API call
+    
+    Returns:
+        The response text, or None if the request failed
+    """
+    # Get API key from environment
+    api_key = os.getenv('ANTHROPIC_API_KEY')
+    if not api_key:
+        logger.error("ANTHROPIC_API_KEY not found in environment variables")
+        return None
+    
+    # Make the API request to Anthropic
+    headers = {
+        "Content-Type": "application/json",
+        "x-api-key": api_key,
+        "anthropic-version": "2023-06-01"
+    }
+    
+    data = {
+        "model": "claude-3-haiku-20240307",
+        "max_tokens": max_tokens,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+    
+    owns_session = http_session is None
+    if owns_session:
+        http_session = create_anthropic_session()
+    
+    try:
+        if stats is not None:
+            stats['requests'] = stats.get('requests', 0) + 1
+        
+        logger.info("Sending request to Anthropic API")
+        async with http_session.post(ANTHROPIC_API_URL, headers=headers, json=data) as response:
+            if response.status != 200:
+                logger.error(f"Anthropic API error: {response.status} - {await response.text()}")
+                return None
+                
+            # Parse the response
+            response_data = await response.json()
+        
+        if not response_data.get('content'):
+            logger.error(f"Unexpected Anthropic API response format: {response_data}")
+            return None
+            
+        text = response_data.get('content', [{}])[0].get('text', '')
+        
+        if not text:
+            logger.error("Anthropic API returned empty response")
+            return None
+        
+        return text
+        
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error making request to Anthropic API: {str(e)}")
+        return None
+    finally:
+        if owns_session:
+            await http_session.close()
+
+def summarize_messages_locally(messages):
+    """
+    Summarize a chat with the offline extractive engine.
+    
+    Args:
+        messages: The chat's messages, newest first
+    
+    Returns:
+        The summary text, or None if the messages contain no text to summarize
+    """
+    # The extractive engine expects the conversation oldest first
+    window = list(reversed(messages[:SUMMARY_EXTRACTIVE_MESSAGES]))
+    return extractive_summarizer.summarize(window) or None
+
+def get_messages_since_summary(messages, cached_summary):
+    """
+    Get the messages newer than a cached summary's high-water mark.
+    
+    Args:
+        messages: The chat's messages, newest first
+        cached_summary: The summary_cache row for the chat, or None
+    
+    Returns:
+        List of messages with an ID above the cached latest_message_id, newest
+        first, or an empty list if there is no usable previous summary
+    """
+    if not cached_summary or not cached_summary.get('summary_text'):
+        return []
+    
+    high_water_mark = cached_summary.get('latest_message_id')
+    if high_water_mark is None:
+        return []
+    
+    return [message for message in messages if (message.get('id') or 0) > high_water_mark]
+
+async def summarize_messages_with_anthropic(messages, http_session=None, stats=None, previous_summary=None):
+    """Summarize a list of messages using Anthropic API into a single sentence.
+    
+    Args:
+        messages: List of message dictionaries to summarize
+        http_session: Optional aiohttp session to reuse; a temporary one is created if omitted
+        stats: Optional dictionary for counting API requests
+        previous_summary: Optional summary of the earlier conversation; when given,
+            only the new messages are sent and the model updates that summary
+    """
+    try:
+        # Prepare the messages for the API
+        message_text = format_messages_for_prompt(messages)
+        
+        if not message_text:
+            logger.warning("No message text found to summarize")
+            return None
+            
+        if previous_summary:
+            logger.info(f"Updating summary with {len(messages)} new messages")
+            prompt = f"Here is a one-sentence summary of a conversation so far:\n\n{previous_summary}\n\nUpdate it with the following new messages into a single concise sentence that captures the main point or latest topic. Do not start with phrases like 'The user is' or 'The main point of the conversation is'. Simply state the key information directly and concisely:\n\n{message_text}"
+        else:
+            logger.info(f"Summarizing {len(messages)} messages")
+            prompt = f"Summarize the following conversation into a single concise sentence that captures the main point or latest topic. Do not start with phrases like 'The user is' or 'The main point of the conversation is'. Simply state the key information directly and concisely:\n\n{message_text}"
+        summary = await request_anthropic_completion(prompt, 100, http_session, stats)
+        
+        if summary:
+            logger.info(f"Generated summary: {summary[:50]}...")
+        return summary
+        
+    except Exception as e:
+        logger.error(f"Error summarizing messages with Anthropic: {str(e)}")
+        return None
+
+def parse_batch_summary_response(response_text, chat_ids):
+    """
+    Parse a batched summary response into per-chat summaries.
+    
+    Args:
+        response_text: Raw model output, expected to contain a JSON object keyed by chat_id
+        chat_ids: The chat IDs that were sent in the batch
+    
+    Returns:
+        Dictionary mapping chat_id to its summary for every entry that passed
+        validation; chats with missing, empty or oversized entries are left out
+    """
+    if not response_text:
+        return {}
+    
+    # Tolerate text around the JSON object, e.g. a code fence
+    start = response_text.find('{')
+    end = response_text.rfind('}')
+    if start == -1 or end <= start:
+        logger.error("Batch summary response does not contain a JSON object")
+        return {}
+    
+    try:
+        parsed = json.loads(response_text[start:end + 1])
+    except ValueError as e:
+        logger.error(f"Batch summary response is not valid JSON: {e}")
+        return {}
+    
+    if not isinstance(parsed, dict):
+        logger.error("Batch summary response is not a JSON object")
+        return {}
+    
+    summaries = {}
+    for chat_id in chat_ids:
+        summary = parsed.get(str(chat_id))
+        if not isinstance(summary, str) or not summary.strip():
+            logger.warning(f"Batch summary for chat {chat_id} is missing or empty")
+            continue
+        if len(summary) > SUMMARY_MAX_LENGTH:
+            logger.warning(f"Batch summary for chat {chat_id} is too long ({len(summary)} characters)")
+            continue
+        summaries[chat_id] = summary.strip()
+    
+    return summaries
+
+async def summarize_batch_with_anthropic(batch, http_session=None, stats=None, previous_summaries=None):
+    """
+    Summarize several chats with a single Anthropic request.
+    
+    Args:
+        batch: Dictionary mapping chat_id to the list of messages to summarize
+        http_session: Optional aiohttp session to reuse
+        stats: Optional dictionary for counting API requests
+        previous_summaries: Optional dictionary mapping chat_id to the summary of
+            the earlier conversation, which the model updates with the new messages
+    
+    Returns:
+        Dictionary mapping chat_id to its summary for the entries that passed validation
+    """
+    sections = []
+    for chat_id, messages in batch.items():
+        message_text = format_messages_for_prompt(messages)
+        previous_summary = (previous_summaries or {}).get(chat_id)
+        if message_text and previous_summary:
+            sections.append(f'<chat id="{chat_id}">\n<previous_summary>{previous_summary}</previous_summary>\n{message_text}\n</chat>')
+        elif message_text:
+            sections.append(f'<chat id="{chat_id}">\n{message_text}\n</chat>')
+    
+    if not sections:
+        logger.warning("No message text found to summarize in batch")
+        return {}
+    
+    logger.info(f"Summarizing {len(sections)} chats in one batch request")
+    
+    prompt = (
+        "Summarize each of the following conversations into a single concise sentence that captures the main point or latest topic. "
+        "Do not start with phrases like 'The user is' or 'The main point of the conversation is'. Simply state the key information directly and concisely. "
+        "If a conversation includes a previous summary, update that summary with the new messages.\n\n"
+        "Respond with only a JSON object that maps each chat id (as a string) to its summary, "
+        'for example {"123": "Summary of chat 123."}. Include every chat id exactly once and nothing else.\n\n'
+        + "\n\n".join(sections)
+    )
+    
+    response_text = await request_anthropic_completion(prompt, 100 * len(sections), http_session, stats)
+    return parse_batch_summary_response(response_text, list(batch.keys()))
+
+async def wait_for_tasks_with_deadline(tasks, deadline):
+    """
+    Wait for a dictionary of tasks until they finish or the deadline passes.
+    
+    Unfinished tasks are cancelled. Returns a dictionary with the same keys
+    holding each task's result, or None if it failed, was cancelled or timed out.
+    """
+    if not tasks:
+        return {}
+    
+    done, pending = await asyncio.wait(tasks.values(), timeout=max(deadline, 0))
+    
+    if pending:
+        logger.warning(f"Summary deadline reached, {len(pending)}/{len(tasks)} requests did not finish")
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    results = {}
+    for key, task in tasks.items():
+        if task in done and not task.cancelled() and task.exception() is None:
+            results[key] = task.result()
+        else:
+            if task in done and not task.cancelled():
+                logger.error(f"Error generating summary for {key}: {task.exception()}")
+            results[key] = None
+    
+    return results
+
+async def summarize_chats_concurrently(jobs, deadline=None, http_session=None, stats=None, previous_summaries=None):
+    """
+    Summarize several chats in parallel, one request per chat, with bounded
+    concurrency and a shared deadline.
+    
+    Args:
+        jobs: Dictionary mapping a chat key to the list of messages to summarize
+        deadline: Seconds to wait for all summaries (defaults to SUMMARY_PAGE_DEADLINE)
+        http_session: Optional aiohttp session to reuse
+        stats: Optional dictionary for counting API requests
+        previous_summaries: Optional dictionary mapping a chat key to its previous
+            summary for incremental updates
+    
+    Returns:
+        Dictionary mapping each chat key to the summary text, or None for chats
+        that failed or did not finish before the deadline
+    """
+    if not jobs:
+        return {}
+    
+    deadline = SUMMARY_PAGE_DEADLINE if deadline is None else deadline
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    previous_summaries = previous_summaries or {}
+    
+    owns_session = http_session is None
+    if owns_session:
+        http_session = create_anthropic_session()
+    
+    try:
+        async def summarize_one(messages, previous_summary):
+            async with semaphore:
+                return await summarize_messages_with_anthropic(messages, http_session, stats, previous_summary)
+        
+        tasks = {key: asyncio.create_task(summarize_one(messages, previous_summaries.get(key))) for key, messages in jobs.items()}
+        return await wait_for_tasks_with_deadline(tasks, deadline)
+    finally:
+        if owns_session:
+            await http_session.close()
+
+async def summarize_chats_batched(jobs, deadline=None, http_session=None, stats=None, previous_summaries=None):
+    """
+    Summarize several chats by packing up to SUMMARY_BATCH_SIZE chats into each
+    request. Entries that fail validation are retried one chat per request
+    within the remaining deadline.
+    
+    Args:
+        jobs: Dictionary mapping a chat key to the list of messages to summarize
+        deadline: Seconds to wait for all summaries (defaults to SUMMARY_PAGE_DEADLINE)
+        http_session: Optional aiohttp session to reuse
+        stats: Optional dictionary for counting API requests
+        previous_summaries: Optional dictionary mapping a chat key to its previous
+            summary for incremental updates
+    
+    Returns:
+        Dictionary mapping each chat key to the summary text, or None for chats
+        that failed or did not finish before the deadline
+    """
+    if not jobs:
+        return {}
+    
+    deadline = SUMMARY_PAGE_DEADLINE if deadline is None else deadline
+    previous_summaries = previous_summaries or {}
+    started_at = time.monotonic()
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    
+    # Use positional ids in the prompt so any chat key can be batched
+    keys = list(jobs.keys())
+    batches = []
+    for offset in range(0, len(keys), SUMMARY_BATCH_SIZE):
+        batches.append({index: jobs[keys[index]] for index in range(offset, min(offset + SUMMARY_BATCH_SIZE, len(keys)))})
+    
+    owns_session = http_session is None
+    if owns_session:
+        http_session = create_anthropic_session()
+    
+    try:
+        async def summarize_batch(batch):
+            batch_previous = {index: previous_summaries[keys[index]] for index in batch if keys[index] in previous_summaries}
+            async with semaphore:
+                return await summarize_batch_with_anthropic(batch, http_session, stats, batch_previous)
+        
+        tasks = {batch_number: asyncio.create_task(summarize_batch(batch)) for batch_number, batch in enumerate(batches)}
+        batch_results = await wait_for_tasks_with_deadline(tasks, deadline)
+        
+        results = {key: None for key in keys}
+        for batch_number, summaries in batch_results.items():
+            for index, summary in (summaries or {}).items():
+                results[keys[index]] = summary
+        
+        # Retry only the chats whose batch entry failed validation
+        retry_jobs = {}
+        for batch_number, summaries in batch_results.items():
+            if summaries is None:
+                continue  # The batch itself timed out or failed, no time left to retry
+            for index in batches[batch_number]:
+                if index not in summaries:
+                    retry_jobs[keys[index]] = jobs[keys[index]]
+        
+        remaining = deadline - (time.monotonic() - started_at)
+        if retry_jobs and remaining > 0:
+            logger.info(f"Retrying {len(retry_jobs)} chats individually after batch validation")
+            retried = await summarize_chats_concurrently(retry_jobs, remaining, http_session, stats, previous_summaries)
+            results.update({key: summary for key, summary in retried.items() if summary})
+        
+        return results
+    finally:
+        if owns_session:
+            await http_session.close()
+
+async def summarize_chats(jobs, mode=None, deadline=None, previous_summaries=None):
+    """
+    Summarize several chats using the configured summary mode.
+    
+    Args:
+        jobs: Dictionary mapping a chat key to the list of messages to summarize
+        mode: 'per_chat' or 'batch' (defaults to SUMMARY_MODE)
+        deadline: Seconds to wait for all summaries (defaults to SUMMARY_PAGE_DEADLINE)
+        previous_summaries: Optional dictionary mapping a chat key to its previous
+            summary; those chats' jobs should contain only the new messages
+    
+    Returns:
+        Tuple of (summaries, stats) where summaries maps each chat key to its
+        summary or None, and stats holds the mode, request count and wall time
+    """
+    mode = mode or SUMMARY_MODE
+    stats = {'mode': mode, 'chats': len(jobs), 'incremental': len(previous_summaries or {}), 'requests': 0, 'wall_time': 0.0}
+    
+    if not jobs:
+        return {}, stats
+    
+    started_at = time.monotonic()
+    if mode == 'batch':
+        summaries = await summarize_chats_batched(jobs, deadline, stats=stats, previous_summaries=previous_summaries)
+    else:
+        summaries = await summarize_chats_concurrently(jobs, deadline, stats=stats, previous_summaries=previous_summaries)
+    stats['wall_time'] = time.monotonic() - started_at
+    
+    logger.info(f"Summarized {stats['chats']} chats ({stats['incremental']} incremental) in {mode} mode with {stats['requests']} requests in {stats['wall_time']:.2f} seconds")
+    return summaries, stats
+
+
+async def refresh_chat_summaries(user_id, chat_messages, deadline=None):
+    """
+    Bring the cached summaries of several chats up to date.
+    
+    Chats whose summary is current are skipped. The rest are summarized with
+    the configured engine: with the Anthropic engine all chats are summarized
+    concurrently or in batches (see summarize_chats), and chats that already
+    have an AI summary only send their new messages. Chats that fail or miss
+    the deadline get an extractive summary, which is replaced on the next
+    refresh. A chat with a single message stores that message as is.
+    
+    Args:
+        user_id: The user's Telegram ID
+        chat_messages: Dictionary mapping chat_id to the chat's recent messages,
+            each with id, chat_name, sender_name, message_text and timestamp
+        deadline: Seconds to wait for AI summaries (defaults to SUMMARY_PAGE_DEADLINE)
+    
+    Returns:
+        Dictionary mapping chat_id to the summary text written to the cache
+    """
+    # Local summaries are used when configured or when no API key is available
+    use_local_engine = SUMMARY_ENGINE == 'extractive' or not os.getenv('ANTHROPIC_API_KEY')
+    summary_engine = 'extractive' if use_local_engine else SUMMARY_ENGINE
+    
+    chat_messages = {chat_id: sorted(messages, key=lambda x: x.get('timestamp', 0), reverse=True)
+                     for chat_id, messages in chat_messages.items() if messages}
+    
+    results = {}
+    summary_jobs = {}
+    previous_summaries = {}
+    memory_keys = {}
+    uncached_chats = []
+    
+    for chat_id, messages in chat_messages.items():
+        if len(messages) == 1:
+            results[chat_id] = (messages[0].get('message_text', ''), 'message')
+            continue
+        
+        # The in-memory cache is keyed by the exact messages, so a hit means the stored summary is current
+        memory_keys[chat_id] = summary_memory_cache.make_key(user_id, chat_id, [m.get('id') for m in messages])
+        if summary_memory_cache.get(memory_keys[chat_id]):
+            continue
+        uncached_chats.append(chat_id)
+    
+    # Fetch the database cache for all remaining chats with one query
+    cached_summaries = get_cached_summaries(user_id, uncached_chats)
+    
+    for chat_id in uncached_chats:
+        messages = chat_messages[chat_id]
+        chat_name = messages[0].get('chat_name', 'Unknown')
+        cached_summary = cached_summaries.get(chat_id)
+        
+        try:
+            should_generate = should_generate_new_summary(user_id, chat_id, chat_name, messages, cached_summaries, summary_engine)
+        except Exception as e:
+            logger.error(f"Error checking if summary should be generated: {str(e)}")
+            should_generate = True  # Default to generating a new summary if there's an error
+        
+        if not should_generate:
+            summary_memory_cache.set(memory_keys[chat_id], cached_summary['summary_text'])
+        elif use_local_engine:
+            local_summary = summarize_messages_locally(messages)
+            if local_summary:
+                results[chat_id] = (local_summary, 'extractive')
+        else:
+            # Only send the messages newer than an AI summary's high-water mark
+            is_ai_summary = cached_summary and (cached_summary.get('summary_engine') or 'anthropic') == 'anthropic'
+            new_messages = get_messages_since_summary(messages, cached_summary) if SUMMARY_INCREMENTAL and is_ai_summary else []
+            # More new messages than one request takes would leave the older ones out for good,
+            # since the high-water mark moves to the newest message; summarize from scratch then
+            if new_messages and len(new_messages) <= SUMMARY_AI_MESSAGES:
+                logger.info(f"Queueing incremental summary for chat {chat_name} with {len(new_messages)} new messages (user_id: {user_id}, chat_id: {chat_id})")
+                summary_jobs[chat_id] = new_messages
+                previous_summaries[chat_id] = cached_summary['summary_text']
+            else:
+                logger.info(f"Queueing new summary for chat {chat_name} (user_id: {user_id}, chat_id: {chat_id})")
+                # Use up to SUMMARY_AI_MESSAGES recent messages for summarization
+                summary_jobs[chat_id] = messages[:SUMMARY_AI_MESSAGES]
+    
+    # Generate the new AI summaries in parallel
+    ai_summaries, _ = await summarize_chats(summary_jobs, deadline=deadline, previous_summaries=previous_summaries)
+    
+    for chat_id, ai_summary in ai_summaries.items():
+        if ai_summary:
+            results[chat_id] = (ai_summary, 'anthropic')
+            continue
+        
+        # Store an extractive summary until the next refresh retries the AI summary
+        logger.warning(f"AI summarization failed for chat {chat_id}, using extractive summary")
+        local_summary = summarize_messages_locally(chat_messages[chat_id])
+        if local_summary:
+            results[chat_id] = (local_summary, 'extractive')
+    
+    for chat_id, (summary_text, result_engine) in results.items():
+        messages = chat_messages[chat_id]
+        saved = save_summary_to_cache(
+            user_id=user_id,
+            chat_id=chat_id,
+            chat_name=messages[0].get('chat_name', 'Unknown'),
+            summary_text=summary_text,
+            message_count=len(messages),
+            latest_message_id=messages[0].get('id'),
+            latest_timestamp=int(messages[0].get('timestamp', 0)),
+            summary_engine=result_engine
+        )
+        if saved and result_engine == summary_engine:
+            summary_memory_cache.set(memory_keys[chat_id], summary_text)
+    
+    logger.info(f"Refreshed {len(results)} of {len(chat_messages)} chat summaries for user {user_id}")
+    return {chat_id: summary_text for chat_id, (summary_text, _) in results.items()}
+
+def get_summary_entries(user_id, limit=10):
+    """
+    Get the cached summaries of a user's most recently active chats.
+    
+    This only reads the summary_cache table, so it is cheap enough to call on
+    every summary page request.
+    
+    Args:
+        user_id: The user's Telegram ID
+        limit: Maximum number of summaries to return
+    
+    Returns:
+        List of summary entries, newest first
+    """
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            '''SELECT chat_id, chat_name, summary_text, latest_timestamp, summary_engine
+            FROM summary_cache WHERE user_id = ?
+            ORDER BY latest_timestamp DESC LIMIT ?''',
+            (user_id, limit)
+        ).fetchall()
+    except Exception as e:
+        logger.error(f"Error reading summaries: {str(e)}")
+        return []
+    finally:
+        conn.close()
+    
+    entries = []
+    for row in rows:
+        summary_engine = row['summary_engine'] or 'anthropic'
+        entries.append({
+            'chat_id': row['chat_id'],
+            'chat_name': row['chat_name'],
+            'message_text': row['summary_text'],
+            'timestamp': row['latest_timestamp'],
+            'is_ai_summary': summary_engine == 'anthropic',
+            'is_extractive': summary_engine == 'extractive',
+            'is_cached': True
+        })
+    return entries
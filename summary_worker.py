@@ -0,0 +1,255 @@
+"""
+Summary Worker
+This module keeps the per-chat summaries in summary_cache fresh from inside the
+forwarder process. New messages mark their chat as dirty; once a chat has been quiet
+for a short debounce period its recent messages are fetched and summarized, so the
+summary page only has to read the cache.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from telethon import utils
+import summary_service
+from message_store import message_store
+from chat_sync import get_display_name, get_media_type
+from telegram_scheduler import request_priority, PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+# Summary worker settings
+SUMMARY_WORKER_ENABLED = os.getenv('SUMMARY_WORKER_ENABLED', 'true').lower() == 'true'
+SUMMARY_WORKER_DEBOUNCE = float(os.getenv('SUMMARY_WORKER_DEBOUNCE', '15'))  # Quiet seconds before a chat is summarized
+SUMMARY_WORKER_MAX_DELAY = float(os.getenv('SUMMARY_WORKER_MAX_DELAY', '60'))  # Longest wait for a busy chat
+SUMMARY_WORKER_MESSAGES = int(os.getenv('SUMMARY_WORKER_MESSAGES', '10'))  # Recent messages fetched per chat
+SUMMARY_WORKER_DEADLINE = float(os.getenv('SUMMARY_WORKER_DEADLINE', '60'))  # Seconds per round of AI summaries
+SUMMARY_WORKER_DIALOGS = 30  # Dialogs scanned for mute settings
+SUMMARY_WORKER_BACKFILL_CHATS = 10  # Chats summarized when the worker starts
+SUMMARY_WORKER_DIALOG_REFRESH = 300  # Seconds between mute setting refreshes
+
+class SummaryWorker:
+    """
+    Debounced background summarizer for the chats of one Telegram account.
+
+    notify() is called for every incoming message and only (re)schedules a
+    timer, so it never slows down message handling. When a chat's timer fires
+    the chat is queued; the worker task drains the queue, fetches each queued
+    chat's recent messages with the forwarder's client and refreshes all of
+    their summaries in one summary_service.refresh_chat_summaries call.
+    """
+
+    def __init__(self, client, user_id, debounce=SUMMARY_WORKER_DEBOUNCE, max_delay=SUMMARY_WORKER_MAX_DELAY,
+                 message_limit=SUMMARY_WORKER_MESSAGES):
+        """
+        Initialize the SummaryWorker.
+
+        Args:
+            client: A connected, authorized TelegramClient
+            user_id: The user's Telegram ID, used as the summary_cache owner
+            debounce: Seconds without new messages before a chat is summarized
+            max_delay: Maximum seconds a chat with a steady stream of messages waits
+            message_limit: Number of recent messages summarized per chat
+        """
+        self.client = client
+        self.user_id = user_id
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.message_limit = message_limit
+        self.queue = asyncio.Queue()
+        self.timers = {}
+        self.first_notified = {}
+        self.muted_chats = set()
+        self.dialogs_loaded_at = 0
+        self.task = None
+
+    def start(self):
+        """Start the worker task on the running event loop."""
+        summary_service.init_summary_cache()
+        self.task = asyncio.create_task(self.run())
+        logger.info(f"Summary worker started (debounce {self.debounce}s, max delay {self.max_delay}s)")
+
+    async def stop(self):
+        """Cancel pending timers and stop the worker task."""
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        self.first_notified.clear()
+
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        logger.info("Summary worker stopped")
+
+    def notify(self, chat_id):
+        """
+        Mark a chat as having a new message.
+
+        Args:
+            chat_id: The chat ID from the message event
+        """
+        if chat_id in self.muted_chats:
+            return
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        first_notified = self.first_notified.setdefault(chat_id, now)
+
+        # Reset the debounce timer, but never wait longer than max_delay in total
+        timer = self.timers.pop(chat_id, None)
+        if timer:
+            timer.cancel()
+        delay = min(self.debounce, max(0.0, first_notified + self.max_delay - now))
+        self.timers[chat_id] = loop.call_later(delay, self.enqueue, chat_id)
+
+    def enqueue(self, chat_id):
+        """Queue a chat for summarization once its debounce timer fires."""
+        self.timers.pop(chat_id, None)
+        self.first_notified.pop(chat_id, None)
+        self.queue.put_nowait(chat_id)
+
+    async def run(self):
+        """Summarize queued chats until cancelled."""
+        # The worker shares the forwarder's client; its requests yield to message handling
+        request_priority.set(PRIORITY_BULK)
+
+        try:
+            await self.refresh_dialogs(backfill=True)
+        except Exception as e:
+            logger.error(f"Error loading dialogs for summary worker: {e}")
+
+        while True:
+            chat_ids = [await self.queue.get()]
+            while not self.queue.empty():
+                chat_ids.append(self.queue.get_nowait())
+
+            try:
+                await self.process_chats(set(chat_ids))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in summary worker: {e}")
+
+    async def refresh_dialogs(self, backfill=False):
+        """
+        Reload which chats are muted, and optionally queue the most recent
+        non-muted chats so the summary page is populated right after startup.
+        """
+        dialogs = await self.client.get_dialogs(limit=SUMMARY_WORKER_DIALOGS)
+        self.muted_chats = {dialog.id for dialog in dialogs
+                            if dialog.archived or dialog.dialog.notify_settings.mute_until}
+        self.dialogs_loaded_at = time.time()
+
+        if backfill:
+            recent_chats = [dialog.id for dialog in dialogs if dialog.id not in self.muted_chats]
+            for chat_id in recent_chats[:SUMMARY_WORKER_BACKFILL_CHATS]:
+                self.queue.put_nowait(chat_id)
+            logger.info(f"Queued {min(len(recent_chats), SUMMARY_WORKER_BACKFILL_CHATS)} chats for initial summaries")
+
+    def get_stored_chat_messages(self, chat_id):
+        """
+        Get a chat's recent text messages from the local message store.
+
+        Returns:
+            Tuple of (summary chat ID, list of message dictionaries, newest first),
+            or None if the store doesn't hold the chat's last message_limit messages
+        """
+        coverage_start = message_store.get_coverage_start(self.user_id)
+        if coverage_start is None:
+            return None
+
+        # The store is keyed by entity ID, events carry the marked peer ID
+        entity_id, _ = utils.resolve_id(chat_id)
+        chat = message_store.get_chat(self.user_id, entity_id)
+        if chat is None:
+            return None
+
+        since = message_store.get_complete_since(chat, coverage_start)
+        rows = message_store.get_chat_messages(self.user_id, entity_id, self.message_limit, since=since)
+        if len(rows) < self.message_limit:
+            return None
+
+        messages = []
+        for row in rows:
+            if not row['message_text']:  # Only include messages with text
+                continue
+
+            message_text = row['message_text']
+            if row['media_type']:
+                message_text = f"[{row['media_type']}] {message_text}"
+
+            messages.append({
+                'id': row['message_id'],
+                'chat_id': entity_id,
+                'chat_name': chat['chat_name'],
+                'sender_name': row['sender_name'] or "Unknown",
+                'message_text': message_text,
+                'timestamp': row['timestamp']
+            })
+        return entity_id, messages
+
+    async def fetch_chat_messages(self, chat_id):
+        """
+        Fetch a chat's recent text messages in the format used by summary_service,
+        reading the local message store first.
+
+        Returns:
+            Tuple of (summary chat ID, list of message dictionaries, newest first)
+        """
+        # Write buffered messages first so the chat's latest messages are included
+        message_store.flush()
+        stored = self.get_stored_chat_messages(chat_id)
+        if stored is not None:
+            return stored
+
+        chat = await self.client.get_entity(chat_id)
+        chat_name = get_display_name(chat)
+
+        messages = []
+        for message in await self.client.get_messages(chat, limit=self.message_limit):
+            if not message.message:  # Only include messages with text
+                continue
+
+            sender = await message.get_sender()
+            message_text = message.message
+            if message.media:
+                message_text = f"[{get_media_type(message)}] {message.message}"
+
+            messages.append({
+                'id': message.id,
+                'chat_id': chat.id,
+                'chat_name': chat_name,
+                'sender_name': get_display_name(sender) if sender else "Unknown",
+                'message_text': message_text,
+                'timestamp': message.date.timestamp()
+            })
+
+        # Summaries are keyed by the entity ID, like the rest of the telegram tables
+        return chat.id, messages
+
+    async def process_chats(self, chat_ids):
+        """Fetch and summarize a set of queued chats."""
+        if time.time() - self.dialogs_loaded_at > SUMMARY_WORKER_DIALOG_REFRESH:
+            await self.refresh_dialogs()
+
+        chat_messages = {}
+        for chat_id in chat_ids:
+            if chat_id in self.muted_chats:
+                continue
+            try:
+                summary_chat_id, messages = await self.fetch_chat_messages(chat_id)
+                if messages:
+                    chat_messages[summary_chat_id] = messages
+            except Exception as e:
+                logger.error(f"Error getting messages from chat {chat_id} for summary: {e}")
+
+        if not chat_messages:
+            return
+
+        started_at = time.monotonic()
+        await summary_service.refresh_chat_summaries(self.user_id, chat_messages, deadline=SUMMARY_WORKER_DEADLINE)
+        logger.info(f"Summary worker refreshed {len(chat_messages)} chats in {time.monotonic() - started_at:.2f} seconds")
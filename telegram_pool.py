@@ -0,0 +1,215 @@
+"""
+Telegram Client Pool
+This module provides a pool of connected, authorized Telegram clients for the web app's
+read paths, so request handlers borrow a client instead of building and connecting one.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+from telegram_scheduler import ScheduledTelegramClient
+
+logger = logging.getLogger(__name__)
+
+class TelegramClientPool:
+    """
+    Pool of Telegram clients that share the web login session.
+
+    The web login session file is read once and exported to a session string,
+    which every pooled client is built from, so a checkout costs at most one
+    connection instead of the two or three handshakes of copying the session
+    file each time. Idle clients are kept per user; a client that has been
+    idle longer than health_check_interval is pinged before it is handed out,
+    and reconnected or replaced if the ping fails.
+
+    Telethon clients belong to the event loop they were created on. Clients are
+    only kept between checkouts when they were created on the loop given to
+    bind_loop (the web app's long-lived loop); clients created on any other
+    loop are disconnected when released.
+
+    Pooled clients send their requests through the request scheduler at bulk
+    priority, behind the forwarder's live requests.
+    """
+
+    def __init__(self, api_id, api_hash, session_path, max_idle_per_user=2, health_check_interval=60):
+        """
+        Initialize the pool.
+
+        Args:
+            api_id: Telegram API ID
+            api_hash: Telegram API hash
+            session_path: Path of the authorized web login session file
+            max_idle_per_user: Maximum number of idle clients kept per user
+            health_check_interval: Seconds a client may sit idle before it is pinged on checkout
+        """
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.session_path = session_path
+        self.max_idle_per_user = max_idle_per_user
+        self.health_check_interval = health_check_interval
+        self.session_string = None
+        self.idle_clients = {}
+        self.loop = None
+        self.lock = threading.Lock()
+        self.stats = {'created': 0, 'reused': 0, 'reconnected': 0, 'discarded': 0}
+
+    def bind_loop(self, loop):
+        """Keep clients between checkouts when they run on this long-lived event loop."""
+        self.loop = loop
+
+    async def get_session_string(self):
+        """
+        Get the exported web login session, reading the session file only once.
+
+        Returns:
+            str: The session string, or None if the web login session is not authorized
+        """
+        if self.session_string:
+            return self.session_string
+
+        web_session = TelegramClient(self.session_path, self.api_id, self.api_hash)
+        try:
+            await web_session.connect()
+            if not await web_session.is_user_authorized():
+                logger.error("Not authorized. Please log in first.")
+                return None
+
+            logger.info("Exporting session string from web_login_session")
+            self.session_string = StringSession.save(web_session.session)
+            return self.session_string
+        finally:
+            await web_session.disconnect()
+
+    async def create_client(self):
+        """
+        Create and connect a new authorized client.
+
+        Returns:
+            TelegramClient: The connected client, or None if the session is not authorized
+        """
+        for attempt in range(2):
+            session_string = await self.get_session_string()
+            if not session_string:
+                return None
+
+            client = ScheduledTelegramClient(StringSession(session_string), self.api_id, self.api_hash)
+            await client.connect()
+            if await client.is_user_authorized():
+                self.stats['created'] += 1
+                return client
+
+            # The cached session may be from before a new login; export it again once
+            logger.warning("Pooled session is no longer authorized, re-exporting web_login_session")
+            await client.disconnect()
+            self.invalidate()
+
+        logger.error("Failed to transfer session. Please log in again.")
+        return None
+
+    async def check_client(self, client):
+        """
+        Make sure an idle client is still usable, reconnecting it if needed.
+
+        Returns:
+            bool: True if the client is connected and answered a ping
+        """
+        try:
+            if not client.is_connected():
+                await client.connect()
+                self.stats['reconnected'] += 1
+            await client.get_me(input_peer=True)
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled Telegram client failed its health check: {e}")
+            await self.close_client(client)
+            return False
+
+    async def close_client(self, client):
+        """Disconnect a client that is leaving the pool."""
+        self.stats['discarded'] += 1
+        try:
+            await client.disconnect()
+        except Exception as e:
+            logger.debug(f"Error disconnecting pooled Telegram client: {e}")
+
+    async def acquire(self, user_id):
+        """
+        Check out a connected, authorized client for a user.
+
+        Args:
+            user_id: The user's Telegram ID
+
+        Returns:
+            TelegramClient: The client, or None if the web login session is not authorized
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            with self.lock:
+                idle = self.idle_clients.get(user_id, [])
+                entry = idle.pop() if idle else None
+            if entry is None:
+                break
+
+            client, client_loop, released_at = entry
+            if client_loop is not loop:
+                # Left over from another loop; it can't be used here
+                if not client_loop.is_closed():
+                    client_loop.call_soon_threadsafe(asyncio.ensure_future, self.close_client(client))
+                continue
+
+            if time.monotonic() - released_at > self.health_check_interval or not client.is_connected():
+                if not await self.check_client(client):
+                    continue
+
+            self.stats['reused'] += 1
+            return client
+
+        return await self.create_client()
+
+    async def release(self, user_id, client):
+        """
+        Return a client to the pool.
+
+        Args:
+            user_id: The user's Telegram ID
+            client: The client returned by acquire (None is ignored)
+        """
+        if client is None:
+            return
+
+        # client.loop is always the running loop, so compare that with the bound loop
+        loop = asyncio.get_running_loop()
+        if self.loop is not None and loop is self.loop and client.is_connected():
+            with self.lock:
+                idle = self.idle_clients.setdefault(user_id, [])
+                if len(idle) < self.max_idle_per_user:
+                    idle.append((client, loop, time.monotonic()))
+                    return
+
+        await self.close_client(client)
+
+    def invalidate(self):
+        """Forget the exported session, e.g. after a new login; idle clients are dropped."""
+        with self.lock:
+            self.session_string = None
+            idle_clients = [(client, loop) for clients in self.idle_clients.values() for client, loop, _ in clients]
+            self.idle_clients.clear()
+
+        for client, loop in idle_clients:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(asyncio.ensure_future, self.close_client(client))
+
+    def get_stats(self):
+        """
+        Get pool statistics.
+
+        Returns:
+            dict: Idle clients and counters of created, reused, reconnected and discarded clients
+        """
+        with self.lock:
+            idle = sum(len(clients) for clients in self.idle_clients.values())
+        return dict(self.stats, idle=idle)
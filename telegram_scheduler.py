@@ -0,0 +1,281 @@
+"""
+Telegram Request Scheduler
+This module paces Telegram API requests with a token bucket per RPC method, adapts each
+bucket's rate to the flood waits Telegram answers with, and lets the live forwarder go
+ahead of background work such as exports and summaries.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from telethon import TelegramClient, errors, utils
+
+logger = logging.getLogger(__name__)
+
+# Path of the flood wait state shared by the web app and the forwarder process
+TELEGRAM_FLOOD_STATE_FILE = 'telegram_flood_state.json'
+
+# Request priorities
+PRIORITY_LIVE = 'live'
+PRIORITY_BULK = 'bulk'
+
+# Starting (and maximum) requests per second and burst size per RPC method
+METHOD_LIMITS = {
+    'GetHistoryRequest': (3.0, 5),
+    'GetDialogsRequest': (1.0, 2),
+    'GetPeerDialogsRequest': (1.0, 2),
+    'GetFullUserRequest': (1.0, 3),
+    'GetFullChannelRequest': (1.0, 3),
+    'GetUsersRequest': (2.0, 5),
+    'GetChannelsRequest': (2.0, 5),
+    'ResolveUsernameRequest': (0.2, 2),
+}
+DEFAULT_METHOD_LIMIT = (5.0, 10)
+
+SCHEDULER_MIN_RATE = 0.05  # Lowest rate a bucket is slowed down to, in requests per second
+SCHEDULER_RATE_INCREASE = 0.05  # Requests per second added back after each successful request
+SCHEDULER_RATE_DECREASE = 0.5  # Factor a bucket's rate is multiplied by on a flood wait
+SCHEDULER_LIVE_RESERVE = 1.0  # Tokens per bucket that only live requests may use
+
+# Priority of the requests made by the current task; overrides the client's default
+request_priority = contextvars.ContextVar('request_priority', default=None)
+
+class TokenBucket:
+    """
+    Token bucket whose refill rate follows additive-increase/multiplicative-decrease.
+
+    Every successful request adds a little to the rate, up to the method's
+    configured maximum; a flood wait halves it and empties the bucket.
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        Initialize the TokenBucket.
+
+        Args:
+            rate: Starting and maximum refill rate in tokens per second
+            capacity: Maximum number of tokens (burst size)
+        """
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        """Add the tokens accumulated since the last update."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, reserve=0.0):
+        """
+        Take a token, leaving at least `reserve` tokens in the bucket.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one is available
+        """
+        self.refill()
+        needed = 1.0 + min(reserve, self.capacity - 1.0)
+        if self.tokens >= needed:
+            self.tokens -= 1.0
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def increase(self):
+        """Additive increase after a successful request."""
+        self.rate = min(self.max_rate, self.rate + SCHEDULER_RATE_INCREASE)
+
+    def decrease(self):
+        """Multiplicative decrease after a flood wait."""
+        self.refill()
+        self.rate = max(SCHEDULER_MIN_RATE, self.rate * SCHEDULER_RATE_DECREASE)
+        self.tokens = 0.0
+
+class TelegramScheduler:
+    """
+    Per-process scheduler of Telegram API requests.
+
+    Requests wait for a token from their method's bucket. Live requests (the
+    forwarder's message handling) are served before queued bulk requests and
+    may use the last SCHEDULER_LIVE_RESERVE tokens of a bucket, which bulk
+    requests leave untouched. Flood waits are account-wide, so they are also
+    written to TELEGRAM_FLOOD_STATE_FILE, where the web app and the forwarder
+    process pick up each other's waits before sending the same method.
+    """
+
+    def __init__(self, state_file=TELEGRAM_FLOOD_STATE_FILE):
+        """
+        Initialize the TelegramScheduler.
+
+        Args:
+            state_file: Path of the shared flood wait state file
+        """
+        self.state_file = state_file
+        self.buckets = {}
+        self.live_waiting = {}
+        self.flood_until = {}
+        self.state_mtime = None
+        self.stats = {'requests': 0, 'flood_waits': 0, 'waited_seconds': 0.0}
+
+    @staticmethod
+    def get_method(request):
+        """Get the RPC method name of a request (the first one of a list)."""
+        if utils.is_list_like(request):
+            request = request[0] if request else None
+        return request.__class__.__name__
+
+    def get_bucket(self, method):
+        """Get the token bucket of a method, creating it on first use."""
+        bucket = self.buckets.get(method)
+        if bucket is None:
+            rate, capacity = METHOD_LIMITS.get(method, DEFAULT_METHOD_LIMIT)
+            bucket = self.buckets[method] = TokenBucket(rate, capacity)
+        return bucket
+
+    def load_flood_state(self):
+        """Merge flood waits recorded by other processes into flood_until."""
+        try:
+            mtime = os.path.getmtime(self.state_file)
+        except OSError:
+            return
+        if mtime == self.state_mtime:
+            return
+
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            self.state_mtime = mtime
+        except Exception as e:
+            logger.debug(f"Error reading Telegram flood state: {e}")
+            return
+
+        for method, until in state.items():
+            if until > self.flood_until.get(method, 0):
+                self.flood_until[method] = until
+                self.get_bucket(method).decrease()
+
+    def save_flood_state(self):
+        """Write the pending flood waits for the other process."""
+        now = time.time()
+        state = {method: until for method, until in self.flood_until.items() if until > now}
+        try:
+            temp_file = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(state, f)
+            os.replace(temp_file, self.state_file)
+            self.state_mtime = os.path.getmtime(self.state_file)
+        except Exception as e:
+            logger.error(f"Error saving Telegram flood state: {e}")
+
+    async def acquire(self, method, priority=PRIORITY_BULK):
+        """
+        Wait until a request of the given method may be sent.
+
+        Args:
+            method: RPC method name, e.g. "GetHistoryRequest"
+            priority: PRIORITY_LIVE or PRIORITY_BULK
+        """
+        bucket = self.get_bucket(method)
+        live = priority == PRIORITY_LIVE
+        if live:
+            self.live_waiting[method] = self.live_waiting.get(method, 0) + 1
+
+        started_at = time.monotonic()
+        try:
+            while True:
+                self.load_flood_state()
+                delay = self.flood_until.get(method, 0) - time.time()
+                if delay <= 0:
+                    if live:
+                        delay = bucket.take()
+                    elif self.live_waiting.get(method):
+                        delay = 1.0 / bucket.rate  # Let queued live requests go first
+                    else:
+                        delay = bucket.take(reserve=SCHEDULER_LIVE_RESERVE)
+                    if delay <= 0:
+                        break
+                await asyncio.sleep(delay)
+        finally:
+            if live:
+                self.live_waiting[method] -= 1
+
+        self.stats['requests'] += 1
+        self.stats['waited_seconds'] += time.monotonic() - started_at
+
+    def on_success(self, method):
+        """Speed a method up again after a successful request."""
+        self.get_bucket(method).increase()
+
+    def on_flood_wait(self, method, seconds):
+        """
+        Slow a method down and pause it for the wait Telegram asked for.
+
+        Args:
+            method: RPC method name
+            seconds: The flood wait from the FloodWaitError
+        """
+        self.get_bucket(method).decrease()
+        self.flood_until[method] = max(self.flood_until.get(method, 0), time.time() + seconds)
+        self.stats['flood_waits'] += 1
+        self.save_flood_state()
+        logger.warning(f"Flood wait of {seconds} seconds for {method}, "
+                       f"rate lowered to {self.get_bucket(method).rate:.2f} requests per second")
+
+    def get_stats(self):
+        """
+        Get scheduler statistics.
+
+        Returns:
+            dict: Request and flood wait counters and the current rate of each method
+        """
+        return dict(self.stats, rates={method: round(bucket.rate, 2) for method, bucket in self.buckets.items()})
+
+class ScheduledTelegramClient(TelegramClient):
+    """
+    TelegramClient whose requests all go through the scheduler.
+
+    Flood waits up to flood_sleep_threshold seconds are waited out by the
+    scheduler (together with every other request of the same method) and the
+    request is retried; longer ones are raised as FloodWaitError, as with a
+    plain TelegramClient.
+    """
+
+    def __init__(self, *args, priority=PRIORITY_BULK, scheduler=None, **kwargs):
+        """
+        Initialize the ScheduledTelegramClient.
+
+        Args:
+            priority: Default priority of the client's requests
+            scheduler: The TelegramScheduler to use (the process-wide one by default)
+            *args, **kwargs: Passed to TelegramClient
+        """
+        super().__init__(*args, **kwargs)
+        self.priority = priority
+        self.scheduler = scheduler or telegram_scheduler
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        if flood_sleep_threshold is None:
+            flood_sleep_threshold = self.flood_sleep_threshold
+
+        method = self.scheduler.get_method(request)
+        priority = request_priority.get() or self.priority
+        while True:
+            await self.scheduler.acquire(method, priority)
+            try:
+                # Telethon must raise flood waits so the scheduler sees them
+                result = await self._call(self._sender, request, ordered=ordered, flood_sleep_threshold=0)
+            except errors.FloodWaitError as e:
+                self.scheduler.on_flood_wait(method, e.seconds)
+                if e.seconds > flood_sleep_threshold:
+                    raise
+                continue
+
+            self.scheduler.on_success(method)
+            return result
+
+# Create a global instance of the scheduler
+telegram_scheduler = TelegramScheduler()
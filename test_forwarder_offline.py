@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test Forwarder Offline
+This script runs the forwarder's real NewMessage handler against the fake Telegram client
+and the mock SMS gateway, and checks what happens to each message: sent, dropped for a
+muted chat, rate limited, or held up by flood waits.
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+import unittest
+
+# start_forwarder requires these; the fake client and the mock gateway don't use them
+os.environ.setdefault('TELEGRAM_API_ID', '1')
+os.environ.setdefault('TELEGRAM_API_HASH', 'test')
+os.environ.setdefault('YOUR_PHONE_NUMBER', '+79000000000')
+
+import config
+import rate_limiter
+import sms_providers
+import start_forwarder
+from fake_telegram import FakeTelegramClient
+from mock_sms_gateway import MockSMSGateway
+from message_store import message_store
+from delivery_reports import delivery_reports
+from telegram_scheduler import TelegramScheduler
+
+# Keep the output readable
+logging.getLogger().setLevel(logging.WARNING)
+
+class ForwarderOfflineTest(unittest.TestCase):
+    """The forwarder's message handler, run fully offline."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        # Keep the test's writes out of forwarder.db and the shared state files
+        db_path = os.path.join(self.temp_dir.name, 'test.db')
+        self.saved_paths = (message_store.db_path, delivery_reports.db_path, rate_limiter.RATE_LIMITER_STATE_FILE)
+        message_store.db_path = delivery_reports.db_path = db_path
+        message_store.initialized = delivery_reports.initialized = False
+        rate_limiter.RATE_LIMITER_STATE_FILE = os.path.join(self.temp_dir.name, 'rate_limiter_state.json')
+        message_store.init_db()
+
+        self.saved_config = (config.FORWARD_ALL_CHATS, config.ONLY_NON_MUTED_CHATS,
+                             config.ENABLE_MESSAGE_SUMMARIZATION, config.FORWARD_OWN_MESSAGES)
+        config.FORWARD_ALL_CHATS = True
+        config.ONLY_NON_MUTED_CHATS = True
+        config.ENABLE_MESSAGE_SUMMARIZATION = False
+        config.FORWARD_OWN_MESSAGES = True
+
+        self.gateway = MockSMSGateway()
+        self.gateway.start()
+        self.addCleanup(self.gateway.stop)
+        self.saved_env = {name: os.environ.get(name) for name in ('SMSC_LOGIN', 'SMSC_PASSWORD', 'SMSC_API_URL')}
+        os.environ.update({'SMSC_LOGIN': 'test', 'SMSC_PASSWORD': 'test', 'SMSC_API_URL': f"{self.gateway.url}/sys"})
+        self.sms_provider = sms_providers.SMSCProvider()
+        self.addCleanup(self.sms_provider.close)
+
+    def tearDown(self):
+        message_store.flush()
+        message_store.db_path, delivery_reports.db_path, rate_limiter.RATE_LIMITER_STATE_FILE = self.saved_paths
+        message_store.initialized = delivery_reports.initialized = False
+        (config.FORWARD_ALL_CHATS, config.ONLY_NON_MUTED_CHATS,
+         config.ENABLE_MESSAGE_SUMMARIZATION, config.FORWARD_OWN_MESSAGES) = self.saved_config
+        for name, value in self.saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    def run_handler(self, client, events, limiter=None):
+        """Dispatch events one at a time through the handler; returns its outcome counts."""
+        stats = {}
+
+        async def run():
+            await client.connect()
+            # The logged in user is known up front, so no RPC can fail before the events
+            client.add_event_handler(start_forwarder.create_message_handler(
+                client, client.me, self.sms_provider, rate_limiter=limiter, stats=stats))
+            for make_event in events:
+                await client.dispatch(make_event())
+
+        asyncio.run(run())
+        return stats
+
+    def test_sent_muted_and_rate_limited(self):
+        client = FakeTelegramClient(chat_count=3, muted_fraction=0, seed=1)
+        quiet, busy = client.dialogs[1], client.dialogs[2]
+        muted = client.add_chat('Muted group', 'group', muted=True)
+        limiter = rate_limiter.RateLimiter(max_messages=100, max_per_chat=3, daily_limit=100)
+
+        events = ([lambda: client.make_event(quiet)] * 2 + [lambda: client.make_event(muted)] * 3
+                  + [lambda: client.make_event(busy)] * 5)
+        stats = self.run_handler(client, events, limiter)
+
+        # Muted chats are dropped by the monitoring check, before any rate limiting
+        self.assertEqual(stats, {'sent': 5, 'not_monitored': 3, 'rate_limited': 2})
+        self.assertEqual(self.gateway.stats['sent'], 5)
+        self.assertEqual(client.stats['flood_waits'], 0)
+
+    def test_flood_waits_drop_messages_without_scheduler(self):
+        client = FakeTelegramClient(chat_count=3, muted_fraction=0, flood_wait_rate=1.0, seed=1)
+
+        events = [lambda: client.make_event(client.dialogs[1])] * 3
+        stats = self.run_handler(client, events)
+
+        # A chat whose mute state can't be read is not forwarded, for safety
+        self.assertEqual(stats, {'not_monitored': 3})
+        self.assertEqual(self.gateway.stats['sent'], 0)
+        self.assertEqual(client.stats['flood_waits'], 3)
+
+    def test_flood_waits_are_waited_out_with_scheduler(self):
+        scheduler = TelegramScheduler(os.path.join(self.temp_dir.name, 'flood_state.json'))
+        client = FakeTelegramClient(chat_count=3, muted_fraction=0, flood_wait_rate=0.3, flood_wait_seconds=1,
+                                    scheduler=scheduler, seed=3)
+
+        events = [lambda: client.make_event(client.dialogs[1])] * 4
+        stats = self.run_handler(client, events)
+
+        # Every message gets through; the flood waits only delay it
+        self.assertEqual(stats, {'sent': 4})
+        self.assertEqual(self.gateway.stats['sent'], 4)
+        self.assertGreater(client.stats['flood_waits'], 0)
+        self.assertEqual(scheduler.get_stats()['flood_waits'], client.stats['flood_waits'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,8 @@ This web application provides a simple interface for managing the Telegram to SM
 """
 
 import os
+import io
+import csv
 import json
 import time
 import logging
@@ -12,11 +14,12 @@ import sqlite3
 import asyncio
 import threading
 import subprocess
+import concurrent.futures
+import itertools
 import signal
-import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, send_file
 from dotenv import load_dotenv
 import sys
 
@@ -50,11 +53,23 @@ try:
     from telethon import TelegramClient, functions, types, events
     from telethon.errors import SessionPasswordNeededError
     from telethon.tl.types import User, Chat, Channel
-    from telethon.sessions import StringSession
     import config
-    from sms_providers import get_sms_provider
+    from sms_providers import get_sms_provider, provider_registry
     from flask_session import Session  # Import Flask-Session
-    from rate_limiter import rate_limiter
+    from rate_limiter import rate_limiter, RATE_LIMITER_STATE_FILE
+    from summary_service import init_summary_cache, get_summary_entries
+    from telegram_pool import TelegramClientPool
+    from background_loop import background_loop
+    from message_store import message_store
+    from history_fetcher import HistoryFetcher
+    from chat_sync import telegram_messages_to_rows, iter_synced_chats
+    from telegram_scheduler import ScheduledTelegramClient, PRIORITY_LIVE
+    from export_jobs import export_jobs, csv_header, csv_row
+    from event_bus import event_bus
+    from response_cache import response_cache
+    from dialog_snapshot import dialog_snapshots
+    from provider_health import provider_health, PROVIDER_HEALTH_FILE
+    from delivery_reports import delivery_reports
 except Exception as e:
     logger.error(f"Error importing modules: {str(e)}", exc_info=True)
     # Continue anyway to show a proper error page to the user
@@ -64,6 +79,11 @@ TELEGRAM_SESSIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
 os.makedirs(TELEGRAM_SESSIONS_DIR, exist_ok=True)
 WEB_LOGIN_SESSION_PATH = os.path.join(TELEGRAM_SESSIONS_DIR, 'web_login_session')
 
+# Shared pool of authorized Telegram clients for the read paths; clients are kept
+# connected between requests because they all run on the background event loop
+telegram_pool = TelegramClientPool(API_ID, API_HASH, WEB_LOGIN_SESSION_PATH)
+background_loop.on_start(telegram_pool.bind_loop)
+
 # Flask app configuration
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'a-fixed-secret-key-for-development-only')
@@ -155,24 +175,6 @@ def init_db():
         )
         ''')
         
-        # Create summary_cache table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS summary_cache (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER,
-            chat_id INTEGER,
-            chat_name TEXT,
-            summary_text TEXT,
-            message_count INTEGER,
-            latest_message_id INTEGER,
-            latest_timestamp INTEGER,
-            created_at INTEGER,
-            updated_at INTEGER,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(user_id, chat_id)
-        )
-        ''')
-        
         # Check if the pid column exists in the service_status table
         cursor.execute("PRAGMA table_info(service_status)")
         columns = cursor.fetchall()
@@ -184,6 +186,15 @@ def init_db():
         
         conn.commit()
         conn.close()
+        
+        # Create the summary_cache table shared with the forwarder's summary worker
+        init_summary_cache()
+        
+        # Create the message store tables the forwarder writes every received message to
+        message_store.init_db()
+        
+        # Create the background export job tables
+        export_jobs.init_db()
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}", exc_info=True)
 
@@ -221,14 +232,15 @@ def save_user(telegram_id, phone_number, first_name, last_name, username):
     conn.close()
 
 def save_message(user_id, chat_name, sender_name, message_text, delivered):
-    """Save a forwarded message to the database."""
+    """Save a forwarded message to the database and return its row ID."""
     conn = get_db_connection()
-    conn.execute(
+    cursor = conn.execute(
         'INSERT INTO messages (user_id, chat_name, sender_name, message_text, delivered, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
         (user_id, chat_name, sender_name, message_text, delivered, int(time.time()))
     )
     conn.commit()
     conn.close()
+    return cursor.lastrowid
 
 def get_recent_messages(user_id, limit=10):
     """Get recent messages for a user."""
@@ -381,48 +393,170 @@ async def is_monitored_chat(client, chat_id):
     logger.info(f"Chat {chat_id} will not be monitored")
     return False
 
+def stored_message_to_dict(row, chat_name, archived=None):
+    """
+    Convert a message row to the message format used by the read paths.
+    
+    Args:
+        row: Message store row (or a row built by chat_sync.telegram_messages_to_rows)
+        chat_name: Chat name to show
+        archived: Archived flag to add, or None to leave it out
+    """
+    message_text = row['message_text']
+    if row['media_type']:
+        message_text = f"[{row['media_type']}]"
+        if row['message_text']:
+            message_text += f" {row['message_text']}"
+    
+    message = {
+        'id': row['message_id'],
+        'chat_id': row['chat_id'],
+        'chat_name': chat_name,
+        'sender_name': row['sender_name'] or "Unknown",
+        'message_text': message_text,
+        'timestamp': row['timestamp'],
+        'date_str': datetime.fromtimestamp(row['timestamp'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'forwarded': False  # Default to not forwarded
+    }
+    if archived is not None:
+        message['archived'] = archived
+    return message
+
+async def iter_messages_from_store(user_id, chats, per_chat_limit, coverage_start, text_only=False, mark_archived=False,
+                                   dialog_limit=500):
+    """
+    Yield the most recent messages of each chat from the local message store, one chat at a time.
+    
+    The store is complete for every chat since the forwarder started ingesting,
+    so only chats with fewer than per_chat_limit messages in that window need
+    Telegram, and only for the older messages they are missing. Those messages
+    are written through to the store, so the next read finds them there.
+    
+    Args:
+        user_id: The user's Telegram ID
+        chats: Stored chat rows from message_store.get_chats
+        per_chat_limit: Number of most recent messages per chat
+        coverage_start: Result of message_store.get_coverage_start
+        text_only: Only return messages with text
+        mark_archived: Add an " [ARCHIVED]" suffix to archived chat names and an archived flag
+        dialog_limit: Number of dialogs loaded to resolve chats with missing messages
+        
+    Yields:
+        Tuple of (chat ID, list of message dictionaries of the chat)
+    """
+    def to_messages(chat, rows):
+        chat_name = chat['chat_name']
+        if mark_archived and chat['is_archived']:
+            chat_name = f"{chat_name} [ARCHIVED]"
+        archived = bool(chat['is_archived']) if mark_archived else None
+        return [stored_message_to_dict(row, chat_name, archived) for row in rows
+                if row['message_text'] or not text_only]
+    
+    gaps = []
+    for chat in chats:
+        since = message_store.get_complete_since(chat, coverage_start)
+        rows = message_store.get_chat_messages(user_id, chat['chat_id'], per_chat_limit, since=since)
+        yield chat['chat_id'], to_messages(chat, rows)
+        
+        if len(rows) < per_chat_limit and since > 0:
+            # Messages older than the oldest stored one are still missing
+            gaps.append((chat, per_chat_limit - len(rows), rows[-1]['message_id'] if rows else 0))
+    
+    logger.info(f"Read {len(chats)} chats from the message store, {len(gaps)} need Telegram")
+    if not gaps:
+        return
+    
+    client = await telegram_pool.acquire(user_id)
+    if client is None:
+        return
+    
+    try:
+        # Pooled clients have no entity cache, so resolve the chats through the dialog list
+        dialogs = await client.get_dialogs(limit=dialog_limit)
+        entities = {dialog.entity.id: dialog.entity for dialog in dialogs}
+        gaps = [gap for gap in gaps if gap[0]['chat_id'] in entities]
+        
+        # Fetch the missing messages of all chats concurrently
+        fetcher = HistoryFetcher(client)
+        requests = [(entities[chat['chat_id']], limit, offset_id) for chat, limit, offset_id in gaps]
+        async for index, messages in fetcher.iter_chats(requests):
+            chat, limit, _ = gaps[index]
+            entity = entities[chat['chat_id']]
+            rows = await telegram_messages_to_rows(entity, messages)
+            
+            message_store.save_messages([
+                (user_id, row['chat_id'], row['message_id'], chat['chat_name'], row['sender_id'], row['sender_name'],
+                 row['message_text'], row['media_type'], row['timestamp'], row['is_outgoing'])
+                for row in rows
+            ])
+            # A short history means the chat has no older messages at all
+            if entity.id not in fetcher.incomplete:
+                history_from = messages[-1].date.timestamp() if len(messages) == limit else 0
+                message_store.mark_history(user_id, chat['chat_id'], history_from)
+            
+            yield chat['chat_id'], to_messages(chat, rows)
+    finally:
+        await telegram_pool.release(user_id, client)
+
+async def get_messages_from_store(user_id, chats, per_chat_limit, text_only=False, mark_archived=False, dialog_limit=500):
+    """
+    Get the most recent messages of each chat from the local message store.
+    
+    Returns:
+        List of message dictionaries (unsorted), or None if the store is not being fed
+    """
+    coverage_start = message_store.get_coverage_start(user_id)
+    if coverage_start is None:
+        return None
+    
+    all_messages = []
+    async for _, messages in iter_messages_from_store(user_id, chats, per_chat_limit, coverage_start, text_only=text_only,
+                                                      mark_archived=mark_archived, dialog_limit=dialog_limit):
+        all_messages.extend(messages)
+    return all_messages
+
+def mark_forwarded_messages(user_id, messages):
+    """Set the forwarded flag of messages that are in the telegram_messages table."""
+    conn = get_db_connection()
+    try:
+        for message in messages:
+            # Check if this message has been forwarded
+            forwarded = conn.execute(
+                'SELECT COUNT(*) FROM telegram_messages WHERE user_id = ? AND message_id = ? AND chat_id = ?',
+                (user_id, message['id'], message['chat_id'])
+            ).fetchone()[0] > 0
+            
+            message['forwarded'] = forwarded
+    finally:
+        conn.close()
+
 async def get_recent_telegram_messages(user_id, limit=5):
-    """Get recent messages from Telegram."""
+    """Get recent messages, from the local message store when the forwarder keeps it up to date."""
     global active_clients
     
     logger.info(f"Getting recent Telegram messages for user {user_id}, limit requested: {limit}")
     
+    # Read the 5 most recently active non-muted chats from the message store
+    try:
+        stored_chats = message_store.get_chats(user_id, include_muted=False, limit=5)
+        if stored_chats:
+            stored_messages = await get_messages_from_store(user_id, stored_chats, 5, text_only=True, dialog_limit=30)
+            if stored_messages is not None:
+                stored_messages.sort(key=lambda x: x['timestamp'], reverse=True)
+                recent_messages = stored_messages[:limit]
+                mark_forwarded_messages(user_id, recent_messages)
+                return recent_messages
+    except Exception as e:
+        logger.error(f"Error reading recent messages from the message store: {e}")
+    
     # Create a unique session name for this request
     session_id = f"telegram_session_{user_id}_{int(time.time())}"
     
-    # Create client using a StringSession instead of SQLite
-    client = TelegramClient(StringSession(), API_ID, API_HASH)
-    
-    # Connect to Telegram
+    # Borrow a connected client from the pool
     try:
-        await client.connect()
-        
-        # Check if authorized - if not, use the web_login_session
-        if not await client.is_user_authorized():
-            logger.info("Using web_login_session for authorization")
-            # Load the auth key from the web_login_session
-            web_session = TelegramClient(WEB_LOGIN_SESSION_PATH, API_ID, API_HASH)
-            await web_session.connect()
-            
-            if not await web_session.is_user_authorized():
-                logger.error("Not authorized. Please log in first.")
-                await web_session.disconnect()
-                await client.disconnect()
-                return []
-            
-            # Export the session string
-            session_string = StringSession.save(web_session.session)
-            await web_session.disconnect()
-            
-            # Reconnect with the session string
-            await client.disconnect()
-            client = TelegramClient(StringSession(session_string), API_ID, API_HASH)
-            await client.connect()
-            
-            if not await client.is_user_authorized():
-                logger.error("Failed to transfer session. Please log in again.")
-                await client.disconnect()
-                return []
+        client = await telegram_pool.acquire(user_id)
+        if client is None:
+            return []
         
         try:
             # Get all dialogs (chats) with a reasonable limit to avoid flood wait
@@ -448,56 +582,20 @@ async def get_recent_telegram_messages(user_id, limit=5):
             
             all_messages = []
             
-            # Get recent messages from each non-muted chat
-            for idx, chat in enumerate(non_muted_chats[:5]):  # Limit to 5 chats to avoid flood wait
-                try:
-                    chat_name = get_display_name(chat)
-                    logger.info(f"Getting messages from chat {idx+1}/{len(non_muted_chats[:5])}: {chat_name}")
-                    
-                    # Use a smaller limit per chat to avoid flood wait
-                    messages = await client.get_messages(chat, limit=5)  # Increase to 5 messages per chat
-                    
-                    logger.info(f"Retrieved {len(messages)} messages from chat: {chat_name}")
-                    
-                    # Log each message retrieved for debugging
-                    for msg_idx, message in enumerate(messages):
-                        if message.message:  # Only include messages with text
-                            logger.info(f"  - Message {msg_idx+1}: {message.message[:30]}...")
-                        else:
-                            logger.info(f"  - Message {msg_idx+1}: <no text content>")
-                    
-                    for message in messages:
-                        if message.message:  # Only include messages with text
-                            sender = await message.get_sender()
-                            sender_name = get_display_name(sender) if sender else "Unknown"
-                            
-                            # Handle media messages
-                            if message.media:
-                                media_type = get_media_type_from_message(message)
-                                message_text = f"[{media_type}]"
-                                if message.message:
-                                    message_text += f" {message.message}"
-                            else:
-                                message_text = message.message
-                            
-                            # Add message to the list
-                            all_messages.append({
-                                'id': message.id,
-                                'chat_id': chat.id,
-                                'chat_name': chat_name,
-                                'sender_name': sender_name,
-                                'message_text': message_text,
-                                'timestamp': message.date.timestamp(),
-                                'forwarded': False  # Default to not forwarded
-                            })
-                            logger.info(f"  - Added message: {sender_name} in {chat_name}: {message_text[:30]}...")
-                except Exception as e:
-                    logger.error(f"Error getting messages from chat {get_display_name(chat)}: {e}")
-                    # Don't break the loop, continue with other chats
-                    continue
+            # Sync 5 recent messages of each of the 5 most recent non-muted chats concurrently,
+            # fetching only messages newer than each chat's sync cursor
+            fetcher = HistoryFetcher(client)
+            chats = non_muted_chats[:5]
+            async for index, rows in iter_synced_chats(fetcher, user_id, chats, 5):
+                chat = chats[index]
+                chat_name = get_display_name(chat)
+                logger.info(f"Retrieved {len(rows)} messages from chat: {chat_name}")
                 
-                # Add a small delay between chat requests to avoid flood wait
-                await asyncio.sleep(0.5)
+                for row in rows:
+                    if row['message_text']:  # Only include messages with text
+                        message = stored_message_to_dict(row, chat_name)
+                        all_messages.append(message)
+                        logger.info(f"  - Added message: {message['sender_name']} in {chat_name}: {message['message_text'][:30]}...")
             
             # Sort all messages by timestamp (newest first)
             all_messages.sort(key=lambda x: x['timestamp'], reverse=True)
@@ -516,25 +614,14 @@ async def get_recent_telegram_messages(user_id, limit=5):
                 logger.info(f"Return message {idx+1}: {msg['sender_name']} in {msg['chat_name']}: {msg['message_text'][:30]}...")
             
             # Check which messages have been forwarded
-            conn = get_db_connection()
-            try:
-                for message in recent_messages:
-                    # Check if this message has been forwarded
-                    forwarded = conn.execute(
-                        'SELECT COUNT(*) FROM telegram_messages WHERE user_id = ? AND message_id = ? AND chat_id = ?',
-                        (user_id, message['id'], message['chat_id'])
-                    ).fetchone()[0] > 0
-                    
-                    message['forwarded'] = forwarded
-            finally:
-                conn.close()
+            mark_forwarded_messages(user_id, recent_messages)
             
             return recent_messages
         except Exception as e:
             logger.error(f"Error getting recent Telegram messages: {e}")
             return []
         finally:
-            await client.disconnect()
+            await telegram_pool.release(user_id, client)
     except Exception as e:
         logger.error(f"Error connecting to Telegram: {e}")
         return []
@@ -582,8 +669,8 @@ async def run_forwarder(user_id, phone_number):
     """Run the Telegram to SMS forwarder."""
     global active_clients
     
-    # Create client using the web login session
-    client = TelegramClient(WEB_LOGIN_SESSION_PATH, API_ID, API_HASH)
+    # Create client using the web login session; it forwards live messages, so it gets live priority
+    client = ScheduledTelegramClient(WEB_LOGIN_SESSION_PATH, API_ID, API_HASH, priority=PRIORITY_LIVE)
     
     # Store the client in the active_clients dictionary
     active_clients[user_id] = client
@@ -602,8 +689,8 @@ async def run_forwarder(user_id, phone_number):
         sms_provider = get_sms_provider()
         logger.info(f"Using SMS provider: {sms_provider.__class__.__name__}")
         
-        # Verify SMS provider credentials
-        if not sms_provider.verify_credentials():
+        # Verify SMS provider credentials, reusing a recent health check
+        if not provider_health.get_or_check(lambda: sms_provider)['ok']:
             logger.error("SMS provider credentials verification failed")
             update_service_status(user_id, 'error', 'SMS provider credentials verification failed')
             return
@@ -611,11 +698,14 @@ async def run_forwarder(user_id, phone_number):
         # Send a test SMS to verify functionality
         test_message = f"Telegram to SMS Forwarder service started. You will now receive messages via SMS."
         logger.info(f"Sending test SMS to {phone_number}...")
-        if not sms_provider.send_sms(test_message, phone_number):
+        result = await asyncio.get_running_loop().run_in_executor(None, sms_provider.send_sms, test_message, phone_number)
+        if not result:
             logger.error(f"Failed to send test SMS to {phone_number}")
             update_service_status(user_id, 'error', f"Failed to send test SMS to {phone_number}")
             return
         logger.info(f"Test SMS sent successfully to {phone_number}")
+        delivery_reports.record(sms_provider, result, phone_number, user_id)
+        delivery_reports.start(get_sms_provider)
     except ValueError as e:
         logger.error(f"Failed to initialize SMS provider: {e}")
         update_service_status(user_id, 'error', f"Failed to initialize SMS provider: {e}")
@@ -709,23 +799,22 @@ async def run_forwarder(user_id, phone_number):
                 if len(sms_text) > config.MAX_SMS_LENGTH:
                     sms_text = sms_text[:config.MAX_SMS_LENGTH - 3] + "..."
                 
-                # Send SMS
+                # Send SMS off the event loop; a routed send can wait through several providers.
+                # Use the shared instance, so a provider rebuilt by a settings reload is picked up.
                 logger.info(f"Sending SMS to {phone_number}: {sms_text[:30]}...")
-                success = sms_provider.send_sms(sms_text, phone_number)
+                provider = get_sms_provider()
+                success = await asyncio.get_running_loop().run_in_executor(None, provider.send_sms, sms_text, phone_number)
                 
                 if success:
                     logger.info(f"SMS sent successfully to {phone_number}")
+                    # Save the message first, so its delivery report can update it; both off the event loop
+                    def record_delivery():
+                        message_row_id = save_message(user_id, chat_name, sender_name, message_text, True)
+                        delivery_reports.record(provider, success, phone_number, user_id, chat_id, chat_name, message_row_id)
+                    await asyncio.get_running_loop().run_in_executor(None, record_delivery)
+                    
                     # Record the message in the rate limiter
                     rate_limiter.record_message(chat_id)
-                    
-                    # Save the message to the database
-                    conn = get_db_connection()
-                    conn.execute(
-                        'INSERT INTO messages (user_id, chat_id, sender_id, message, timestamp) VALUES (?, ?, ?, ?, ?)',
-                        (user_id, chat_id, sender.id if sender else None, message_text, int(time.time()))
-                    )
-                    conn.commit()
-                    conn.close()
                 else:
                     logger.error(f"Failed to send SMS to {phone_number}")
                     
@@ -902,27 +991,28 @@ def login_required(f):
     return decorated_function
 
 # Helper function to run async code
-def run_async(coro):
-    """Run an asynchronous coroutine and return its result."""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+def run_async(coro, timeout=60):
+    """Run an asynchronous coroutine on the background event loop and return its result.
+    
+    Args:
+        coro: The coroutine to run
+        timeout: Seconds after which the coroutine is cancelled (1 minute by default)
+    """
+    # Get the coroutine name if possible
+    coro_name = coro.__qualname__ if hasattr(coro, '__qualname__') else str(coro)
+    logger.info(f"Running async coroutine: {coro_name}")
+    
     try:
-        # Get the coroutine name if possible
-        coro_name = coro.__qualname__ if hasattr(coro, '__qualname__') else str(coro)
-        logger.info(f"Running async coroutine: {coro_name}")
-        
-        # Special handling for get_all_messages_last_6h which needs more time
-        if 'get_all_messages_last_6h' in coro_name:
-            timeout = 300  # 5 minutes timeout for message retrieval
-            logger.info(f"Using extended timeout of {timeout} seconds for message retrieval")
-        else:
-            timeout = 60  # 1 minute for other operations
-        
-        # Set a global timeout for the coroutine
-        result = loop.run_until_complete(asyncio.wait_for(coro, timeout=timeout))
+        future = background_loop.submit(coro, timeout=timeout)
+        try:
+            # The loop cancels the coroutine at the timeout; the margin only guards against a stuck loop
+            result = future.result(timeout=timeout + 5)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
         logger.info("Async coroutine completed successfully")
         return result
-    except asyncio.TimeoutError:
+    except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
         logger.error(f"Async operation timed out after {timeout} seconds")
         raise ConnectionError(f"Operation timed out after {timeout} seconds. Please try again.")
     except ConnectionError as e:
@@ -936,11 +1026,6 @@ def run_async(coro):
             raise ConnectionError(f"Failed to connect: {str(e)}")
         else:
             raise
-    finally:
-        try:
-            loop.close()
-        except:
-            pass
 
 # Async Telegram client operations
 async def send_code_request_async(phone):
@@ -1057,6 +1142,9 @@ async def sign_in_async(phone, code, phone_code_hash, password=None):
         try:
             me = await asyncio.wait_for(client.get_me(), timeout=10)
             logger.info(f"Got user info: {me.first_name} (ID: {me.id})")
+            
+            # Pooled clients were built from the previous login session
+            telegram_pool.invalidate()
             return me, False
         except asyncio.TimeoutError:
             logger.error("Getting user info timed out")
@@ -1236,7 +1324,7 @@ def dashboard():
     # Get recent messages
     messages = []
     try:
-        messages = asyncio.run(get_recent_telegram_messages(user_id))
+        messages = run_async(get_recent_telegram_messages(user_id))
     except Exception as e:
         logger.error(f"Error getting recent messages: {e}")
     
@@ -1284,19 +1372,8 @@ def settings():
             chat_window = int(request.form.get('chat_window', 3600))
             daily_limit = int(request.form.get('daily_limit', 30))
             
-            # Get selected chats from form
-            selected_chats = []
-            for key in request.form:
-                if key.startswith('chat_'):
-                    chat_id = key.replace('chat_', '')
-                    # Try to convert to integer if possible
-                    try:
-                        chat_id = int(chat_id)
-                    except ValueError:
-                        pass
-                    selected_chats.append(chat_id)
-            
-            logger.info(f"Selected chats: {selected_chats}")
+            # Chats are selected on the chat selection page; keep the current selection
+            selected_chats = list(config.MONITORED_CHATS)
             
             # Update the config file
             with open('config.py', 'w') as f:
@@ -1343,6 +1420,9 @@ DEBUG = True
             import importlib
             importlib.reload(config)
             
+            # Pick up SMS provider settings changed in the .env file
+            provider_registry.reload()
+            
             flash('Settings updated successfully', 'success')
             return redirect(url_for('settings'))
         except Exception as e:
@@ -1370,6 +1450,16 @@ DEBUG = True
                           settings=current_settings, 
                           limits_info=limits_info)
 
+def get_provider_health():
+    """
+    Get the SMS provider's cached health, starting the background checks on first use.
+    
+    Only the first call for a provider (with no check of it by either process yet) waits for a
+    provider round trip.
+    """
+    provider_health.start(get_sms_provider)
+    return provider_health.get_or_check(get_sms_provider)
+
 @app.route('/check_status')
 @login_required
 def check_status():
@@ -1396,15 +1486,16 @@ def check_status():
             return jsonify({'status': 'error', 'message': 'No user found. Please login again.'})
     
     try:
-        # Check if the SMS provider is working
-        sms_provider = get_sms_provider()
-        if sms_provider.verify_credentials():
+        # Check if the SMS provider is working, from the cached health check
+        health = get_provider_health()
+        if health['ok']:
             # Don't update the status here, just return the current status
             status = get_service_status(user_id)
-            return jsonify({'status': status['status'], 'message': status.get('error_message')})
+            return jsonify({'status': status['status'], 'message': status.get('error_message'), 'provider': health})
         else:
             update_service_status(user_id, 'error', 'SMS provider credentials verification failed')
-            return jsonify({'status': 'error', 'message': 'SMS provider credentials verification failed'})
+            return jsonify({'status': 'error', 'message': 'SMS provider credentials verification failed',
+                            'provider': health})
     except Exception as e:
         update_service_status(user_id, 'error', str(e))
         return jsonify({'status': 'error', 'message': str(e)})
@@ -1505,6 +1596,34 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
+def cached_json_response(user_id, endpoint, compute):
+    """
+    Answer a JSON API request from the response cache.
+    
+    Concurrent identical requests share one call of compute, and a request
+    whose If-None-Match matches the response's ETag gets 304 Not Modified.
+    
+    Args:
+        user_id: The user's Telegram ID
+        endpoint: Endpoint name, part of the cache key with the query parameters
+        compute: Function returning the response data
+    """
+    key = response_cache.make_key(user_id, endpoint, request.args.to_dict())
+    body, etag = response_cache.get(key, compute)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'  # Revalidate with the ETag on every request
+    return response.make_conditional(request)
+
+def invalidate_cached_responses(user_id, event):
+    """Drop cached refresh responses when the live events show their data changed."""
+    if event == 'messages':
+        response_cache.invalidate(user_id, 'refresh_telegram_messages')
+    elif event == 'summary':
+        response_cache.invalidate(user_id, 'refresh_summary')
+
+event_bus.add_listener(invalidate_cached_responses)
+
 @app.route('/refresh_telegram_messages')
 @login_required
 def refresh_telegram_messages():
@@ -1531,17 +1650,136 @@ def refresh_telegram_messages():
             else:
                 return jsonify({'success': False, 'error': 'No user found. Please login again.'})
         
-        messages = run_async(get_recent_telegram_messages(user_id, 5))
-        
-        # Format timestamps for display
-        for message in messages:
-            message['timestamp_formatted'] = format_timestamp(message['timestamp'])
+        def compute():
+            messages = run_async(get_recent_telegram_messages(user_id, 5))
+            
+            # Format timestamps for display
+            for message in messages:
+                message['timestamp_formatted'] = format_timestamp(message['timestamp'])
+            
+            return {'success': True, 'messages': messages}
         
-        return jsonify({'success': True, 'messages': messages})
+        return cached_json_response(user_id, 'refresh_telegram_messages', compute)
     except Exception as e:
         app.logger.error(f"Error refreshing Telegram messages: {str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
+def get_stored_recent_messages(user_id, limit=5):
+    """
+    Get recent messages of the most recently active non-muted chats from the message store only.
+    
+    Unlike get_recent_telegram_messages this never contacts Telegram, so it is
+    cheap enough to run on every database change.
+    """
+    messages = []
+    for chat in message_store.get_chats(user_id, include_muted=False, limit=5):
+        rows = message_store.get_chat_messages(user_id, chat['chat_id'], 5)
+        messages.extend(stored_message_to_dict(row, chat['chat_name']) for row in rows if row['message_text'])
+    
+    messages.sort(key=lambda x: x['timestamp'], reverse=True)
+    recent_messages = messages[:limit]
+    mark_forwarded_messages(user_id, recent_messages)
+    for message in recent_messages:
+        message['timestamp_formatted'] = format_timestamp(message['timestamp'])
+    return recent_messages
+
+def get_live_status(user_id):
+    """Get the forwarder status as stored in the database and the last SMS provider health check."""
+    status = get_service_status(user_id)
+    live_status = {'status': status['status'], 'message': status.get('error_message')}
+    
+    health = provider_health.get()
+    if health is not None:
+        # Leave out the age, which would make every evaluation look like a change
+        live_status['provider'] = {key: value for key, value in health.items() if key != 'age'}
+    return live_status
+
+def get_live_limits(user_id):
+    """Get the SMS rate limit counters, which the forwarder process writes to its state file."""
+    rate_limiter.load_state()
+    limits_info = rate_limiter.get_limits_info()
+    return {key: limits_info[key] for key in ('daily_counter', 'daily_limit', 'global_usage', 'time_until_reset')}
+
+# Live events pushed to open dashboard and summary pages
+event_bus.register('messages', get_stored_recent_messages)
+event_bus.register('summary', lambda user_id: get_summary_entries(user_id, 10))
+event_bus.register('status', get_live_status)
+event_bus.register('limits', get_live_limits)
+event_bus.watch_file(RATE_LIMITER_STATE_FILE)
+event_bus.watch_file(PROVIDER_HEALTH_FILE)
+
+@app.route('/events')
+@login_required
+def event_stream():
+    """Server-Sent Events stream of the user's messages, summaries, forwarder status and rate limits."""
+    user_id = session['user']['id']
+    response = Response(event_bus.stream(user_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a proxy buffer the stream
+    return response
+
+# Seconds a CSV download waits for the next chat's messages
+CSV_EXPORT_BATCH_TIMEOUT = 300
+
+def stream_messages_csv(batches, first_batch, include_archived=False):
+    """
+    Write messages as CSV, yielding the text of each chat's batch as soon as it is written.
+    
+    Args:
+        batches: Iterator of (chat ID, message list) tuples, one per chat
+        first_batch: A batch already taken from batches, written first
+        include_archived: Add an Archived column
+        
+    Yields:
+        CSV text chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(csv_header(include_archived))
+    
+    message_count = 0
+    try:
+        for _, messages in itertools.chain([first_batch], batches):
+            writer.writerows(csv_row(message, include_archived) for message in messages)
+            message_count += len(messages)
+            
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        
+        logger.info(f"CSV download finished with {message_count} messages")
+    except Exception as e:
+        # The response has started, so the download can only end early
+        logger.error(f"Error streaming CSV download after {message_count} messages: {e}", exc_info=True)
+    finally:
+        # Stops the message retrieval if the client went away
+        batches.close()
+
+def csv_download_response(user_id, include_archived, per_chat_limit, filename_prefix):
+    """
+    Start a streaming CSV download of every chat's recent messages.
+    
+    Returns:
+        Response: The chunked CSV response, or None if there are no messages
+    """
+    batches = background_loop.iterate(
+        iter_chat_messages(user_id, include_archived=include_archived, per_chat_limit=per_chat_limit),
+        timeout=CSV_EXPORT_BATCH_TIMEOUT
+    )
+    
+    # Wait for the first chat with messages, so an empty export can still redirect
+    first_batch = next((batch for batch in batches if batch[1]), None)
+    if first_batch is None:
+        return None
+    
+    current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"{filename_prefix}_{current_time}.csv"
+    logger.info(f"Streaming CSV download with filename: {filename}")
+    
+    response = Response(stream_messages_csv(batches, first_batch, include_archived), mimetype='text/csv')
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
 @app.route('/download_recent_messages')
 @login_required
 def download_recent_messages():
@@ -1552,57 +1790,12 @@ def download_recent_messages():
         
         logger.info(f"Starting download of messages from non-archived chats for user {user_id}")
         
-        # Get all messages from non-archived chats
-        all_messages = run_async(get_all_messages_last_6h(user_id))
-        
-        logger.info(f"Retrieved {len(all_messages)} total messages for download")
-        
-        if not all_messages:
+        response = csv_download_response(user_id, False, 200, "telegram_messages_nonarchived")
+        if response is None:
             logger.warning(f"No messages found in non-archived chats for user {user_id}")
             flash('No messages found in non-archived chats. Please check if you have any non-archived chats with messages.', 'info')
             return redirect(url_for('dashboard'))
         
-        # Create CSV content
-        csv_content = "Timestamp,Date,Time,Chat,Sender,Message\n"
-        
-        # Process all messages
-        message_count = 0
-        for message in all_messages:
-            try:
-                # Convert timestamp to datetime
-                message_date = datetime.fromtimestamp(message['timestamp'])
-                date_str = message_date.strftime('%Y-%m-%d')
-                time_str = message_date.strftime('%H:%M:%S')
-                
-                # Escape CSV fields
-                chat = str(message['chat_name']).replace(',', ' ').replace('\n', ' ')
-                sender = str(message['sender_name']).replace(',', ' ').replace('\n', ' ')
-                msg_text = str(message['message_text']).replace(',', ' ').replace('\n', ' ')
-                
-                # Add to CSV
-                csv_content += f"{message['timestamp']},{date_str},{time_str},{chat},{sender},{msg_text}\n"
-                message_count += 1
-                
-                # Log every 10th message for debugging
-                if message_count % 10 == 0:
-                    logger.info(f"Processed {message_count} messages for CSV")
-                
-            except Exception as e:
-                logger.error(f"Error processing message for CSV: {e}", exc_info=True)
-                continue
-        
-        logger.info(f"Successfully processed {message_count} messages for CSV download")
-        
-        # Create response with CSV file
-        current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"telegram_messages_nonarchived_{current_time}.csv"
-        logger.info(f"Creating CSV response with filename: {filename}")
-        
-        response = make_response(csv_content)
-        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-        response.headers["Content-Type"] = "text/csv"
-        
-        logger.info(f"CSV download response created successfully with {message_count} messages from non-archived chats")
         return response
         
     except Exception as e:
@@ -1610,164 +1803,80 @@ def download_recent_messages():
         flash('Error downloading messages. Please try again.', 'error')
         return redirect(url_for('dashboard'))
 
-async def get_all_messages_last_6h(user_id):
-    """Get all messages from non-archived chats only."""
-    global active_clients
+async def iter_chat_messages(user_id, include_archived=False, per_chat_limit=200, skip_chat_ids=None, on_chats=None):
+    """
+    Yield the most recent messages of every chat, one chat at a time.
     
-    logger.info(f"Starting message retrieval for user {user_id} (non-archived chats only)")
+    Chats are read from the local message store when the forwarder keeps it up
+    to date, otherwise every chat's history is fetched from Telegram
+    concurrently and each chat is yielded as soon as it arrives.
     
-    # Create client using a StringSession instead of SQLite
-    client = TelegramClient(StringSession(), API_ID, API_HASH)
+    Args:
+        user_id: The user's Telegram ID
+        include_archived: Include archived chats; their names get an " [ARCHIVED]"
+            suffix and messages an archived flag
+        per_chat_limit: Number of most recent messages per chat
+        skip_chat_ids: IDs of chats to leave out, e.g. chats an export already wrote
+        on_chats: Optional callback called with the total number of chats
+            (including skipped ones) once the chat list is known
+        
+    Yields:
+        Tuple of (chat ID, list of message dictionaries of the chat, newest first)
+    """
+    skip_chat_ids = skip_chat_ids or set()
+    scope = "including archived chats" if include_archived else "non-archived chats only"
+    logger.info(f"Starting message retrieval for user {user_id} ({scope})")
+    
+    # Read from the local message store when the forwarder keeps it up to date
+    coverage_start = message_store.get_coverage_start(user_id)
+    stored_chats = message_store.get_chats(user_id, include_archived=include_archived) if coverage_start is not None else []
+    if stored_chats:
+        if on_chats:
+            on_chats(len(stored_chats))
+        stored_chats = [chat for chat in stored_chats if chat['chat_id'] not in skip_chat_ids]
+        async for chat_id, messages in iter_messages_from_store(user_id, stored_chats, per_chat_limit, coverage_start,
+                                                                mark_archived=include_archived):
+            yield chat_id, messages
+        return
+    
+    # Borrow a connected client from the pool
+    logger.info(f"Connecting to Telegram for user {user_id}")
+    client = await telegram_pool.acquire(user_id)
+    if client is None:
+        return
     
-    # Connect to Telegram
     try:
-        logger.info(f"Connecting to Telegram for user {user_id}")
-        await client.connect()
-        
-        # Check if authorized - if not, use the web_login_session
-        if not await client.is_user_authorized():
-            logger.info("Using web_login_session for authorization")
-            # Load the auth key from the web_login_session
-            web_session = TelegramClient(WEB_LOGIN_SESSION_PATH, API_ID, API_HASH)
-            await web_session.connect()
-            
-            if not await web_session.is_user_authorized():
-                logger.error("Not authorized. Please log in first.")
-                await web_session.disconnect()
-                await client.disconnect()
-                return []
-            
-            # Export the session string
-            logger.info("Exporting session string from web_login_session")
-            session_string = StringSession.save(web_session.session)
-            await web_session.disconnect()
-            
-            # Reconnect with the session string
-            logger.info("Reconnecting with session string")
-            await client.disconnect()
-            client = TelegramClient(StringSession(session_string), API_ID, API_HASH)
-            await client.connect()
-            
-            if not await client.is_user_authorized():
-                logger.error("Failed to transfer session. Please log in again.")
-                await client.disconnect()
-                return []
+        # Get all dialogs (chats)
+        dialogs = await client.get_dialogs(limit=500)  # Get a large number of dialogs
+        logger.info(f"Retrieved {len(dialogs)} total dialogs")
         
-        try:
-            # Get all dialogs (chats)
-            logger.info("Getting dialogs (chats)")
-            dialogs = await client.get_dialogs(limit=500)  # Get a large number of dialogs to filter
-            logger.info(f"Retrieved {len(dialogs)} total dialogs")
-            
+        if not include_archived:
             # Filter out archived chats
-            non_archived_dialogs = []
-            archived_count = 0
-            
-            for dialog in dialogs:
-                # Check if the dialog is archived
+            archived_count = sum(1 for dialog in dialogs if dialog.archived)
+            dialogs = [dialog for dialog in dialogs if not dialog.archived]
+            logger.info(f"Filtered out {archived_count} archived chats, processing {len(dialogs)} non-archived chats")
+        
+        if on_chats:
+            on_chats(len(dialogs))
+        dialogs = [dialog for dialog in dialogs if dialog.entity.id not in skip_chat_ids]
+        
+        # Sync every chat concurrently, fetching only messages newer than its sync cursor,
+        # and yield each as it completes
+        fetcher = HistoryFetcher(client)
+        async for index, rows in iter_synced_chats(fetcher, user_id, [dialog.entity for dialog in dialogs], per_chat_limit):
+            dialog = dialogs[index]
+            chat_name = get_display_name(dialog.entity)
+            archived = None
+            if include_archived:
+                archived = dialog.archived
                 if dialog.archived:
-                    archived_count += 1
-                    logger.info(f"Skipping archived chat: {get_display_name(dialog.entity)}")
-                    continue
-                
-                non_archived_dialogs.append(dialog)
-            
-            logger.info(f"Filtered out {archived_count} archived chats, processing {len(non_archived_dialogs)} non-archived chats")
-            
-            all_messages = []
-            chat_count = 0
-            
-            # Get recent messages from each non-archived chat
-            for dialog in non_archived_dialogs:
-                try:
-                    chat_count += 1
-                    chat = dialog.entity
-                    chat_name = get_display_name(chat)
-                    logger.info(f"[{chat_count}/{len(non_archived_dialogs)}] Getting messages from chat: {chat_name}")
-                    
-                    # Get messages from this chat
-                    messages = await client.get_messages(
-                        chat, 
-                        limit=200  # Increased limit to get more messages
-                    )
-                    
-                    logger.info(f"Retrieved {len(messages)} messages from chat: {chat_name}")
-                    
-                    message_count = 0
-                    for message in messages:
-                        if message.message or message.media:  # Include messages with text or media
-                            try:
-                                message_count += 1
-                                sender = await message.get_sender()
-                                sender_name = get_display_name(sender) if sender else "Unknown"
-                                
-                                # Handle media messages
-                                if message.media:
-                                    media_type = get_media_type_from_message(message)
-                                    message_text = f"[{media_type}]"
-                                    if message.message:
-                                        message_text += f" {message.message}"
-                                else:
-                                    message_text = message.message
-                                
-                                # Skip empty messages
-                                if not message_text:
-                                    continue
-                                
-                                # Add message to the list
-                                all_messages.append({
-                                    'id': message.id,
-                                    'chat_id': chat.id,
-                                    'chat_name': chat_name,
-                                    'sender_name': sender_name,
-                                    'message_text': message_text,
-                                    'timestamp': message.date.timestamp(),
-                                    'date_str': message.date.strftime('%Y-%m-%d %H:%M:%S'),
-                                    'forwarded': False  # Default to not forwarded
-                                })
-                                
-                                # Log every 10th message for debugging
-                                if message_count % 10 == 0:
-                                    logger.info(f"Processed {message_count}/{len(messages)} messages from {chat_name}")
-                                
-                            except Exception as e:
-                                logger.error(f"Error processing message: {e}", exc_info=True)
-                                continue
-                    
-                    logger.info(f"Added {message_count} messages from chat: {chat_name}")
-                    
-                except Exception as e:
-                    logger.error(f"Error getting messages from chat {get_display_name(dialog.entity)}: {e}", exc_info=True)
-                    # Don't break the loop, continue with other chats
-                    continue
-                
-                # Add a small delay between chat requests to avoid flood wait
-                await asyncio.sleep(0.5)
-                
-                # Break after processing 20 chats to avoid timeouts
-                if chat_count >= 20:
-                    logger.info(f"Reached limit of 20 chats, stopping retrieval")
-                    break
-            
-            # Sort all messages by timestamp (newest first)
-            all_messages.sort(key=lambda x: x['timestamp'], reverse=True)
-            
-            # Log all retrieved messages for debugging
-            logger.info(f"All retrieved messages ({len(all_messages)}):")
-            for i, msg in enumerate(all_messages[:10]):  # Log first 10 messages
-                logger.info(f"Message {i+1}: {msg['chat_name']} - {msg['date_str']} - {msg['message_text'][:30]}...")
-            
-            logger.info(f"Total messages retrieved: {len(all_messages)}")
-            return all_messages
-        except Exception as e:
-            logger.error(f"Error getting all messages: {e}", exc_info=True)
-            return []
-        finally:
-            logger.info("Disconnecting Telegram client")
-            await client.disconnect()
-    except Exception as e:
-        logger.error(f"Error connecting to Telegram: {e}", exc_info=True)
-        return []
+                    # Add archived indicator to chat name
+                    chat_name = f"{chat_name} [ARCHIVED]"
+
+            logger.info(f"Added {len(rows)} messages from chat: {chat_name}")
+            yield dialog.entity.id, [stored_message_to_dict(row, chat_name, archived) for row in rows]
+    finally:
+        await telegram_pool.release(user_id, client)
 
 @app.route('/forward_message', methods=['POST'])
 @login_required
@@ -1797,7 +1906,7 @@ def forward_message():
         # Format the SMS message
         sms_text = f"From {sender_name} in {chat_name}: {message_text}"
         
-        # Initialize SMS provider
+        # Shared SMS provider instance
         sms_provider = get_sms_provider()
         
         # Send SMS - note the parameter order: message_text, to_number
@@ -1829,10 +1938,13 @@ def forward_message():
             conn.commit()
             
             # Also save to messages table for consistency
-            save_message(user_id, chat_name, sender_name, message_text, True)
+            message_row_id = save_message(user_id, chat_name, sender_name, message_text, True)
             
             conn.close()
             
+            delivery_reports.record(sms_provider, success, phone_number, user_id, chat_id, chat_name, message_row_id)
+            delivery_reports.start(get_sms_provider)
+            
             app.logger.info(f"Message {message_id} manually forwarded to {phone_number}")
             return jsonify({'success': True})
         else:
@@ -1843,34 +1955,6 @@ def forward_message():
         app.logger.error(f"Error forwarding message: {str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
-def get_sms_provider():
-    """Initialize and return the configured SMS provider."""
-    provider_name = os.environ.get('SMS_PROVIDER', 'smsc').lower()
-    
-    try:
-        if provider_name == 'twilio':
-            from sms_providers import TwilioProvider
-            return TwilioProvider()
-        elif provider_name == 'messagebird':
-            from sms_providers import MessageBirdProvider
-            return MessageBirdProvider()
-        elif provider_name == 'vonage':
-            from sms_providers import VonageProvider
-            return VonageProvider()
-        else:  # Default to SMSC
-            from sms_providers import SMSCProvider
-            return SMSCProvider()
-    except Exception as e:
-        logger.error(f"Error initializing SMS provider {provider_name}: {e}")
-        # Try to fall back to another provider
-        try:
-            logger.info("Falling back to SMSC provider")
-            from sms_providers import SMSCProvider
-            return SMSCProvider()
-        except Exception as e:
-            logger.error(f"Error initializing fallback SMS provider: {e}")
-            raise ValueError(f"Failed to initialize any SMS provider: {e}")
-
 # Custom template filter for timestamp formatting
 @app.template_filter('timestamp_to_datetime')
 def timestamp_to_datetime(timestamp):
@@ -1890,233 +1974,133 @@ def format_timestamp(timestamp):
     except (ValueError, TypeError):
         return "Invalid timestamp"
 
-async def get_all_messages_including_archived(user_id):
-    """Get all messages from all chats including archived ones."""
-    global active_clients
+# Export types: whether archived chats are included and how many messages per chat
+EXPORT_SCOPES = {
+    'nonarchived': (False, 200),
+    'all': (True, 100)
+}
+
+def export_source(user_id, scope):
+    """Get the function an export job calls to iterate over the chats of its scope."""
+    include_archived, per_chat_limit = EXPORT_SCOPES[scope]
     
-    logger.info(f"Starting message retrieval for user {user_id} (including archived chats)")
+    def source(skip_chat_ids, on_chats):
+        return iter_chat_messages(user_id, include_archived=include_archived, per_chat_limit=per_chat_limit,
+                                  skip_chat_ids=skip_chat_ids, on_chats=on_chats)
     
-    # Create client using a StringSession instead of SQLite
-    client = TelegramClient(StringSession(), API_ID, API_HASH)
+    return source
+
+def start_export_job(user_id, scope):
+    """Get a reusable export of the given scope for a user, or start a background job for it."""
+    include_archived, _ = EXPORT_SCOPES[scope]
+    return export_jobs.start(user_id, scope, include_archived, export_source(user_id, scope), background_loop.submit)
+
+def get_user_export_job(job_id):
+    """Get an export job of the logged-in user, resuming it if it was interrupted."""
+    job = export_jobs.get_job(job_id)
+    if job is None or job['user_id'] != session['user']['id']:
+        return None
     
-    # Connect to Telegram
-    try:
-        logger.info(f"Connecting to Telegram for user {user_id}")
-        await client.connect()
-        
-        # Check if authorized - if not, use the web_login_session
-        if not await client.is_user_authorized():
-            logger.info("Using web_login_session for authorization")
-            # Load the auth key from the web_login_session
-            web_session = TelegramClient(WEB_LOGIN_SESSION_PATH, API_ID, API_HASH)
-            await web_session.connect()
-            
-            if not await web_session.is_user_authorized():
-                logger.error("Not authorized. Please log in first.")
-                await web_session.disconnect()
-                await client.disconnect()
-                return []
-            
-            # Export the session string
-            logger.info("Exporting session string from web_login_session")
-            session_string = StringSession.save(web_session.session)
-            await web_session.disconnect()
-            
-            # Reconnect with the session string
-            logger.info("Reconnecting with session string")
-            await client.disconnect()
-            client = TelegramClient(StringSession(session_string), API_ID, API_HASH)
-            await client.connect()
-            
-            if not await client.is_user_authorized():
-                logger.error("Failed to transfer session. Please log in again.")
-                await client.disconnect()
-                return []
-        
-        try:
-            # Get all dialogs (chats)
-            logger.info("Getting all dialogs (including archived)")
-            dialogs = await client.get_dialogs(limit=500)  # Get a large number of dialogs
-            logger.info(f"Retrieved {len(dialogs)} total dialogs")
-            
-            # Count archived chats
-            archived_count = sum(1 for dialog in dialogs if dialog.archived)
-            logger.info(f"Found {archived_count} archived chats out of {len(dialogs)} total")
-            
-            all_messages = []
-            chat_count = 0
-            
-            # Get recent messages from each chat
-            for dialog in dialogs:
-                try:
-                    chat_count += 1
-                    chat = dialog.entity
-                    chat_name = get_display_name(chat)
-                    
-                    # Add archived indicator to chat name
-                    if dialog.archived:
-                        chat_name = f"{chat_name} [ARCHIVED]"
-                    
-                    logger.info(f"[{chat_count}/{len(dialogs)}] Getting messages from chat: {chat_name}")
-                    
-                    # Get messages from this chat
-                    messages = await client.get_messages(
-                        chat, 
-                        limit=100  # Use a smaller limit for all chats to avoid timeouts
-                    )
-                    
-                    logger.info(f"Retrieved {len(messages)} messages from chat: {chat_name}")
-                    
-                    message_count = 0
-                    for message in messages:
-                        if message.message or message.media:  # Include messages with text or media
-                            try:
-                                message_count += 1
-                                sender = await message.get_sender()
-                                sender_name = get_display_name(sender) if sender else "Unknown"
-                                
-                                # Handle media messages
-                                if message.media:
-                                    media_type = get_media_type_from_message(message)
-                                    message_text = f"[{media_type}]"
-                                    if message.message:
-                                        message_text += f" {message.message}"
-                                else:
-                                    message_text = message.message
-                                
-                                # Skip empty messages
-                                if not message_text:
-                                    continue
-                                
-                                # Add message to the list
-                                all_messages.append({
-                                    'id': message.id,
-                                    'chat_id': chat.id,
-                                    'chat_name': chat_name,
-                                    'sender_name': sender_name,
-                                    'message_text': message_text,
-                                    'timestamp': message.date.timestamp(),
-                                    'date_str': message.date.strftime('%Y-%m-%d %H:%M:%S'),
-                                    'forwarded': False,  # Default to not forwarded
-                                    'archived': dialog.archived  # Add archived flag
-                                })
-                                
-                                # Log every 10th message for debugging
-                                if message_count % 10 == 0:
-                                    logger.info(f"Processed {message_count}/{len(messages)} messages from {chat_name}")
-                                
-                            except Exception as e:
-                                logger.error(f"Error processing message: {e}", exc_info=True)
-                                continue
-                    
-                    logger.info(f"Added {message_count} messages from chat: {chat_name}")
-                    
-                except Exception as e:
-                    logger.error(f"Error getting messages from chat {get_display_name(dialog.entity)}: {e}", exc_info=True)
-                    # Don't break the loop, continue with other chats
-                    continue
-                
-                # Add a small delay between chat requests to avoid flood wait
-                await asyncio.sleep(0.5)
-                
-                # Break after processing 30 chats to avoid timeouts
-                if chat_count >= 30:
-                    logger.info(f"Reached limit of 30 chats, stopping retrieval")
-                    break
-            
-            # Sort all messages by timestamp (newest first)
-            all_messages.sort(key=lambda x: x['timestamp'], reverse=True)
-            
-            # Log all retrieved messages for debugging
-            logger.info(f"All retrieved messages ({len(all_messages)}):")
-            for i, msg in enumerate(all_messages[:10]):  # Log first 10 messages
-                logger.info(f"Message {i+1}: {msg['chat_name']} - {msg['date_str']} - {msg['message_text'][:30]}...")
-            
-            logger.info(f"Total messages retrieved: {len(all_messages)}")
-            return all_messages
-        except Exception as e:
-            logger.error(f"Error getting all messages: {e}", exc_info=True)
-            return []
-        finally:
-            logger.info("Disconnecting Telegram client")
-            await client.disconnect()
-    except Exception as e:
-        logger.error(f"Error connecting to Telegram: {e}", exc_info=True)
-        return []
+    export_jobs.ensure_running(job, export_source(job['user_id'], job['scope']), background_loop.submit)
+    return job
+
+def export_status_response(job):
+    """Get the JSON status of an export job with its URLs."""
+    status = export_jobs.get_status(job)
+    status['status_url'] = url_for('export_status', job_id=job['job_id'])
+    if job['status'] == 'completed':
+        status['download_url'] = url_for('download_export', job_id=job['job_id'])
+    return jsonify(status)
 
 @app.route('/download_all_messages')
 @login_required
 def download_all_messages():
-    """Download messages from all chats including archived ones as a CSV file."""
+    """Export messages from all chats including archived ones as a compressed CSV file."""
     try:
         # Get user_id from session
         user_id = session['user']['id']
         
-        logger.info(f"Starting download of messages from ALL chats (including archived) for user {user_id}")
-        
-        # Get all messages including from archived chats
-        all_messages = run_async(get_all_messages_including_archived(user_id))
+        logger.info(f"Starting export of messages from ALL chats (including archived) for user {user_id}")
         
-        logger.info(f"Retrieved {len(all_messages)} total messages for download (including archived chats)")
-        
-        if not all_messages:
+        # A recent export is served again right away; otherwise the page follows the job's progress
+        job = start_export_job(user_id, 'all')
+        if job['status'] == 'completed' and not job['message_count']:
             logger.warning(f"No messages found in any chats for user {user_id}")
             flash('No messages found in any chats. Please try again later.', 'info')
             return redirect(url_for('dashboard'))
+        if job['status'] == 'completed':
+            return redirect(url_for('download_export', job_id=job['job_id']))
         
-        # Create CSV content
-        csv_content = "Timestamp,Date,Time,Chat,Sender,Message,Archived\n"
-        
-        # Process all messages
-        message_count = 0
-        archived_count = 0
-        for message in all_messages:
-            try:
-                # Convert timestamp to datetime
-                message_date = datetime.fromtimestamp(message['timestamp'])
-                date_str = message_date.strftime('%Y-%m-%d')
-                time_str = message_date.strftime('%H:%M:%S')
-                
-                # Escape CSV fields
-                chat = str(message['chat_name']).replace(',', ' ').replace('\n', ' ')
-                sender = str(message['sender_name']).replace(',', ' ').replace('\n', ' ')
-                msg_text = str(message['message_text']).replace(',', ' ').replace('\n', ' ')
-                archived = "Yes" if message.get('archived', False) else "No"
-                
-                if message.get('archived', False):
-                    archived_count += 1
-                
-                # Add to CSV
-                csv_content += f"{message['timestamp']},{date_str},{time_str},{chat},{sender},{msg_text},{archived}\n"
-                message_count += 1
-                
-                # Log every 10th message for debugging
-                if message_count % 10 == 0:
-                    logger.info(f"Processed {message_count} messages for CSV")
-                
-            except Exception as e:
-                logger.error(f"Error processing message for CSV: {e}", exc_info=True)
-                continue
-        
-        logger.info(f"Successfully processed {message_count} messages for CSV download (including {archived_count} from archived chats)")
-        
-        # Create response with CSV file
-        current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"telegram_messages_all_{current_time}.csv"
-        logger.info(f"Creating CSV response with filename: {filename}")
-        
-        response = make_response(csv_content)
-        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-        response.headers["Content-Type"] = "text/csv"
-        
-        logger.info(f"CSV download response created successfully with {message_count} messages from all chats")
-        return response
+        return render_template('export_status.html', job=export_jobs.get_status(job),
+                               status_url=url_for('export_status', job_id=job['job_id']))
         
     except Exception as e:
-        logger.error(f"Error downloading messages: {e}", exc_info=True)
+        logger.error(f"Error starting message export: {e}", exc_info=True)
         flash('Error downloading messages. Please try again.', 'error')
         return redirect(url_for('dashboard'))
 
+@app.route('/exports', methods=['POST'])
+@login_required
+def create_export():
+    """Start a background export, or reuse a running or recent one."""
+    scope = (request.get_json(silent=True) or request.form).get('scope', 'all')
+    if scope not in EXPORT_SCOPES:
+        return jsonify({'success': False, 'error': f"Unknown export scope: {scope}"}), 400
+    
+    try:
+        job = start_export_job(session['user']['id'], scope)
+        return export_status_response(job)
+    except Exception as e:
+        logger.error(f"Error starting message export: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/exports/<job_id>')
+@login_required
+def export_status(job_id):
+    """Get the status and percent complete of an export job."""
+    job = get_user_export_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Export not found'}), 404
+    return export_status_response(job)
+
+@app.route('/exports/<job_id>/download')
+@login_required
+def download_export(job_id):
+    """Download a finished export; Range requests are supported for resumed downloads."""
+    job = get_user_export_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Export not found'}), 404
+    if job['status'] != 'completed':
+        return jsonify({'success': False, 'error': 'Export is not finished yet'}), 409
+    
+    path = export_jobs.get_artifact_path(job_id)
+    if not os.path.exists(path):
+        return jsonify({'success': False, 'error': 'Export has expired'}), 410
+    
+    completed_at = datetime.fromtimestamp(job['completed_at']).strftime('%Y%m%d_%H%M%S')
+    prefix = "telegram_messages_all" if job['scope'] == 'all' else f"telegram_messages_{job['scope']}"
+    return send_file(path, mimetype='application/gzip', as_attachment=True,
+                     download_name=f"{prefix}_{completed_at}.csv.gz", conditional=True, max_age=0)
+
+@app.route('/delivery_report')
+@login_required
+def delivery_report():
+    """Get SMS delivery rates, latency and cost per chat and per provider, over the last `days` days (7 by default)."""
+    user_id = session['user']['id']
+    days = max(request.args.get('days', 7, type=int), 1)
+    since = int(time.time()) - days * 86400
+
+    try:
+        return jsonify({
+            'success': True,
+            'days': days,
+            'chats': delivery_reports.get_report('chat', user_id, since),
+            'providers': delivery_reports.get_report('provider', user_id, since)
+        })
+    except Exception as e:
+        logger.error(f"Error getting delivery report: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/update_daily_limit', methods=['POST'])
 @login_required
 def update_daily_limit():
@@ -2196,317 +2180,6 @@ def internal_error(error):
     logger.error(f"Internal server error: {str(error)}", exc_info=True)
     return render_template('error.html', error=str(error))
 
-def get_cached_summary(user_id, chat_id, chat_name=None):
-    """Get a cached summary for a chat if it exists and is not outdated."""
-    conn = get_db_connection()
-    try:
-        # Get the cached summary
-        cached = conn.execute(
-            'SELECT * FROM summary_cache WHERE user_id = ? AND chat_id = ?',
-            (user_id, chat_id)
-        ).fetchone()
-        
-        chat_info = f"chat {chat_id}" + (f" ({chat_name})" if chat_name else "")
-        
-        if cached:
-            logger.info(f"Found cached summary for {chat_info}")
-            return dict(cached)
-        else:
-            logger.info(f"No cached summary found for {chat_info}")
-            return None
-    except Exception as e:
-        logger.error(f"Error getting cached summary: {str(e)}")
-        return None
-    finally:
-        conn.close()
-
-def save_summary_to_cache(user_id, chat_id, chat_name, summary_text, message_count, latest_message_id, latest_timestamp):
-    """Save or update a summary in the cache."""
-    conn = get_db_connection()
-    try:
-        current_time = int(time.time())
-        
-        # Check if a summary already exists for this chat
-        existing = conn.execute(
-            'SELECT id FROM summary_cache WHERE user_id = ? AND chat_id = ?',
-            (user_id, chat_id)
-        ).fetchone()
-        
-        if existing:
-            # Update existing summary
-            conn.execute(
-                '''UPDATE summary_cache 
-                SET summary_text = ?, message_count = ?, latest_message_id = ?, 
-                latest_timestamp = ?, updated_at = ?, chat_name = ?
-                WHERE user_id = ? AND chat_id = ?''',
-                (summary_text, message_count, latest_message_id, latest_timestamp, 
-                 current_time, chat_name, user_id, chat_id)
-            )
-            logger.info(f"Updated cached summary for chat {chat_id} ({chat_name})")
-        else:
-            # Insert new summary
-            conn.execute(
-                '''INSERT INTO summary_cache 
-                (user_id, chat_id, chat_name, summary_text, message_count, 
-                latest_message_id, latest_timestamp, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (user_id, chat_id, chat_name, summary_text, message_count, 
-                 latest_message_id, latest_timestamp, current_time, current_time)
-            )
-            logger.info(f"Created new cached summary for chat {chat_id} ({chat_name})")
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error(f"Error saving summary to cache: {str(e)}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
-
-def should_generate_new_summary(user_id, chat_id, chat_name, messages):
-    """Check if we should generate a new summary based on new messages."""
-    # Guard clauses
-    if not messages:
-        logger.warning(f"No messages to generate summary for chat {chat_name}")
-        return False
-        
-    # Sort messages by timestamp (newest first)
-    sorted_messages = sorted(messages, key=lambda x: x.get('timestamp', 0), reverse=True)
-    
-    latest_message = sorted_messages[0]
-    latest_message_id = latest_message.get('id')
-    latest_timestamp = latest_message.get('timestamp')
-    
-    # Get cached summary
-    cached = get_cached_summary(user_id, chat_id)
-    
-    # If there's no cached summary, we should generate a new one
-    if not cached:
-        logger.info(f"No cached summary exists for chat {chat_id} ({chat_name}), generating new one")
-        return True
-    
-    # Safety check - if cached doesn't have the expected fields, generate a new summary
-    if 'latest_message_id' not in cached or 'latest_timestamp' not in cached or 'message_count' not in cached:
-        logger.warning(f"Cached summary for chat {chat_id} ({chat_name}) is missing fields, generating new one")
-        return True
-    
-    # If the latest message is newer than our cached summary, generate a new one
-    if latest_message_id != cached['latest_message_id'] or latest_timestamp > cached['latest_timestamp']:
-        logger.info(f"New messages in chat {chat_id} ({chat_name}), generating new summary")
-        return True
-    
-    # If the message count has changed significantly, generate a new summary
-    if abs(len(messages) - cached['message_count']) >= 2:  # If 2+ new messages
-        logger.info(f"Message count changed for chat {chat_id} ({chat_name}), generating new summary")
-        return True
-        
-    logger.info(f"Using cached summary for chat {chat_id} ({chat_name})")
-    return False
-
-async def summarize_messages_with_anthropic(messages):
-    """Summarize a list of messages using Anthropic API into a single sentence."""
-    try:
-        # Get API key from environment
-        api_key = os.getenv('ANTHROPIC_API_KEY')
-        if not api_key:
-            logger.error("ANTHROPIC_API_KEY not found in environment variables")
-            return None
-            
-        # Prepare the messages for the API
-        message_text = "\n".join([f"{message.get('sender_name', 'Unknown')}: {message.get('message_text', '')}" 
-                                  for message in messages if message.get('message_text')])
-        
-        if not message_text:
-            logger.warning("No message text found to summarize")
-            return None
-            
-        logger.info(f"Summarizing {len(messages)} messages")
-        
-        # Make the API request to Anthropic
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": api_key,
-            "anthropic-version": "2023-06-01"
-        }
-        
-        data = {
-            "model": "claude-3-haiku-20240307",
-            "max_tokens": 100,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"Summarize the following conversation into a single concise sentence that captures the main point or latest topic. Do not start with phrases like 'The user is' or 'The main point of the conversation is'. Simply state the key information directly and concisely:\n\n{message_text}"
-                }
-            ]
-        }
-        
-        try:
-            logger.info("Sending request to Anthropic API")
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data,
-                timeout=10  # Add a timeout to avoid hanging
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Anthropic API error: {response.status_code} - {response.text}")
-                return None
-                
-            # Parse the response
-            response_data = response.json()
-            if not response_data.get('content'):
-                logger.error(f"Unexpected Anthropic API response format: {response_data}")
-                return None
-                
-            summary = response_data.get('content', [{}])[0].get('text', '')
-            
-            if not summary:
-                logger.error("Anthropic API returned empty summary")
-                return None
-                
-            # Log and return
-            logger.info(f"Generated summary: {summary[:50]}...")
-            return summary
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error making request to Anthropic API: {str(e)}")
-            return None
-        
-    except Exception as e:
-        logger.error(f"Error summarizing messages with Anthropic: {str(e)}")
-        return None
-
-async def process_telegram_messages_for_summary(raw_messages, limit=10, user_id=None):
-    """
-    Process raw telegram messages for the summary view.
-    Groups messages by chat and applies special formatting for channels with multiple messages.
-    
-    Args:
-        raw_messages: List of raw Telegram messages
-        limit: Maximum number of summaries to return
-        user_id: The user's Telegram ID for caching summaries
-    
-    Returns:
-        List of summaries, either one per chat or combined for chats with multiple messages
-    """
-    if not raw_messages:
-        logger.warning("No messages to process for summary")
-        return []
-    
-    logger.info(f"Processing {len(raw_messages)} raw messages for summary")
-    
-    # Group messages by chat_name
-    chat_messages = {}
-    for message in raw_messages:
-        chat_name = message.get('chat_name', 'Unknown')
-        if chat_name not in chat_messages:
-            chat_messages[chat_name] = []
-        chat_messages[chat_name].append(message)
-    
-    # Sort messages in each chat by timestamp (newest first)
-    for chat_name in chat_messages:
-        chat_messages[chat_name].sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-    
-    summary_entries = []
-    
-    for chat_name, messages in chat_messages.items():
-        # If more than one message in this chat and we have a user_id, consider summarizing
-        if len(messages) > 1 and user_id:
-            # Extract chat_id from the first message
-            chat_id = messages[0].get('chat_id')
-            
-            # Skip if no chat_id is present
-            if not chat_id:
-                logger.warning(f"No chat_id found for {chat_name}, skipping summarization")
-                message_text = messages[0].get('message_text', 'No message content')
-                is_ai_summary = False
-                is_cached = False
-                continue
-            
-            # Get latest message details for caching checks
-            latest_message = max(messages, key=lambda x: x.get('timestamp', 0))
-            latest_message_id = latest_message.get('id')
-            latest_timestamp = latest_message.get('timestamp')
-            
-            # Check if we should generate a new summary
-            cached_summary = get_cached_summary(user_id, chat_id)
-            try:
-                should_generate = should_generate_new_summary(user_id, chat_id, chat_name, messages)
-            except Exception as e:
-                logger.error(f"Error checking if summary should be generated: {str(e)}")
-                should_generate = True  # Default to generating a new summary if there's an error
-            
-            # Default values
-            is_ai_summary = False
-            is_cached = False
-            
-            if should_generate:
-                logger.info(f"Generating new summary for chat {chat_name} (user_id: {user_id}, chat_id: {chat_id})")
-                # Use up to 5 recent messages for summarization
-                messages_to_summarize = messages[:5]
-                # Generate a summary for multiple messages
-                try:
-                    ai_summary = await summarize_messages_with_anthropic(messages_to_summarize)
-                    
-                    if ai_summary:
-                        logger.info(f"Successfully generated AI summary for {chat_name}")
-                        message_text = ai_summary
-                        is_ai_summary = True
-                        
-                        # Store in cache
-                        save_summary_to_cache(
-                            user_id=user_id,
-                            chat_id=chat_id,
-                            chat_name=chat_name,
-                            summary_text=ai_summary,
-                            message_count=len(messages),
-                            latest_message_id=latest_message_id,
-                            latest_timestamp=latest_timestamp
-                        )
-                    else:
-                        # Fallback to the latest message text if summarization fails
-                        logger.warning(f"AI summarization failed for {chat_name}, using latest message text")
-                        message_text = messages[0].get('message_text', 'No message content')
-                except Exception as e:
-                    logger.error(f"Error generating summary for {chat_name}: {str(e)}")
-                    message_text = messages[0].get('message_text', 'No message content')
-            else:
-                # Use cached summary
-                if cached_summary:
-                    logger.info(f"Using cached summary for chat {chat_name}")
-                    message_text = cached_summary['summary_text']
-                    is_ai_summary = True
-                    is_cached = True
-                else:
-                    # Fallback to the latest message text if no cached summary
-                    logger.info(f"No cached summary for {chat_name}, using latest message text")
-                    message_text = messages[0].get('message_text', 'No message content')
-        else:
-            # For single messages, just use the text directly
-            message_text = messages[0].get('message_text', 'No message content')
-            is_ai_summary = False
-            is_cached = False
-        
-        # Create a summary entry for this chat
-        summary_entry = {
-            'chat_name': chat_name,
-            'message_text': message_text,
-            'timestamp': messages[0].get('timestamp', 0),  # Use the timestamp of the most recent message
-            'is_ai_summary': is_ai_summary,
-            'is_cached': is_cached
-        }
-        
-        logger.info(f"Created summary entry for {chat_name}: AI={is_ai_summary}, Cached={is_cached}")
-        summary_entries.append(summary_entry)
-    
-    # Sort all summary entries by timestamp (newest first)
-    summary_entries.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-    
-    # Return only the limited number of entries
-    return summary_entries[:limit]
-
 @app.route('/summary')
 @login_required
 def summary():
@@ -2518,13 +2191,8 @@ def summary():
         flash('Session expired. Please login again.', 'error')
         return redirect(url_for('login'))
     
-    # Get recent messages from Telegram
-    try:
-        raw_messages = asyncio.run(get_recent_telegram_messages(user_id, 30))  # Get more messages to group by chat
-        messages = asyncio.run(process_telegram_messages_for_summary(raw_messages, 10, user_id))
-    except Exception as e:
-        logger.error(f"Error getting recent messages for summary: {e}")
-        messages = []
+    # Summaries are precomputed by the forwarder's summary worker
+    messages = get_summary_entries(user_id, 10)
     
     # Render the summary template
     return render_template('summary.html', messages=messages)
@@ -2559,128 +2227,80 @@ def refresh_summary():
                 logger.error("No user found in database for fallback")
                 return jsonify({'success': False, 'error': 'No user found. Please login again.'})
         
-        logger.info(f"Getting recent Telegram messages for summary, user_id: {user_id}")
-        raw_messages = run_async(get_recent_telegram_messages(user_id, 30))
-        logger.info(f"Retrieved {len(raw_messages)} raw messages from Telegram")
-        
-        logger.info(f"Processing messages for summary display")
-        messages = run_async(process_telegram_messages_for_summary(raw_messages, 10, user_id))
-        logger.info(f"Processed {len(messages)} messages for summary display")
-        
-        # Log message details for debugging
-        for idx, msg in enumerate(messages):
-            logger.info(f"Summary message {idx+1}: {msg.get('chat_name')} - {msg.get('message_text', '')[:30]}...")
+        def compute():
+            # Summaries are precomputed by the forwarder's summary worker
+            messages = get_summary_entries(user_id, 10)
+            
+            logger.info(f"Returning {len(messages)} summary messages to client")
+            return {'success': True, 'messages': messages}
         
-        logger.info(f"Returning {len(messages)} summary messages to client")
-        return jsonify({'success': True, 'messages': messages})
+        return cached_json_response(user_id, 'refresh_summary', compute)
     except Exception as e:
         logger.error(f"Error refreshing summary data: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)})
 
-async def get_available_chats(user_id):
-    """Get non-archived chats for a user, sorted by most recent activity.
+# Chats per page on the chat selection page
+CHAT_SELECTION_PAGE_SIZE = 50
+
+async def refresh_dialog_snapshot(user_id):
+    """Refresh a user's dialog snapshot with a pooled client."""
+    client = await telegram_pool.acquire(user_id)
+    if client is None:
+        return 0
+    
+    try:
+        return await dialog_snapshots.refresh(client, user_id)
+    finally:
+        # Return the client to the pool
+        await telegram_pool.release(user_id, client)
+
+def parse_bool_filter(value):
+    """Parse a yes/no filter parameter ('1' or '0'; anything else means no filter)."""
+    return {'1': True, '0': False}.get(value)
+
+def get_available_chats(user_id, prefix='', muted=None, channel=None, page=1):
+    """Get one page of a user's non-archived chats from the dialog snapshot, most recently active first.
+    
+    The snapshot is refreshed in the background when it is stale; only a user
+    without any snapshot waits for the first refresh.
     
     Args:
         user_id: The user's Telegram ID
+        prefix: Only chats whose name starts with this
+        muted: Only muted (True) or unmuted (False) chats; None for both
+        channel: Only channels (True) or other chats (False); None for both
+        page: Page number, starting at 1
         
     Returns:
-        Dictionary of chats with chat_id as key and dict with name, muted status, and last_activity as value
+        Tuple of (dictionary of chats with chat_id as key, total number of matching chats)
     """
-    logger.info(f"Getting available chats for user {user_id}")
-    
-    # Create a unique session name for this request
-    session_id = f"telegram_session_{user_id}_{int(time.time())}"
-    
-    # Create client using a StringSession instead of SQLite
-    client = TelegramClient(StringSession(), API_ID, API_HASH)
-    
-    # Connect to Telegram
-    try:
-        await client.connect()
-        
-        # Check if authorized - if not, use the web_login_session
-        if not await client.is_user_authorized():
-            logger.info("Using web_login_session for authorization")
-            # Load the auth key from the web_login_session
-            web_session = TelegramClient(WEB_LOGIN_SESSION_PATH, API_ID, API_HASH)
-            await web_session.connect()
-            
-            if not await web_session.is_user_authorized():
-                logger.error("Not authorized. Please log in first.")
-                await web_session.disconnect()
-                await client.disconnect()
-                return {}
-            
-            # Export the session string
-            session_string = StringSession.save(web_session.session)
-            await web_session.disconnect()
-            
-            # Reconnect with the session string
-            await client.disconnect()
-            client = TelegramClient(StringSession(session_string), API_ID, API_HASH)
-            await client.connect()
-            
-            if not await client.is_user_authorized():
-                logger.error("Failed to transfer session. Please log in again.")
-                await client.disconnect()
-                return {}
-        
-        try:
-            # Get only unarchived dialogs with a larger limit to show more chats
-            dialogs = await client.get_dialogs(limit=100, archived=False)
-            
-            logger.info(f"Found {len(dialogs)} non-archived dialogs/chats")
-            
-            # Create a dictionary of chat information including mute status and last activity
-            chats_dict = {}
-            
-            for dialog in dialogs:
-                chat_id = dialog.entity.id
-                chat_name = get_display_name(dialog.entity)
-                is_muted = bool(dialog.dialog.notify_settings.mute_until)
-                last_activity = dialog.date.timestamp() if dialog.date else 0
-                
-                # Skip Telegram service chat (unless we want to include it)
-                if chat_id == 777000 and chat_name == "Telegram":
-                    continue
-                    
-                # Include all chat types, even one-way channels
-                # Add indicator for channel type
-                is_channel = dialog.is_channel and not dialog.is_group
-                
-                # Get the most recent message preview only for visible dialogs
-                preview_text = ""
-                try:
-                    if hasattr(dialog, 'message') and dialog.message and dialog.message.message:
-                        # Use the already loaded message to avoid additional API calls
-                        preview_text = dialog.message.message[:30] + "..." if len(dialog.message.message) > 30 else dialog.message.message
-                except Exception as e:
-                    logger.error(f"Error getting preview text for chat {chat_name}: {e}")
-                
-                chats_dict[chat_id] = {
-                    'name': chat_name,
-                    'is_muted': is_muted,
-                    'is_selected': str(chat_id) in config.MONITORED_CHATS or chat_id in config.MONITORED_CHATS,
-                    'last_activity': last_activity,
-                    'preview_text': preview_text,
-                    'is_channel': is_channel
-                }
-                
-                logger.info(f"Chat: {chat_name} (ID: {chat_id}), Muted: {is_muted}, Last activity: {last_activity}")
-            
-            logger.info(f"Returning {len(chats_dict)} chats")
-            return chats_dict
-            
-        except Exception as e:
-            logger.error(f"Error getting dialogs: {e}")
-            return {}
-            
-    except Exception as e:
-        logger.error(f"Error connecting to Telegram: {e}")
-        return {}
-    finally:
-        # Disconnect the client
-        await client.disconnect()
+    status = dialog_snapshots.get_status(user_id)
+    if dialog_snapshots.is_stale(status):
+        refresh = dialog_snapshots.schedule_refresh(user_id, refresh_dialog_snapshot, background_loop.submit)
+        if status is None:
+            try:
+                refresh.result(timeout=60)
+            except Exception as e:
+                logger.error(f"Error getting dialogs: {e}")
+                return {}, 0
+    
+    rows, total = dialog_snapshots.query(user_id, prefix=prefix, muted=muted, channel=channel, page=page,
+                                         per_page=CHAT_SELECTION_PAGE_SIZE)
+    
+    # Set lookups instead of scanning MONITORED_CHATS for every chat
+    monitored = {str(chat) for chat in config.MONITORED_CHATS}
+    
+    chats_dict = {}
+    for row in rows:
+        chats_dict[row['chat_id']] = {
+            'name': row['name'],
+            'is_muted': bool(row['is_muted']),
+            'is_selected': str(row['chat_id']) in monitored,
+            'last_activity': row['last_activity'],
+            'preview_text': row['preview_text'],
+            'is_channel': bool(row['is_channel'])
+        }
+    return chats_dict, total
 
 @app.route('/chat_selection', methods=['GET', 'POST'])
 @login_required
@@ -2692,17 +2312,22 @@ def chat_selection():
     if request.method == 'POST':
         # Handle form submission
         try:
-            # Get selected chats from form
-            selected_chats = []
-            for key in request.form:
-                if key.startswith('chat_'):
-                    chat_id = key.replace('chat_', '')
-                    # Try to convert to integer if possible
-                    try:
-                        chat_id = int(chat_id)
-                    except ValueError:
-                        pass
-                    selected_chats.append(chat_id)
+            # The form only lists one page of chats, so only those chats' selection changes
+            shown_chats = {chat_id for chat_id in request.form.get('shown_chats', '').split(',') if chat_id}
+            checked_chats = [key.replace('chat_', '') for key in request.form if key.startswith('chat_')]
+            
+            selected_chats = [chat for chat in config.MONITORED_CHATS if str(chat) not in shown_chats]
+            selected = {str(chat) for chat in selected_chats}
+            for chat_id in checked_chats:
+                if chat_id in selected:
+                    continue
+                selected.add(chat_id)
+                # Try to convert to integer if possible
+                try:
+                    chat_id = int(chat_id)
+                except ValueError:
+                    pass
+                selected_chats.append(chat_id)
             
             logger.info(f"Selected chats: {selected_chats}")
             
@@ -2723,26 +2348,24 @@ def chat_selection():
             importlib.reload(config)
             
             flash('Chat selection updated successfully', 'success')
-            return redirect(url_for('chat_selection'))
+            return redirect(url_for('chat_selection', **request.args))
         except Exception as e:
             logger.error(f"Error updating chat selection: {e}")
             flash(f'Error updating chat selection: {e}', 'error')
     
-    # Get available chats
-    available_chats = run_async(get_available_chats(user_id))
-    
-    # Sort chats by last activity (most recent first)
-    sorted_chats = {}
-    if available_chats:
-        # Convert to list of (chat_id, chat_info) tuples, sort by last_activity, and convert back to dict
-        sorted_chats_list = sorted(
-            available_chats.items(), 
-            key=lambda x: x[1]['last_activity'], 
-            reverse=True
-        )
-        sorted_chats = dict(sorted_chats_list)
+    # Get one page of the chats matching the filters
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'muted': request.args.get('muted', ''),
+        'channel': request.args.get('channel', '')
+    }
+    page = max(request.args.get('page', 1, type=int), 1)
+    available_chats, total = get_available_chats(user_id, prefix=filters['q'], muted=parse_bool_filter(filters['muted']),
+                                                 channel=parse_bool_filter(filters['channel']), page=page)
+    page_count = max((total + CHAT_SELECTION_PAGE_SIZE - 1) // CHAT_SELECTION_PAGE_SIZE, 1)
     
-    return render_template('chat_selection.html', available_chats=sorted_chats)
+    return render_template('chat_selection.html', available_chats=available_chats, total=total, page=page,
+                           page_count=page_count, filters=filters)
 
 if __name__ == '__main__':
     # Initialize the database directly before running the app